@@ -0,0 +1,104 @@
+"""Признаки сложности эталона, считаемые одним векторным проходом по нотам.
+
+Все признаки — по NoteIndex (ноты уже отсортированы по началу), без
+повторного разбора MIDI. Мелодическая линия — самая высокая нота каждого
+аккорда/двойной ноты; интервалы и смены позиций считаются по ней.
+"""
+import numpy as np
+
+from app.analysis.note_index import NoteIndex
+
+# увеличить при изменении формул — backfill пересчитает устаревшие файлы
+DIFFICULTY_FEATURES_VERSION = 1
+
+# ноты короче 1/8 при 120 bpm считаются «быстрыми»
+SHORT_NOTE_S = 0.125
+LARGE_LEAP_SEMITONES = 7
+# B5: предел первой позиции на струне E (четвёртый палец)
+FIRST_POSITION_MAX_PITCH = 83
+
+DIFFICULTY_FEATURES = (
+    "note_count",
+    "duration_s",
+    "notes_per_second",
+    "pitch_min",
+    "pitch_max",
+    "pitch_range",
+    "position_shifts",
+    "max_position",
+    "mean_abs_interval",
+    "large_leap_ratio",
+    "min_note_s",
+    "short_note_ratio",
+    "polyphony_ratio",
+    "tempo_bpm",
+    "difficulty",
+)
+
+# (признак, значение, при котором вклад в difficulty максимален, вес)
+_DIFFICULTY_SCALE = (
+    ("notes_per_second", 8.0, 0.25),
+    ("pitch_range", 36.0, 0.15),
+    ("position_shifts_per_minute", 30.0, 0.15),
+    ("mean_abs_interval", 7.0, 0.10),
+    ("large_leap_ratio", 0.3, 0.10),
+    ("short_note_ratio", 0.5, 0.15),
+    ("polyphony_ratio", 0.5, 0.10),
+)
+
+
+def _positions(pitches: np.ndarray) -> np.ndarray:
+    """Грубая оценка позиции левой руки: выше первой — по позиции на тон."""
+    above = np.maximum(pitches.astype(np.int32) - FIRST_POSITION_MAX_PITCH, 0)
+    return 1 + (above + 1) // 2
+
+
+def difficulty_features(index: NoteIndex, tempo_bpm: float | None = None) -> dict:
+    n = len(index)
+    if n == 0:
+        return {**dict.fromkeys(DIFFICULTY_FEATURES), "note_count": 0, "difficulty": 0.0}
+
+    starts, ends, pitches = index.starts, index.ends, index.pitches.astype(np.int32)
+    duration_s = float(ends.max() - starts.min())
+    note_lengths = ends - starts
+
+    # мелодия: последняя (самая высокая — ноты отсортированы по (start, pitch)) нота каждого начала
+    last_of_onset = np.append(starts[1:] != starts[:-1], True)
+    melody = pitches[last_of_onset]
+    intervals = np.abs(np.diff(melody))
+    positions = _positions(melody)
+    shifts = int(np.count_nonzero(np.diff(positions)))
+
+    # полифония: доля звучащего времени, когда одновременно звучат две ноты и больше
+    seg_len = np.diff(index.seg_bounds)
+    seg_count = np.diff(index.seg_offsets)[:seg_len.size]
+    sounding = seg_len[seg_count >= 1].sum()
+    polyphonic = seg_len[seg_count >= 2].sum()
+
+    minutes = max(duration_s, 1e-6) / 60.0
+    features = {
+        "note_count": n,
+        "duration_s": round(duration_s, 3),
+        "notes_per_second": round(n / max(duration_s, 1e-6), 3),
+        "pitch_min": int(pitches.min()),
+        "pitch_max": int(pitches.max()),
+        "pitch_range": int(pitches.max() - pitches.min()),
+        "position_shifts": shifts,
+        "max_position": int(positions.max()),
+        "mean_abs_interval": round(float(intervals.mean()), 3) if intervals.size else 0.0,
+        "large_leap_ratio": round(float(np.mean(intervals >= LARGE_LEAP_SEMITONES)), 4) if intervals.size else 0.0,
+        "min_note_s": round(float(note_lengths.min()), 4),
+        "short_note_ratio": round(float(np.mean(note_lengths < SHORT_NOTE_S)), 4),
+        "polyphony_ratio": round(float(polyphonic / sounding), 4) if sounding > 0 else 0.0,
+        "tempo_bpm": round(tempo_bpm, 2) if tempo_bpm else None,
+    }
+
+    scaled = {**features, "position_shifts_per_minute": shifts / minutes}
+    score = sum(weight * min(scaled[name] / full, 1.0) for name, full, weight in _DIFFICULTY_SCALE)
+    features["difficulty"] = round(100.0 * score, 2)
+    return features
+
+
+def features_from_parsed(parsed_json: dict) -> dict:
+    """Для backfill в отдельном процессе: parsed_json -> признаки."""
+    return difficulty_features(NoteIndex.from_parsed(parsed_json), parsed_json.get("tempo_bpm"))
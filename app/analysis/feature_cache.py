@@ -0,0 +1,200 @@
+"""Дисковый кэш артефактов анализа записей (.npy, читаются через mmap).
+
+Артефакт — каталог с набором массивов, ключ — (session_id, checksum
+записи, имя, algo_version):
+
+    cache/features/ab/cd/<session_id>/<name>-v<algo>-<checksum>/<array>.npy
+
+Запись идёт во временный каталог рядом и публикуется одним rename, поэтому
+читатели никогда не видят половину артефакта, а из двух одновременных
+писателей побеждает первый. mtime каталога служит часами LRU: при попадании
+он обновляется, а при превышении FEATURE_CACHE_MAX_BYTES самые старые
+артефакты удаляются. Открытые mmap переживают удаление файла.
+"""
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+from app.core.storage import FEATURE_CACHE_DIR, sharded_path
+
+logger = logging.getLogger(__name__)
+
+FEATURE_CACHE_MAX_BYTES = 5 * 1024 ** 3
+FEATURE_CACHE_SWEEP_INTERVAL_S = 60.0
+# недописанные временные каталоги упавших писателей
+STALE_TMP_AGE_S = 3600.0
+HASH_READ_SIZE = 1024 * 1024
+# контрольные суммы недавних записей: (путь, размер, mtime) -> sha256
+CHECKSUM_CACHE_SIZE = 1024
+
+_TMP_PREFIX = ".tmp-"
+
+_checksums: OrderedDict[tuple[str, int, int], str] = OrderedDict()
+# audio_checksum вызывается из потоков executor
+_checksums_lock = threading.Lock()
+_sweep_lock = threading.Lock()
+_last_sweep = 0.0
+
+
+def audio_checksum(path: Path) -> str:
+    """SHA-256 записи; пересчитывается только при смене размера или mtime."""
+    st = path.stat()
+    key = (str(path.resolve()), st.st_size, st.st_mtime_ns)
+    with _checksums_lock:
+        checksum = _checksums.get(key)
+        if checksum is not None:
+            _checksums.move_to_end(key)
+            return checksum
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(HASH_READ_SIZE):
+            digest.update(block)
+    checksum = digest.hexdigest()
+    with _checksums_lock:
+        _checksums[key] = checksum
+        while len(_checksums) > CHECKSUM_CACHE_SIZE:
+            _checksums.popitem(last=False)
+    return checksum
+
+
+def artifact_dir(session_id: str, checksum: str, name: str, algo_version: int) -> Path:
+    return sharded_path(FEATURE_CACHE_DIR, session_id, "") / f"{name}-v{algo_version}-{checksum[:32]}"
+
+
+def load_features(
+    session_id: str, checksum: str, name: str, algo_version: int, fields: tuple[str, ...]
+) -> dict[str, np.ndarray] | None:
+    """Массивы fields артефакта (mmap) или None, если его нет целиком."""
+    path = artifact_dir(session_id, checksum, name, algo_version)
+    try:
+        arrays = {field: np.load(path / f"{field}.npy", mmap_mode="r") for field in fields}
+        os.utime(path)
+    except FileNotFoundError:
+        # нет артефакта или его удаляют прямо сейчас — считаем промахом
+        return None
+    return arrays
+
+
+def _make_tmp(path: Path) -> Path:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return Path(tempfile.mkdtemp(prefix=_TMP_PREFIX, dir=path.parent))
+
+
+def _publish(tmp: Path, path: Path) -> None:
+    try:
+        os.rename(tmp, path)
+    except OSError:
+        # артефакт уже опубликовал параллельный писатель — он идентичен
+        shutil.rmtree(tmp, ignore_errors=True)
+        if not path.is_dir():
+            raise
+    maybe_sweep()
+
+
+class FeatureWriter:
+    """Потоковая запись артефакта с массивами известной длины.
+
+    Массивы создаются сразу нужного размера (open_memmap) и заполняются
+    пачками, поэтому память не зависит от длины записи. Артефакт
+    публикуется, только если записано ровно length строк.
+    """
+
+    def __init__(
+        self, session_id: str, checksum: str, name: str, algo_version: int,
+        dtypes: dict[str, np.dtype], length: int,
+    ):
+        self.path = artifact_dir(session_id, checksum, name, algo_version)
+        self.length = length
+        self.count = 0
+        self._tmp = _make_tmp(self.path)
+        try:
+            self._arrays = {
+                key: np.lib.format.open_memmap(self._tmp / f"{key}.npy", mode="w+", dtype=dtype, shape=(length,))
+                for key, dtype in dtypes.items()
+            }
+        except BaseException:
+            shutil.rmtree(self._tmp, ignore_errors=True)
+            raise
+
+    def append(self, columns: dict[str, np.ndarray]) -> None:
+        n = len(next(iter(columns.values())))
+        end = self.count + n
+        if end > self.length:
+            raise ValueError(f"{self.path.name}: more than {self.length} rows written")
+        for key, array in self._arrays.items():
+            array[self.count:end] = columns[key]
+        self.count = end
+
+    def publish(self) -> bool:
+        if self.count != self.length:
+            logger.warning("%s: %s of %s rows written, not cached", self.path.name, self.count, self.length)
+            self.abort()
+            return False
+        for array in self._arrays.values():
+            array.flush()
+        self._arrays.clear()
+        _publish(self._tmp, self.path)
+        return True
+
+    def abort(self) -> None:
+        self._arrays.clear()
+        shutil.rmtree(self._tmp, ignore_errors=True)
+
+
+def _artifacts() -> list[tuple[float, int, Path]]:
+    """(mtime, размер, путь) всех артефактов; заодно чистит зависшие tmp."""
+    now = time.time()
+    found = []
+    for session_dir in FEATURE_CACHE_DIR.glob("*/*/*"):
+        try:
+            entries = list(os.scandir(session_dir))
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            if not entry.is_dir():
+                continue
+            try:
+                mtime = entry.stat().st_mtime
+                if entry.name.startswith(_TMP_PREFIX):
+                    if now - mtime > STALE_TMP_AGE_S:
+                        shutil.rmtree(entry.path, ignore_errors=True)
+                    continue
+                size = sum(f.stat().st_size for f in os.scandir(entry.path))
+            except FileNotFoundError:
+                continue
+            found.append((mtime, size, Path(entry.path)))
+    return found
+
+
+def evict_features(max_bytes: int = FEATURE_CACHE_MAX_BYTES) -> int:
+    """Удаляет давно не использованные артефакты до max_bytes; возвращает освобождённые байты."""
+    artifacts = sorted(_artifacts())
+    total = sum(size for _, size, _ in artifacts)
+    freed = 0
+    for _, size, path in artifacts:
+        if total - freed <= max_bytes:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        freed += size
+    return freed
+
+
+def maybe_sweep() -> None:
+    global _last_sweep
+    now = time.monotonic()
+    if now - _last_sweep < FEATURE_CACHE_SWEEP_INTERVAL_S or not _sweep_lock.acquire(blocking=False):
+        return
+    try:
+        _last_sweep = now
+        evict_features()
+    finally:
+        _sweep_lock.release()
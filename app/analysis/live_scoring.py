@@ -0,0 +1,200 @@
+"""Потоковая оценка исполнения по скользящим окнам -> строки LiveSessionMetric.
+
+StreamingScorer принимает пачки PitchFrames одной сессии и сравнивает их с
+эталоном (NoteIndex варианта сессии). Поиск ожидаемых нот и ошибок в центах
+делается векторно по пачке, а состояние каждой метрики — кольцевой буфер
+последних значений за её window_ms с текущими суммами: добавление и
+вытеснение кадра — O(1). Каждые emit_every_ms (MetricConfig) выдаётся по
+строке на включённую метрику:
+
+* intonation_cents — средняя |ошибка| в центах по звучащим кадрам,
+  score — доля кадров в пределах tolerance_cents;
+* rhythm_ms — среднее отклонение начал нот от ближайшего начала в эталоне
+  (не больше MAX_RHYTHM_MS), score — доля начал в пределах tolerance_ms;
+* note_accuracy — доля кадров, где сыграна ожидаемая нота (±50 центов);
+  лишние ноты в паузах эталона и пропуски считаются промахами.
+
+offset_ms и window_ms строки — фактически покрытый окном интервал
+[offset_ms, offset_ms + window_ms), в начале записи окно короче заданного.
+"""
+import math
+
+import numpy as np
+
+from app.analysis.metric_config import MetricConfig
+from app.analysis.note_index import NoteIndex
+from app.analysis.pitch import PitchFrames
+
+# увеличить при изменении формул: строки прошлых версий остаются в БД рядом
+SCORING_ALGO_VERSION = 2
+
+METRIC_INTONATION = "intonation_cents"
+METRIC_RHYTHM = "rhythm_ms"
+METRIC_NOTE_ACCURACY = "note_accuracy"
+SCORING_METRICS = (METRIC_INTONATION, METRIC_RHYTHM, METRIC_NOTE_ACCURACY)
+
+# шаг кадров трекера высоты (pitch.PitchTracker: 10 мс) — для размера буферов
+FRAME_PERIOD_MS = 10
+# попадание в ноту — ближе полутона к ожидаемой
+NOTE_HIT_CENTS = 50.0
+# ошибка больше тритона — уже не интонация, а другая нота
+MAX_CENTS_ERROR = 600.0
+# начало дальше секунды от эталонного — уже не ритм, а пропуск или лишняя нота;
+# заодно держит rhythm_ms в пределах Numeric(8, 4) колонки value
+MAX_RHYTHM_MS = 1000.0
+
+
+class _RingWindow:
+    """Значения за последние window_s секунд с текущей суммой и числом «хороших».
+
+    Буфер фиксированной ёмкости; если кадры идут чаще расчётного, вытесняется
+    самое старое значение, даже если оно ещё в окне.
+    """
+
+    __slots__ = ("window_s", "_capacity", "_times", "_values", "_good", "_head", "count", "total", "good")
+
+    def __init__(self, window_ms: int, period_ms: int = FRAME_PERIOD_MS):
+        self.window_s = window_ms / 1000.0
+        self._capacity = math.ceil(window_ms / period_ms) + 1
+        self._times = [0.0] * self._capacity
+        self._values = [0.0] * self._capacity
+        self._good = [False] * self._capacity
+        self._head = 0
+        self.count = 0
+        self.total = 0.0
+        self.good = 0
+
+    def _pop(self) -> None:
+        head = self._head
+        self.total -= self._values[head]
+        self.good -= self._good[head]
+        self._head = (head + 1) % self._capacity
+        self.count -= 1
+        if not self.count:
+            # сбрасываем накопленную ошибку округления сумм
+            self.total = 0.0
+
+    def push(self, t: float, value: float, good: bool) -> None:
+        if self.count == self._capacity:
+            self._pop()
+        tail = (self._head + self.count) % self._capacity
+        self._times[tail] = t
+        self._values[tail] = value
+        self._good[tail] = good
+        self.count += 1
+        self.total += value
+        self.good += good
+
+    def expire(self, now: float) -> None:
+        start = now - self.window_s
+        while self.count and self._times[self._head] < start:
+            self._pop()
+
+
+def _midi_to_hz(pitches: np.ndarray) -> np.ndarray:
+    return 440.0 * np.exp2((pitches.astype(np.float64) - 69.0) / 12.0)
+
+
+class StreamingScorer:
+    """Скользящая оценка одной сессии; состояние — несколько кольцевых буферов."""
+
+    def __init__(self, session_id: str, index: NoteIndex, config: MetricConfig):
+        self.session_id = session_id
+        self.index = index
+        self.config = config
+        self.emit_every_s = config.emit_every_ms / 1000.0
+        # граница выдачи — номер шага, а не накопленная сумма: без дрейфа на длинных записях
+        self._emit_step = 1
+        self._next_emit = self.emit_every_s
+        self._last_t: float | None = None
+        self._emitted_t = 0.0
+
+        # буфер и window_ms по каждой включённой метрике
+        self._windows: dict[str, tuple[_RingWindow, int]] = {}
+        for code, metric in (
+            (METRIC_INTONATION, config.intonation),
+            (METRIC_RHYTHM, config.rhythm),
+            (METRIC_NOTE_ACCURACY, config.note_accuracy),
+        ):
+            if metric.enabled:
+                self._windows[code] = (_RingWindow(metric.window_ms), metric.window_ms)
+
+    def _frame_values(self, frames: PitchFrames) -> tuple[np.ndarray, ...]:
+        """Векторно по пачке: вклад каждого кадра в каждую метрику (NaN — кадр не учитывается)."""
+        times = frames.time_s
+        expected = self.index.expected_pitch(times)
+        voiced = frames.f0_hz > 0
+        sounding = expected >= 0
+
+        both = voiced & sounding
+        cents = np.full(times.size, np.nan)
+        cents[both] = np.abs(1200.0 * np.log2(frames.f0_hz[both] / _midi_to_hz(expected[both])))
+        np.minimum(cents, MAX_CENTS_ERROR, out=cents)
+
+        # точность нот: кадр учитывается, если в эталоне нота или исполнитель звучит
+        accuracy = np.where(voiced | sounding, 0.0, np.nan)
+        accuracy[both & (cents <= NOTE_HIT_CENTS)] = 1.0
+
+        # ритм: отклонение начала от ближайшего начала ноты эталона
+        rhythm = np.full(times.size, np.nan)
+        starts = self.index.starts
+        if starts.size and frames.onset.any():
+            onset_t = times[frames.onset]
+            right = np.searchsorted(starts, onset_t)
+            before = np.abs(onset_t - starts[np.maximum(right - 1, 0)])
+            after = np.abs(starts[np.minimum(right, starts.size - 1)] - onset_t)
+            rhythm[frames.onset] = np.minimum(np.minimum(before, after) * 1000.0, MAX_RHYTHM_MS)
+        return times, cents, rhythm, accuracy
+
+    def _rows(self, t: float) -> list[dict]:
+        rows = []
+        emit_ms = int(round(t * 1000))
+        for code, (ring, window_ms) in self._windows.items():
+            ring.expire(t)
+            if not ring.count:
+                continue
+            offset_ms = max(emit_ms - window_ms, 0)
+            rows.append({
+                "session_id": self.session_id,
+                "offset_ms": offset_ms,
+                "window_ms": emit_ms - offset_ms,
+                "algo_version": SCORING_ALGO_VERSION,
+                "matric_code": code,
+                "value": round(ring.total / ring.count, 4),
+                "score": round(100.0 * ring.good / ring.count, 2),
+            })
+        self._emitted_t = t
+        return rows
+
+    def push(self, frames: PitchFrames) -> list[dict]:
+        if frames.time_s.size == 0:
+            return []
+        times, cents, rhythm, accuracy = self._frame_values(frames)
+        tolerance_cents = self.config.intonation.tolerance_cents
+        tolerance_ms = self.config.rhythm.tolerance_ms
+
+        intonation = self._windows.get(METRIC_INTONATION, (None,))[0]
+        rhythm_ring = self._windows.get(METRIC_RHYTHM, (None,))[0]
+        accuracy_ring = self._windows.get(METRIC_NOTE_ACCURACY, (None,))[0]
+
+        rows: list[dict] = []
+        for t, c, r, a in zip(times.tolist(), cents.tolist(), rhythm.tolist(), accuracy.tolist()):
+            while t >= self._next_emit:
+                rows += self._rows(self._next_emit)
+                self._emit_step += 1
+                self._next_emit = self._emit_step * self.emit_every_s
+            # NaN != NaN: кадр без вклада в метрику пропускаем
+            if intonation is not None and c == c:
+                intonation.push(t, c, c <= tolerance_cents)
+            if rhythm_ring is not None and r == r:
+                rhythm_ring.push(t, r, r <= tolerance_ms)
+            if accuracy_ring is not None and a == a:
+                accuracy_ring.push(t, a, a > 0)
+        self._last_t = times[-1].item()
+        return rows
+
+    def flush(self) -> list[dict]:
+        """Строки по хвосту записи после последней границы выдачи."""
+        if self._last_t is None or self._last_t <= self._emitted_t:
+            return []
+        return self._rows(self._last_t)
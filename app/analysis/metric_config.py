@@ -0,0 +1,164 @@
+"""Итоговая конфигурация метрик сессии: умолчания < настройки пользователя < настройки сессии."""
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.models import PracticeSession, UserMetricPref
+
+logger = logging.getLogger(__name__)
+
+
+class _Frozen(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="forbid")
+
+
+class IntonationConfig(_Frozen):
+    enabled: bool = True
+    window_ms: int = Field(default=500, ge=50, le=10000)
+    tolerance_cents: float = Field(default=15.0, gt=0, le=100)
+    weight: float = Field(default=1.0, ge=0)
+
+
+class RhythmConfig(_Frozen):
+    enabled: bool = True
+    window_ms: int = Field(default=1000, ge=50, le=10000)
+    tolerance_ms: float = Field(default=60.0, gt=0, le=1000)
+    weight: float = Field(default=1.0, ge=0)
+
+
+class NoteAccuracyConfig(_Frozen):
+    enabled: bool = True
+    window_ms: int = Field(default=1000, ge=50, le=10000)
+    weight: float = Field(default=1.0, ge=0)
+
+
+class MetricConfig(_Frozen):
+    intonation: IntonationConfig = IntonationConfig()
+    rhythm: RhythmConfig = RhythmConfig()
+    note_accuracy: NoteAccuracyConfig = NoteAccuracyConfig()
+    emit_every_ms: int = Field(default=250, ge=50, le=10000)
+
+
+def _deep_merge(base: dict, override: dict) -> dict:
+    merged = dict(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _deep_merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def resolve_metric_config(user_pref: dict | None, session_pref: dict | None) -> MetricConfig:
+    """Сливает JSONB-настройки и валидирует результат; ValidationError при ошибке."""
+    return MetricConfig.model_validate(_deep_merge(user_pref or {}, session_pref or {}))
+
+
+def resolve_stored_metric_config(user_pref: dict | None, session_pref: dict | None, owner: str) -> MetricConfig:
+    """Как resolve_metric_config, но для уже сохранённых JSONB: никогда не бросает.
+
+    Настройки, записанные до появления схемы (или до её ужесточения), могут не
+    проходить валидацию. Тогда отбрасываем невалидный слой, в крайнем случае
+    берём умолчания сервера, и пишем предупреждение.
+    """
+    layers = ((user_pref, session_pref), (None, session_pref), (user_pref, None), (None, None))
+    for user_layer, session_layer in layers:
+        try:
+            config = resolve_metric_config(user_layer, session_layer)
+        except ValidationError as e:
+            error = e
+            continue
+        dropped = [
+            name for name, stored, used in (("user", user_pref, user_layer), ("session", session_pref, session_layer))
+            if stored is not used
+        ]
+        if dropped:
+            logger.warning(
+                "stored metric preferences of %s do not validate, ignoring %s layer: %s",
+                owner, " and ".join(dropped), error.errors(include_url=False, include_context=False),
+            )
+        return config
+    raise AssertionError("server defaults must validate")
+
+
+METRIC_CONFIG_CACHE_SIZE = 4096
+
+# session_id -> (user_id, штамп версий, конфиг), LRU. Штамп меняется при любом
+# изменении любого из двух JSONB, поэтому устаревшая запись не будет выдана;
+# сброс по сессии или пользователю только освобождает место.
+_Stamp = tuple[int, datetime | None]
+_METRIC_CONFIG_CACHE: OrderedDict[str, tuple[str, _Stamp, MetricConfig]] = OrderedDict()
+# user_id -> его сессии в кэше, чтобы сброс по пользователю не обходил весь кэш
+_SESSIONS_BY_USER: dict[str, set[str]] = {}
+# конфиг читается и из обработчиков, и из задач анализа в других потоках
+_metric_config_lock = threading.Lock()
+
+
+def _forget(session_id: str) -> None:
+    entry = _METRIC_CONFIG_CACHE.pop(session_id, None)
+    if entry is None:
+        return
+    sessions = _SESSIONS_BY_USER.get(entry[0])
+    if sessions is not None:
+        sessions.discard(session_id)
+        if not sessions:
+            del _SESSIONS_BY_USER[entry[0]]
+
+
+def _cached(session_id: str, stamp: _Stamp) -> MetricConfig | None:
+    with _metric_config_lock:
+        entry = _METRIC_CONFIG_CACHE.get(session_id)
+        if entry is None or entry[1] != stamp:
+            return None
+        _METRIC_CONFIG_CACHE.move_to_end(session_id)
+        return entry[2]
+
+
+def _remember(session_id: str, user_id: str, stamp: _Stamp, config: MetricConfig) -> None:
+    with _metric_config_lock:
+        _forget(session_id)
+        _METRIC_CONFIG_CACHE[session_id] = (user_id, stamp, config)
+        _SESSIONS_BY_USER.setdefault(user_id, set()).add(session_id)
+        while len(_METRIC_CONFIG_CACHE) > METRIC_CONFIG_CACHE_SIZE:
+            _forget(next(iter(_METRIC_CONFIG_CACHE)))
+
+
+def invalidate_session_metric_config(session_id: str) -> None:
+    with _metric_config_lock:
+        _forget(session_id)
+
+
+def invalidate_user_metric_config(user_id: str) -> None:
+    with _metric_config_lock:
+        for session_id in list(_SESSIONS_BY_USER.get(user_id, ())):
+            _forget(session_id)
+
+
+async def load_metric_config(session: AsyncSession, session_id: str) -> MetricConfig | None:
+    """Конфиг сессии из кэша, если версии обоих JSONB не менялись, иначе — из БД."""
+    stamp_row = (await session.execute(
+        select(PracticeSession.user_id, PracticeSession.version, UserMetricPref.updated_at)
+        .outerjoin(UserMetricPref, UserMetricPref.user_id == PracticeSession.user_id)
+        .where(PracticeSession.session_id == session_id)
+    )).one_or_none()
+    if stamp_row is None:
+        return None
+
+    stamp: _Stamp = (stamp_row.version, stamp_row.updated_at)
+    cached = _cached(session_id, stamp)
+    if cached is not None:
+        return cached
+
+    prefs = (await session.execute(
+        select(PracticeSession.metric_pref, UserMetricPref.metric_pref.label("user_pref"))
+        .outerjoin(UserMetricPref, UserMetricPref.user_id == PracticeSession.user_id)
+        .where(PracticeSession.session_id == session_id)
+    )).one()
+    config = resolve_stored_metric_config(prefs.user_pref, prefs.metric_pref, f"session {session_id}")
+    _remember(session_id, stamp_row.user_id, stamp, config)
+    return config
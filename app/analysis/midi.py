@@ -0,0 +1,116 @@
+"""Разбор эталонных MIDI в формат parsed_json."""
+from pathlib import Path
+
+# pretty_midi тянет за собой numpy и mido, поэтому импортируется только при
+# первом разборе, а не при импорте приложения или запуске alembic.
+
+
+def note_name_to_pitch(name: str) -> int:
+    import pretty_midi
+
+    return pretty_midi.note_name_to_number(name)
+
+
+# pretty_midi: программы с нуля, 40 — Violin
+VIOLIN_PROGRAM = 40
+# G3 — нижняя открытая струна скрипки
+VIOLIN_LOWEST_PITCH = 55
+
+
+def _part_info(index: int, inst) -> dict:
+    pitches = [n.pitch for n in inst.notes]
+    return {
+        "index": index,
+        "name": inst.name.strip(),
+        # после чтения файла program — numpy-целое, а parsed_json уходит в JSON
+        "program": int(inst.program),
+        "is_drum": bool(inst.is_drum),
+        "note_count": len(pitches),
+        "pitch_min": min(pitches) if pitches else None,
+        "pitch_max": max(pitches) if pitches else None,
+    }
+
+
+def detect_violin_part(parts: list[dict]) -> int | None:
+    """Индекс партии скрипки: программа 40, затем партии в диапазоне от G3.
+
+    Среди равных выбирается партия с наибольшим числом нот. Если ни одна
+    партия не укладывается в диапазон скрипки — та, где больше всего нот от G3.
+    """
+    candidates = [p for p in parts if not p["is_drum"] and p["note_count"]]
+    if not candidates:
+        return None
+
+    def playable(p: dict) -> bool:
+        return p["pitch_min"] >= VIOLIN_LOWEST_PITCH
+
+    violins = [p for p in candidates if p["program"] == VIOLIN_PROGRAM]
+    if violins:
+        return max(violins, key=lambda p: (playable(p), p["note_count"]))["index"]
+    in_range = [p for p in candidates if playable(p)]
+    if in_range:
+        return max(in_range, key=lambda p: p["note_count"])["index"]
+    return max(candidates, key=lambda p: p["high_note_count"])["index"]
+
+
+def _load(path: Path):
+    import pretty_midi
+
+    mid = pretty_midi.PrettyMIDI(str(path))
+    parts = []
+    for index, inst in enumerate(mid.instruments):
+        info = _part_info(index, inst)
+        info["high_note_count"] = sum(n.pitch >= VIOLIN_LOWEST_PITCH for n in inst.notes)
+        parts.append(info)
+    return mid, parts
+
+
+def _notes(inst) -> list[dict]:
+    import pretty_midi
+
+    return [
+        {"start": n.start, "end": n.end,
+         "note": pretty_midi.note_number_to_name(n.pitch), "pitch": n.pitch}
+        for n in sorted(inst.notes, key=lambda n: (n.start, n.pitch))
+    ]
+
+
+def parse_midi(path: Path, part: int | None = None) -> dict:
+    """Парсит партию MIDI в список нот "Начало Конец Нота", отсортированный по началу.
+
+    В notes попадает только оцениваемая партия: part или, если не задана,
+    найденная detect_violin_part. Список всех партий (без нот) — в parts;
+    ноты остальных партий читаются из файла по запросу (parse_midi_part).
+    ValueError, если оценивать нечего: нет подходящей партии, а заданная
+    пуста или ударная.
+    """
+    mid, parts = _load(path)
+    if part is None:
+        part = detect_violin_part(parts)
+        if part is None:
+            raise ValueError("MIDI file has no pitched part with notes")
+    elif not 0 <= part < len(parts):
+        raise ValueError(f"MIDI file has no part {part}")
+    elif parts[part]["is_drum"] or not parts[part]["note_count"]:
+        raise ValueError(f"MIDI part {part} has no pitched notes")
+
+    _, tempi = mid.get_tempo_changes()
+    for info in parts:
+        del info["high_note_count"]
+    return {
+        "notes": _notes(mid.instruments[part]),
+        # начальный темп из файла; None, если в MIDI нет ни одного set_tempo
+        "tempo_bpm": float(tempi[0]) if len(tempi) else None,
+        "part": part,
+        "parts": parts,
+    }
+
+
+def parse_midi_part(path: Path, part: int) -> dict:
+    """Ноты одной партии файла, в том же формате, что notes в parse_midi."""
+    import pretty_midi
+
+    mid = pretty_midi.PrettyMIDI(str(path))
+    if not 0 <= part < len(mid.instruments):
+        raise ValueError(f"MIDI file has no part {part}")
+    return {**_part_info(part, mid.instruments[part]), "notes": _notes(mid.instruments[part])}
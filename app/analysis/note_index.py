@@ -0,0 +1,194 @@
+"""Индекс нот эталона по времени для быстрых запросов "какая нота звучит в t"."""
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import numpy as np
+
+from app.analysis.midi import note_name_to_pitch
+
+NOTE_INDEX_CACHE_SIZE = 256
+
+
+@dataclass(frozen=True, slots=True)
+class NoteIndex:
+    """Ноты в колоночном виде, отсортированные по началу.
+
+    Для перекрывающихся нот ось времени разбита на элементарные отрезки
+    между соседними границами нот; для каждого отрезка хранится список
+    звучащих нот в CSR-виде (seg_offsets + seg_notes). Любой запрос — это
+    один searchsorted по границам, независимо от длины произведения.
+    """
+    starts: np.ndarray       # float64, по возрастанию
+    ends: np.ndarray         # float64
+    pitches: np.ndarray      # int16, номер MIDI
+    seg_bounds: np.ndarray   # float64, границы элементарных отрезков
+    seg_offsets: np.ndarray  # int64, len(seg_bounds) + 1
+    seg_notes: np.ndarray    # int32, индексы нот
+
+    @classmethod
+    def from_parsed(cls, parsed_json: dict) -> "NoteIndex":
+        notes = parsed_json.get("notes", [])
+        starts = np.fromiter((n["start"] for n in notes), dtype=np.float64, count=len(notes))
+        ends = np.fromiter((n["end"] for n in notes), dtype=np.float64, count=len(notes))
+        pitches = np.fromiter(
+            (n["pitch"] if "pitch" in n else note_name_to_pitch(n["note"]) for n in notes),
+            dtype=np.int16,
+            count=len(notes),
+        )
+        return cls.from_arrays(starts, ends, pitches)
+
+    @classmethod
+    def from_arrays(cls, starts: np.ndarray, ends: np.ndarray, pitches: np.ndarray) -> "NoteIndex":
+        order = np.lexsort((pitches, starts))
+        starts, ends, pitches = starts[order], ends[order], pitches[order]
+
+        seg_bounds = np.unique(np.concatenate((starts, ends)))
+        # нота i звучит на отрезках [first_seg[i], last_seg[i])
+        first_seg = np.searchsorted(seg_bounds, starts, side="left")
+        last_seg = np.searchsorted(seg_bounds, ends, side="left")
+        spans = np.maximum(last_seg - first_seg, 0)
+
+        note_ids = np.repeat(np.arange(starts.size, dtype=np.int32), spans)
+        seg_ids = np.repeat(first_seg, spans) + (
+            np.arange(note_ids.size) - np.repeat(np.cumsum(spans) - spans, spans)
+        )
+        order = np.argsort(seg_ids, kind="stable")
+        seg_ids, note_ids = seg_ids[order], note_ids[order]
+        seg_offsets = np.zeros(seg_bounds.size + 1, dtype=np.int64)
+        np.cumsum(np.bincount(seg_ids, minlength=seg_bounds.size), out=seg_offsets[1:])
+
+        return cls(
+            starts=starts,
+            ends=ends,
+            pitches=pitches.astype(np.int16),
+            seg_bounds=seg_bounds,
+            seg_offsets=seg_offsets,
+            seg_notes=note_ids,
+        )
+
+    def variant(self, tempo_factor: float = 1.0, transpose: int = 0) -> "NoteIndex":
+        """Вариант для занятий в другом темпе и/или тональности.
+
+        Растяжение времени не меняет порядок нот и состав отрезков, поэтому
+        seg_offsets и seg_notes переиспользуются как есть, а время и высоты
+        пересчитываются одним векторным проходом — без сортировки и разбора MIDI.
+        """
+        scale = 1.0 / tempo_factor
+        return NoteIndex(
+            starts=self.starts * scale,
+            ends=self.ends * scale,
+            pitches=np.clip(self.pitches + transpose, 0, 127).astype(np.int16),
+            seg_bounds=self.seg_bounds * scale,
+            seg_offsets=self.seg_offsets,
+            seg_notes=self.seg_notes,
+        )
+
+    def __len__(self) -> int:
+        return int(self.starts.size)
+
+    def sounding_at(self, times: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Ноты, звучащие в каждый из моментов times.
+
+        Возвращает CSR-пару (offsets, notes): ноты для times[k] —
+        notes[offsets[k]:offsets[k + 1]].
+        """
+        times = np.asarray(times, dtype=np.float64)
+        if not self.seg_bounds.size:
+            # пустой эталон: seg_offsets = [0], отрезков нет — везде пауза
+            return np.zeros(times.size + 1, dtype=np.int64), self.seg_notes[:0]
+        seg = np.searchsorted(self.seg_bounds, times, side="right") - 1
+        # до первой и после последней границы отрезков нот нет
+        valid = seg >= 0
+        seg = np.where(valid, seg, 0)
+        lo = np.where(valid, self.seg_offsets[seg], 0)
+        hi = np.where(valid, self.seg_offsets[seg + 1], 0)
+        counts = hi - lo
+
+        offsets = np.zeros(times.size + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        gather = np.repeat(lo - offsets[:-1], counts) + np.arange(offsets[-1])
+        return offsets, self.seg_notes[gather]
+
+    def expected_pitch(self, times: np.ndarray) -> np.ndarray:
+        """Самая высокая звучащая нота в каждый момент, -1 если пауза."""
+        offsets, notes = self.sounding_at(times)
+        result = np.full(offsets.size - 1, -1, dtype=np.int16)
+        has_note = offsets[1:] > offsets[:-1]
+        if notes.size:
+            top = np.maximum.reduceat(self.pitches[notes], offsets[:-1][has_note])
+            result[has_note] = top
+        return result
+
+    def next_note(self, times: np.ndarray) -> np.ndarray:
+        """Индекс первой ноты, начинающейся не раньше t; len(self), если таких нет."""
+        return np.searchsorted(self.starts, np.asarray(times, dtype=np.float64), side="left")
+
+    def upcoming(self, t: float, horizon_s: float | None = None, limit: int | None = None) -> slice:
+        """Срез нот, начинающихся в [t, t + horizon_s), не больше limit штук."""
+        lo = int(np.searchsorted(self.starts, t, side="left"))
+        hi = len(self) if horizon_s is None else int(np.searchsorted(self.starts, t + horizon_s, side="left"))
+        if limit is not None:
+            hi = min(hi, lo + limit)
+        return slice(lo, hi)
+
+
+_NOTE_INDEX_CACHE: OrderedDict[tuple[str, int], NoteIndex] = OrderedDict()
+# кэши читаются и из event loop, и из потоков executor; индекс строится вне лока
+_cache_lock = threading.Lock()
+
+
+def cache_note_index(midi_file_id: str, version: int, index: NoteIndex) -> None:
+    with _cache_lock:
+        _NOTE_INDEX_CACHE[(midi_file_id, version)] = index
+        _NOTE_INDEX_CACHE.move_to_end((midi_file_id, version))
+        while len(_NOTE_INDEX_CACHE) > NOTE_INDEX_CACHE_SIZE:
+            _NOTE_INDEX_CACHE.popitem(last=False)
+
+
+def lookup_note_index(midi_file_id: str, version: int) -> NoteIndex | None:
+    with _cache_lock:
+        index = _NOTE_INDEX_CACHE.get((midi_file_id, version))
+        if index is not None:
+            _NOTE_INDEX_CACHE.move_to_end((midi_file_id, version))
+    return index
+
+
+def get_note_index(midi_file_id: str, version: int, parsed_json: dict) -> NoteIndex:
+    """Индекс из кэша процесса, строится не более одного раза на версию файла."""
+    index = lookup_note_index(midi_file_id, version)
+    if index is None:
+        index = NoteIndex.from_parsed(parsed_json)
+        cache_note_index(midi_file_id, version, index)
+    return index
+
+
+_VariantKey = tuple[str, int, float, int]
+_VARIANT_CACHE: OrderedDict[_VariantKey, NoteIndex] = OrderedDict()
+
+
+def get_variant_index(
+    midi_file_id: str,
+    version: int,
+    base: NoteIndex,
+    tempo_factor: float = 1.0,
+    transpose: int = 0,
+) -> NoteIndex:
+    """Вариант эталона из кэша по (midi_file_id, version, tempo_factor, transpose)."""
+    tempo_factor = round(tempo_factor, 2)
+    if tempo_factor == 1.0 and transpose == 0:
+        return base
+
+    key = (midi_file_id, version, tempo_factor, transpose)
+    with _cache_lock:
+        index = _VARIANT_CACHE.get(key)
+        if index is not None:
+            _VARIANT_CACHE.move_to_end(key)
+            return index
+
+    index = base.variant(tempo_factor, transpose)
+    with _cache_lock:
+        _VARIANT_CACHE[key] = index
+        while len(_VARIANT_CACHE) > NOTE_INDEX_CACHE_SIZE:
+            _VARIANT_CACHE.popitem(last=False)
+    return index
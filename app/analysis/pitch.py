@@ -0,0 +1,190 @@
+"""Потоковое определение основной частоты (YIN) по записи сессии."""
+import wave
+from collections.abc import Iterator
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+FMIN_HZ = 180.0   # чуть ниже G3 (196 Гц) — нижней открытой струны скрипки
+FMAX_HZ = 3520.0  # A7
+YIN_THRESHOLD = 0.15
+FRAMES_PER_BATCH = 1024
+ONSET_DB_RISE = 6.0
+ONSET_CENTS_JUMP = 50.0
+SILENCE_DB = -50.0
+
+
+@dataclass(frozen=True, slots=True)
+class PitchFrames:
+    """Пачка результатов: по одному значению на кадр."""
+    time_s: np.ndarray      # центр кадра, секунды
+    f0_hz: np.ndarray       # 0.0 для невокализованных кадров
+    confidence: np.ndarray  # 1 - d'(tau), 0..1
+    onset: np.ndarray       # bool
+
+
+def _pcm_to_float(raw: bytes, sample_width: int, channels: int) -> np.ndarray:
+    if sample_width == 1:
+        data = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif sample_width == 2:
+        data = np.frombuffer(raw, dtype="<i2").astype(np.float32) / 32768.0
+    elif sample_width == 3:
+        b = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        ints = b[:, 0] | (b[:, 1] << 8) | (b[:, 2] << 16)
+        ints = np.where(ints & 0x800000, ints - 0x1000000, ints)
+        data = ints.astype(np.float32) / 8388608.0
+    elif sample_width == 4:
+        data = np.frombuffer(raw, dtype="<i4").astype(np.float32) / 2147483648.0
+    else:
+        raise ValueError(f"Unsupported sample width: {sample_width}")
+
+    if channels > 1:
+        data = data.reshape(-1, channels).mean(axis=1)
+    return data
+
+
+def yin(
+    frames: np.ndarray,
+    sample_rate: int,
+    fmin: float = FMIN_HZ,
+    fmax: float = FMAX_HZ,
+    threshold: float = YIN_THRESHOLD,
+) -> tuple[np.ndarray, np.ndarray]:
+    """YIN сразу по пачке кадров формы (n_frames, frame_length).
+
+    Разностная функция считается через FFT-корреляцию и кумулятивные
+    суммы энергии, без циклов по кадрам и лагам.
+    """
+    n_frames, frame_length = frames.shape
+    tau_min = max(int(sample_rate / fmax), 2)
+    tau_max = min(int(sample_rate / fmin) + 1, frame_length // 2)
+    window = frame_length - tau_max
+
+    # d(tau) = sum x[j]^2 + sum x[j+tau]^2 - 2 sum x[j] x[j+tau], j < window
+    n_fft = 1 << int(np.ceil(np.log2(frame_length + window)))
+    spec = np.fft.rfft(frames, n_fft, axis=1)
+    spec_head = np.fft.rfft(frames[:, :window], n_fft, axis=1)
+    corr = np.fft.irfft(spec * np.conj(spec_head), n_fft, axis=1)[:, : tau_max + 1]
+
+    sq_cumsum = np.concatenate(
+        (np.zeros((n_frames, 1), dtype=np.float64), np.cumsum(frames.astype(np.float64) ** 2, axis=1)),
+        axis=1,
+    )
+    taus = np.arange(tau_max + 1)
+    energy_head = sq_cumsum[:, window][:, None]
+    energy_lag = sq_cumsum[:, taus + window] - sq_cumsum[:, taus]
+    diff = np.maximum(energy_head + energy_lag - 2.0 * corr, 0.0)
+
+    # кумулятивно нормированная разностная функция d'(tau)
+    cum = np.cumsum(diff[:, 1:], axis=1)
+    cmndf = np.ones_like(diff)
+    np.divide(diff[:, 1:] * taus[1:], cum, out=cmndf[:, 1:], where=cum > 0)
+
+    search = cmndf[:, tau_min : tau_max + 1]
+    # первый локальный минимум ниже порога, иначе глобальный минимум
+    below = search[:, :-1] < threshold
+    local_min = below & (search[:, :-1] <= search[:, 1:])
+    has_dip = local_min.any(axis=1)
+    idx = np.where(has_dip, local_min.argmax(axis=1), search.argmin(axis=1))
+
+    rows = np.arange(n_frames)
+    tau = idx + tau_min
+    left = cmndf[rows, np.clip(tau - 1, 0, tau_max)]
+    mid = cmndf[rows, tau]
+    right = cmndf[rows, np.clip(tau + 1, 0, tau_max)]
+    denom = left - 2.0 * mid + right
+    shift = np.zeros(n_frames)
+    np.divide(left - right, 2.0 * denom, out=shift, where=np.abs(denom) > 1e-12)
+    shift = np.clip(shift, -1.0, 1.0)
+
+    confidence = np.clip(1.0 - mid, 0.0, 1.0)
+    f0 = np.where(has_dip, sample_rate / (tau + shift), 0.0)
+    return f0, confidence
+
+
+class PitchTracker:
+    """Разбивает поток сэмплов на кадры и детектирует высоту и атаки.
+
+    Хранит только хвост предыдущей пачки и последние значения энергии и
+    высоты, поэтому память не зависит от длины записи.
+    """
+
+    def __init__(self, sample_rate: int, frame_length: int | None = None, hop_length: int | None = None):
+        self.sample_rate = sample_rate
+        self.hop_length = hop_length or sample_rate // 100  # 10 мс
+        self.frame_length = frame_length or 1 << int(np.ceil(np.log2(sample_rate * 0.04)))
+        self._buffer = np.zeros(0, dtype=np.float32)
+        self._frame_index = 0
+        self._prev_db = SILENCE_DB
+        self._prev_f0 = 0.0
+
+    def feed(self, samples: np.ndarray) -> PitchFrames | None:
+        self._buffer = np.concatenate((self._buffer, samples))
+        if self._buffer.shape[0] < self.frame_length:
+            return None
+
+        frames = sliding_window_view(self._buffer, self.frame_length)[:: self.hop_length]
+        consumed = frames.shape[0] * self.hop_length
+        result = self._analyze(frames)
+        self._buffer = self._buffer[consumed:].copy()
+        return result
+
+    def _analyze(self, frames: np.ndarray) -> PitchFrames:
+        n_frames = frames.shape[0]
+        rms = np.sqrt(np.mean(frames.astype(np.float64) ** 2, axis=1))
+        db = 20.0 * np.log10(np.maximum(rms, 1e-10))
+
+        f0, confidence = yin(frames, self.sample_rate)
+        silent = db < SILENCE_DB
+        f0[silent] = 0.0
+        confidence[silent] = 0.0
+
+        prev_db = np.concatenate(([self._prev_db], db[:-1]))
+        prev_f0 = np.concatenate(([self._prev_f0], f0[:-1]))
+        voiced = (f0 > 0) & (prev_f0 > 0)
+        ratio = np.ones(n_frames)
+        np.divide(f0, prev_f0, out=ratio, where=voiced)
+        cents = 1200.0 * np.log2(ratio)
+        onset = ~silent & (
+            (db - prev_db >= ONSET_DB_RISE)
+            | ((f0 > 0) & (prev_f0 == 0))
+            | (voiced & (np.abs(cents) >= ONSET_CENTS_JUMP))
+        )
+
+        idx = self._frame_index + np.arange(n_frames)
+        time_s = (idx * self.hop_length + self.frame_length / 2) / self.sample_rate
+
+        self._frame_index += n_frames
+        self._prev_db = float(db[-1])
+        self._prev_f0 = float(f0[-1])
+        return PitchFrames(time_s=time_s, f0_hz=f0, confidence=confidence, onset=onset)
+
+
+def count_wav_pitch_frames(path: Path) -> int:
+    """Сколько кадров отдаст iter_wav_pitch — по заголовку WAV, без чтения данных."""
+    with wave.open(str(path), "rb") as wav:
+        tracker = PitchTracker(wav.getframerate())
+        n_samples = wav.getnframes()
+    # кадр k покрывает [k * hop, k * hop + frame_length); неполный хвост не анализируется
+    if n_samples < tracker.frame_length:
+        return 0
+    return (n_samples - tracker.frame_length) // tracker.hop_length + 1
+
+
+def iter_wav_pitch(path: Path, frames_per_batch: int = FRAMES_PER_BATCH) -> Iterator[PitchFrames]:
+    """Читает PCM WAV кусками фиксированного размера и отдаёт пачки кадров."""
+    with wave.open(str(path), "rb") as wav:
+        if wav.getcomptype() != "NONE":
+            raise ValueError("Only PCM WAV files are supported")
+        tracker = PitchTracker(wav.getframerate())
+        chunk = frames_per_batch * tracker.hop_length
+        while True:
+            raw = wav.readframes(chunk)
+            if not raw:
+                break
+            samples = _pcm_to_float(raw, wav.getsampwidth(), wav.getnchannels())
+            result = tracker.feed(samples)
+            if result is not None:
+                yield result
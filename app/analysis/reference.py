@@ -0,0 +1,23 @@
+"""Полный разбор эталона при загрузке и смене партии.
+
+Выполняется в процессе пула MIDI_WORKLOAD (admission), поэтому аргументы и
+результат передаются через pickle: Path, dict, NoteIndex и списки.
+"""
+from pathlib import Path
+
+from app.analysis.difficulty import difficulty_features
+from app.analysis.midi import parse_midi
+from app.analysis.note_index import NoteIndex
+from app.analysis.similarity import ngram_profile
+
+
+def analyze_reference(path: Path, part: int | None) -> tuple[dict, NoteIndex, dict, tuple[list[int], list[int]]]:
+    """Разбор партии, индекс по времени, признаки сложности и n-граммы.
+
+    Всё считается по одним и тем же массивам, пока ноты в памяти.
+    """
+    # 👉 формат "Начало Конец Нота"
+    parsed_json = parse_midi(path, part)
+    index = NoteIndex.from_parsed(parsed_json)
+    features = difficulty_features(index, parsed_json.get("tempo_bpm"))
+    return parsed_json, index, features, ngram_profile(index)
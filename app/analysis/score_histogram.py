@@ -0,0 +1,47 @@
+"""Распределение оценок по произведению в виде гистограммы с шагом в 1 балл.
+
+Корзина b (0..100) содержит оценки из [b, b + 1); 100 — отдельная корзина.
+Внутри корзины оценки считаются распределёнными равномерно, поэтому
+ошибка перцентиля не больше доли одной корзины. Все запросы — O(SCORE_BUCKETS).
+"""
+from math import floor
+
+SCORE_BUCKETS = 101
+
+
+def bucket_of(score: float) -> int:
+    return min(max(floor(score), 0), SCORE_BUCKETS - 1)
+
+
+def percentile_rank(counts: list[int], score: float) -> float:
+    """Доля оценок ниже score, в процентах."""
+    total = sum(counts)
+    if total == 0:
+        return 0.0
+    b = bucket_of(score)
+    below = sum(counts[:b]) + counts[b] * min(max(score - b, 0.0), 1.0)
+    return 100.0 * below / total
+
+
+def quantile(counts: list[int], q: float) -> float | None:
+    """Оценка, ниже которой лежит доля q (0..1) всех оценок."""
+    total = sum(counts)
+    if total == 0:
+        return None
+    target = q * total
+    seen = 0
+    for b, count in enumerate(counts):
+        if count and seen + count >= target:
+            return min(b + (target - seen) / count, 100.0)
+        seen += count
+    return 100.0
+
+
+def rank_of(counts: list[int], score: float) -> int:
+    """Примерное место score среди всех оценок (1 — лучший)."""
+    total = sum(counts)
+    if total == 0:
+        return 1
+    # сама оценка уже входит в гистограмму, поэтому место = число не ниже её
+    at_or_above = total * (1.0 - percentile_rank(counts, score) / 100.0)
+    return min(max(round(at_or_above), 1), total)
@@ -0,0 +1,142 @@
+"""N-граммы мелодии для поиска похожих эталонов и дубликатов.
+
+Мелодия — верхняя нота каждого начала (как в difficulty). Из неё берутся
+n-граммы двух видов, оба не зависят от тональности и темпа:
+
+* интервальные — N_GRAM соседних интервалов в полутонах, обрезанных до ±24;
+* ритмические — N_GRAM отношений соседних межнотных промежутков,
+  квантованных по log2 с шагом в полтона октавы (1/2).
+
+Каждая n-грамма кодируется точно, без хэширования, в положительный int32:
+вид в битах 28–30, сами значения — по 6 (интервалы) или 4 (ритм) бита.
+"""
+import math
+
+import numpy as np
+
+from app.analysis.note_index import NoteIndex
+
+N_GRAM = 4
+
+KIND_INTERVAL = 1
+KIND_RHYTHM = 2
+_KIND_SHIFT = 28
+
+MAX_INTERVAL = 24
+_INTERVAL_BITS = 6
+MAX_RATIO_STEP = 6
+_RATIO_BITS = 4
+# межнотные промежутки короче считаются одновременными
+MIN_IOI_S = 1e-3
+# строки ngram_frequencies с gram 0..DOCUMENT_COUNT_SHARDS-1 хранят число
+# проиндексированных эталонов по шардам (hashtext(midi_file_id) & 15, см.
+# миграцию shard_ngram_document_count); настоящие n-граммы всегда >= 1 << _KIND_SHIFT
+DOCUMENT_COUNT_SHARDS = 16
+DOCUMENT_COUNT_GRAMS = tuple(range(DOCUMENT_COUNT_SHARDS))
+
+# кандидаты ищутся по самым редким n-граммам запроса, пока сумма их частот
+# не превысит MAX_CANDIDATES: стоимость запроса не растёт с размером каталога
+MAX_SEED_GRAMS = 64
+MAX_CANDIDATES = 500
+DUPLICATE_JACCARD = 0.9
+
+
+def _melody(index: NoteIndex) -> tuple[np.ndarray, np.ndarray]:
+    starts = index.starts
+    last_of_onset = np.append(starts[1:] != starts[:-1], True) if starts.size else np.zeros(0, dtype=bool)
+    return starts[last_of_onset], index.pitches[last_of_onset].astype(np.int64)
+
+
+def _encode(symbols: np.ndarray, bits: int, kind: int) -> np.ndarray:
+    if symbols.size < N_GRAM:
+        return np.zeros(0, dtype=np.int64)
+    windows = np.lib.stride_tricks.sliding_window_view(symbols, N_GRAM)
+    weights = (1 << (bits * np.arange(N_GRAM - 1, -1, -1))).astype(np.int64)
+    return (kind << _KIND_SHIFT) | (windows @ weights)
+
+
+def melody_ngrams(index: NoteIndex) -> np.ndarray:
+    """Все n-граммы эталона (с повторами), int64."""
+    onsets, pitches = _melody(index)
+
+    intervals = np.clip(np.diff(pitches), -MAX_INTERVAL, MAX_INTERVAL) + MAX_INTERVAL
+    interval_grams = _encode(intervals, _INTERVAL_BITS, KIND_INTERVAL)
+
+    ioi = np.maximum(np.diff(onsets), MIN_IOI_S)
+    steps = np.rint(np.log2(ioi[1:] / ioi[:-1]) * 2).astype(np.int64) if ioi.size > 1 else np.zeros(0, dtype=np.int64)
+    ratios = np.clip(steps, -MAX_RATIO_STEP, MAX_RATIO_STEP) + MAX_RATIO_STEP
+    rhythm_grams = _encode(ratios, _RATIO_BITS, KIND_RHYTHM)
+
+    return np.concatenate((interval_grams, rhythm_grams))
+
+
+def ngram_profile(index: NoteIndex) -> tuple[list[int], list[int]]:
+    """(grams, counts): различные n-граммы по возрастанию и число повторов каждой."""
+    grams, counts = np.unique(melody_ngrams(index), return_counts=True)
+    return grams.tolist(), counts.tolist()
+
+
+def profile_from_parsed(parsed_json: dict) -> tuple[list[int], list[int]]:
+    return ngram_profile(NoteIndex.from_parsed(parsed_json))
+
+
+def gram_kind(gram: int) -> int:
+    return gram >> _KIND_SHIFT
+
+
+def idf_weights(frequencies: dict[int, int], total: int) -> dict[int, float]:
+    return {gram: math.log((total + 1) / (df + 1)) + 1.0 for gram, df in frequencies.items()}
+
+
+def seed_grams(frequencies: dict[int, int]) -> list[int]:
+    """Самые редкие n-граммы запроса, встречающиеся ещё хотя бы в одном эталоне.
+
+    frequencies учитывает и сам запрос, поэтому df == 1 — n-грамма только его.
+    """
+    seeds, budget = [], 0
+    for gram, df in sorted(frequencies.items(), key=lambda item: (item[1], item[0])):
+        if df <= 1:
+            continue
+        if seeds and (budget + df - 1 > MAX_CANDIDATES or len(seeds) >= MAX_SEED_GRAMS):
+            break
+        seeds.append(gram)
+        budget += df - 1
+    return seeds
+
+
+def rank_similar(
+    query_grams: list[int],
+    query_counts: list[int],
+    idf: dict[int, float],
+    candidates: list[tuple[str, list[int], list[int]]],
+) -> list[dict]:
+    """Ранжирует кандидатов по взвешенному idf перекрытию n-грамм запроса.
+
+    containment — доля веса n-грамм запроса, найденная у кандидата;
+    jaccard — невзвешенное сходство множеств n-грамм, для поиска дубликатов.
+    """
+    q_grams = np.asarray(query_grams, dtype=np.int64)
+    q_counts = np.asarray(query_counts, dtype=np.int64)
+    q_weights = np.array([idf.get(g, 0.0) for g in query_grams]) * q_counts
+    q_total = q_weights.sum()
+
+    ranked = []
+    for midi_file_id, grams, counts in candidates:
+        c_grams = np.asarray(grams, dtype=np.int64)
+        shared, qi, ci = np.intersect1d(q_grams, c_grams, assume_unique=True, return_indices=True)
+        if shared.size == 0:
+            continue
+        overlap = np.minimum(q_counts[qi], np.asarray(counts, dtype=np.int64)[ci]) / q_counts[qi]
+        containment = float((q_weights[qi] * overlap).sum() / q_total) if q_total > 0 else 0.0
+        jaccard = shared.size / (q_grams.size + c_grams.size - shared.size)
+        interval_shared = int(np.count_nonzero((shared >> _KIND_SHIFT) == KIND_INTERVAL))
+        ranked.append({
+            "midi_file_id": midi_file_id,
+            "containment": round(containment, 4),
+            "jaccard": round(float(jaccard), 4),
+            "shared_interval_ngrams": interval_shared,
+            "shared_rhythm_ngrams": int(shared.size) - interval_shared,
+            "duplicate": bool(jaccard >= DUPLICATE_JACCARD),
+        })
+    ranked.sort(key=lambda r: (r["containment"], r["jaccard"]), reverse=True)
+    return ranked
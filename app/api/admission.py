@@ -0,0 +1,170 @@
+"""Контроль допуска для тяжёлых по CPU нагрузок.
+
+У каждой нагрузки (разбор MIDI, bcrypt) свой ограниченный пул и своя
+очередь, поэтому всплеск загрузок не занимает пул по умолчанию и не
+задерживает дешёвые запросы. Запрос отклоняется сразу, если очередь полна
+(429), или если ожидаемое либо фактическое ожидание превышает max_wait_s
+(503). В обоих случаях в ответе есть Retry-After — оценка времени до
+освобождения очереди.
+
+Пулы создаются лениво в процессе воркера, как engine БД; закрываются в
+lifespan (shutdown_workloads). bcrypt отпускает GIL, поэтому ему хватает
+потоков; pretty_midi и mido разбирают файл на чистом Python и держат GIL,
+поэтому разбор MIDI идёт в пуле процессов (processes=True) — функция,
+аргументы и результат такой нагрузки должны передаваться через pickle.
+"""
+import asyncio
+import logging
+import math
+import multiprocessing
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import asdict, dataclass, field
+
+from fastapi import HTTPException, status
+
+logger = logging.getLogger(__name__)
+
+# сглаживание средней длительности задачи для оценки ожидания
+SERVICE_TIME_ALPHA = 0.2
+
+
+@dataclass
+class WorkloadStats:
+    admitted: int = 0
+    completed: int = 0
+    rejected_queue_full: int = 0
+    rejected_wait: int = 0
+    queued: int = 0
+    running: int = 0
+    wait_total_s: float = 0.0
+    wait_max_s: float = 0.0
+    service_avg_s: float = 0.0
+
+
+@dataclass
+class Workload:
+    name: str
+    workers: int
+    # сколько запросов может ждать свободного исполнителя
+    max_queue: int
+    # дольше этого в очереди не ждём: клиенту лучше повторить позже
+    max_wait_s: float
+    # начальная оценка длительности задачи, пока нет замеров
+    service_time_s: float
+    # пул процессов вместо потоков — для задач, которые держат GIL
+    processes: bool = False
+    stats: WorkloadStats = field(default_factory=WorkloadStats)
+    _executor: Executor | None = field(default=None, repr=False)
+    _slots: asyncio.Semaphore | None = field(default=None, repr=False)
+
+    def __post_init__(self):
+        self.stats.service_avg_s = self.service_time_s
+
+    def _ensure_started(self) -> None:
+        if self._executor is None:
+            self._executor = self._new_executor()
+            self._slots = asyncio.Semaphore(self.workers)
+
+    def _new_executor(self) -> Executor:
+        if self.processes:
+            # не fork: в воркере уже есть потоки и event loop, дочерние
+            # процессы порождает чистый forkserver
+            return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("forkserver"))
+        return ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"app-{self.name}")
+
+    def expected_wait_s(self) -> float:
+        """Оценка ожидания для нового запроса: очередь впереди, делённая на число исполнителей."""
+        ahead = self.stats.queued + self.stats.running - self.workers + 1
+        return max(ahead, 0) * self.stats.service_avg_s / self.workers
+
+    def _reject(self, status_code: int, detail: str) -> HTTPException:
+        retry_after = max(1, math.ceil(self.expected_wait_s()))
+        logger.warning("%s workload rejected a request: %s (retry after %ss)", self.name, detail, retry_after)
+        return HTTPException(
+            status_code=status_code,
+            detail=detail,
+            headers={"Retry-After": str(retry_after)},
+        )
+
+    async def run(self, fn, *args):
+        """Выполнить fn(*args) в пуле нагрузки или отклонить запрос с 429/503."""
+        self._ensure_started()
+        stats = self.stats
+
+        enqueued = time.monotonic()
+        if not self._slots.locked():
+            # свободный исполнитель: acquire завершается без переключения задач
+            await self._slots.acquire()
+        else:
+            if stats.queued >= self.max_queue:
+                stats.rejected_queue_full += 1
+                raise self._reject(status.HTTP_429_TOO_MANY_REQUESTS, f"Too many {self.name} requests in queue")
+            if self.expected_wait_s() > self.max_wait_s:
+                stats.rejected_wait += 1
+                raise self._reject(status.HTTP_503_SERVICE_UNAVAILABLE, f"{self.name} workload is overloaded")
+
+            stats.queued += 1
+            try:
+                await asyncio.wait_for(self._slots.acquire(), timeout=self.max_wait_s)
+            except TimeoutError:
+                stats.rejected_wait += 1
+                raise self._reject(status.HTTP_503_SERVICE_UNAVAILABLE, f"{self.name} workload is overloaded") from None
+            finally:
+                stats.queued -= 1
+
+        started = time.monotonic()
+        waited = started - enqueued
+        stats.admitted += 1
+        stats.wait_total_s += waited
+        stats.wait_max_s = max(stats.wait_max_s, waited)
+        stats.running += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        except BrokenProcessPool:
+            # процесс пула убит (например, OOM на огромном файле): пул больше не
+            # принимает задачи, заменяем его новым, а запрос просим повторить
+            logger.error("%s workload process pool broke, restarting it", self.name)
+            broken, self._executor = self._executor, self._new_executor()
+            broken.shutdown(wait=False, cancel_futures=True)
+            raise self._reject(status.HTTP_503_SERVICE_UNAVAILABLE, f"{self.name} workload is restarting") from None
+        finally:
+            stats.running -= 1
+            stats.completed += 1
+            elapsed = time.monotonic() - started
+            stats.service_avg_s += SERVICE_TIME_ALPHA * (elapsed - stats.service_avg_s)
+            self._slots.release()
+
+    def snapshot(self) -> dict:
+        stats = asdict(self.stats)
+        stats["wait_avg_s"] = stats["wait_total_s"] / stats["admitted"] if stats["admitted"] else 0.0
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "max_wait_s": self.max_wait_s,
+            **stats,
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+        self._executor = None
+        self._slots = None
+
+
+# разбор MIDI, признаки и n-граммы эталона: десятки-сотни мс на файл
+MIDI_WORKLOAD = Workload("midi", workers=2, max_queue=8, max_wait_s=10.0, service_time_s=0.5, processes=True)
+# bcrypt при 12 раундах — ~0.2-0.3 с CPU на хэш/проверку
+AUTH_WORKLOAD = Workload("auth", workers=4, max_queue=32, max_wait_s=2.0, service_time_s=0.25)
+
+WORKLOADS = {workload.name: workload for workload in (MIDI_WORKLOAD, AUTH_WORKLOAD)}
+
+
+def admission_stats() -> dict:
+    return {name: workload.snapshot() for name, workload in WORKLOADS.items()}
+
+
+def shutdown_workloads() -> None:
+    for workload in WORKLOADS.values():
+        workload.shutdown()
@@ -1,6 +1,6 @@
 from fastapi import APIRouter
 
-from app.api.endpoints import auth, users, references, sheet_music, practice_session
+from app.api.endpoints import auth, users, references, sheet_music, practice_session, audio_uploads, system
 
 auth_router = APIRouter()
 
@@ -44,4 +44,9 @@ sheet_music_router.include_router(sheet_music.router, prefix="/sheet-music", tag
 
 practice_session_router = APIRouter()
 
-practice_session_router.include_router(practice_session.router, prefix="/practice-sessions", tags=["practice-sessions"])
\ No newline at end of file
+practice_session_router.include_router(practice_session.router, prefix="/practice-sessions", tags=["practice-sessions"])
+practice_session_router.include_router(audio_uploads.router, prefix="/practice-sessions", tags=["practice-sessions"])
+
+system_router = APIRouter()
+
+system_router.include_router(system.router, prefix="/system", tags=["system"])
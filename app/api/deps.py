@@ -9,6 +9,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from app.api import api_messages
 from app.core import database_session
 from app.core.security.jwt import verify_jwt_token
+from app.models.enums import UserRole
 from app.models.models import User
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/access-token")
@@ -24,11 +25,24 @@ async def get_current_user(
 ) -> User:
     token_payload = verify_jwt_token(token)
 
-    user = await session.scalar(select(User).where(User.user_id == token_payload.sub))
+    user = await session.scalar(
+        select(User).where(User.user_id == token_payload.sub, User.deleted_at.is_(None))
+    )
 
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail=api_messages.JWT_ERROR_USER_REMOVED,
         )
-    return user
\ No newline at end of file
+    return user
+
+
+async def get_current_admin(
+    current_user: User = Depends(get_current_user),
+) -> User:
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin role required",
+        )
+    return current_user
@@ -0,0 +1,336 @@
+import asyncio
+import hashlib
+import os
+from pathlib import Path, PurePath
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response, status
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api import deps
+from app.core.storage import audio_upload_part_path, open_locked_part, session_audio_file, session_audio_path
+from app.models.models import PracticeSession, SessionAudioUpload, User
+from app.schemas.requests import AudioUploadCreateRequest, AudioUploadFinalizeRequest
+from app.schemas.responses import AudioUploadResponse, PracticeSessionResponse
+
+router = APIRouter()
+
+AUDIO_UPLOAD_MAX_SIZE = 2 * 1024 ** 3
+AUDIO_SUFFIXES = {".wav", ".flac", ".ogg", ".opus", ".webm", ".mp3", ".m4a"}
+HASH_READ_SIZE = 1024 * 1024
+
+
+def _part_size(path: Path) -> int:
+    try:
+        return path.stat().st_size
+    except FileNotFoundError:
+        return 0
+
+
+def _create_part(path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.touch(exist_ok=True)
+
+
+def _write_at(fd: int, chunk: bytes, offset: int) -> None:
+    view = memoryview(chunk)
+    while view:
+        written = os.pwrite(fd, view, offset)
+        view = view[written:]
+        offset += written
+
+
+def _sha256(fd: int) -> str:
+    digest = hashlib.sha256()
+    offset = 0
+    while block := os.pread(fd, HASH_READ_SIZE, offset):
+        digest.update(block)
+        offset += len(block)
+    return digest.hexdigest()
+
+
+def _publish(part: Path, dst: Path, session_id: str, previous_url: str | None) -> None:
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    os.replace(part, dst)
+    # удаляем только прежний файл этой же сессии (другое расширение), не произвольный путь
+    previous = session_audio_file(session_id, previous_url) if previous_url else None
+    if previous is not None and previous != dst.resolve():
+        previous.unlink(missing_ok=True)
+
+
+async def _get_upload(
+    session: AsyncSession, session_id: str, upload_id: str, user_id: str
+) -> SessionAudioUpload:
+    row = (await session.execute(
+        select(SessionAudioUpload, PracticeSession.user_id)
+        .join(PracticeSession, PracticeSession.session_id == SessionAudioUpload.session_id)
+        .where(
+            SessionAudioUpload.upload_id == upload_id,
+            SessionAudioUpload.session_id == session_id,
+        )
+    )).one_or_none()
+
+    if row is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Audio upload not found"
+        )
+
+    upload, owner_id = row
+    if owner_id != user_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You do not have permission to upload audio for this practice session"
+        )
+    return upload
+
+
+async def _lock_part(upload_id: str) -> int:
+    # один писатель на загрузку; flock снимается при закрытии дескриптора
+    loop = asyncio.get_running_loop()
+    fd = await loop.run_in_executor(None, open_locked_part, audio_upload_part_path(upload_id))
+    if fd is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Audio upload is being written by another request or is already finalized"
+        )
+    return fd
+
+
+async def _ensure_not_completed(session: AsyncSession, upload_id: str) -> None:
+    # повторная проверка под локом: finalize мог завершиться, пока мы его ждали
+    completed_at = await session.scalar(
+        select(SessionAudioUpload.completed_at).where(SessionAudioUpload.upload_id == upload_id)
+    )
+    await session.commit()
+    if completed_at is not None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Audio upload is already finalized"
+        )
+
+
+def _upload_response(upload: SessionAudioUpload, offset: int) -> AudioUploadResponse:
+    return AudioUploadResponse(
+        upload_id=upload.upload_id,
+        session_id=upload.session_id,
+        size=upload.size,
+        offset=offset,
+        completed_at=upload.completed_at,
+    )
+
+
+@router.post(
+    "/{session_id}/audio-uploads",
+    response_model=AudioUploadResponse,
+    status_code=status.HTTP_201_CREATED,
+    summary="Начать загрузку записи сессии",
+    description="Создать докачиваемую загрузку аудиозаписи сессии. Дальше байты передаются PATCH-запросами с заголовком Upload-Offset",
+)
+async def create_audio_upload(
+    session_id: str,
+    upload_request: AudioUploadCreateRequest,
+    response: Response,
+    session: AsyncSession = Depends(deps.get_session),
+    current_user: User = Depends(deps.get_current_user)
+) -> AudioUploadResponse:
+    owner_id = await session.scalar(
+        select(PracticeSession.user_id).where(PracticeSession.session_id == session_id)
+    )
+
+    if owner_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Practice session not found"
+        )
+
+    if owner_id != current_user.user_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You do not have permission to upload audio for this practice session"
+        )
+
+    if upload_request.size > AUDIO_UPLOAD_MAX_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Audio is larger than {AUDIO_UPLOAD_MAX_SIZE} bytes"
+        )
+
+    suffix = PurePath(upload_request.filename).suffix.lower()
+    if suffix not in AUDIO_SUFFIXES:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Unsupported audio format: {suffix or upload_request.filename}"
+        )
+
+    upload = SessionAudioUpload(session_id=session_id, size=upload_request.size, suffix=suffix)
+    session.add(upload)
+    await session.flush()
+
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, _create_part, audio_upload_part_path(upload.upload_id))
+    await session.commit()
+
+    response.headers["Upload-Offset"] = "0"
+    return _upload_response(upload, 0)
+
+
+@router.get(
+    "/{session_id}/audio-uploads/{upload_id}",
+    response_model=AudioUploadResponse,
+    status_code=status.HTTP_200_OK,
+    summary="Получить смещение загрузки",
+    description="Сколько байт уже принято сервером; с этого смещения клиент продолжает загрузку после обрыва",
+)
+async def get_audio_upload(
+    session_id: str,
+    upload_id: str,
+    response: Response,
+    session: AsyncSession = Depends(deps.get_session),
+    current_user: User = Depends(deps.get_current_user)
+) -> AudioUploadResponse:
+    upload = await _get_upload(session, session_id, upload_id, current_user.user_id)
+
+    if upload.completed_at is not None:
+        offset = upload.size
+    else:
+        loop = asyncio.get_running_loop()
+        offset = await loop.run_in_executor(None, _part_size, audio_upload_part_path(upload_id))
+
+    response.headers["Upload-Offset"] = str(offset)
+    response.headers["Cache-Control"] = "no-store"
+    return _upload_response(upload, offset)
+
+
+@router.patch(
+    "/{session_id}/audio-uploads/{upload_id}",
+    response_model=AudioUploadResponse,
+    status_code=status.HTTP_200_OK,
+    summary="Передать часть записи",
+    description=(
+        "Дописать тело запроса в загрузку начиная с Upload-Offset. Смещение должно совпадать "
+        "с уже принятым, иначе 409 с актуальным смещением. Байты пишутся на диск по мере получения"
+    ),
+)
+async def patch_audio_upload(
+    session_id: str,
+    upload_id: str,
+    request: Request,
+    response: Response,
+    upload_offset: int = Header(alias="Upload-Offset", ge=0),
+    session: AsyncSession = Depends(deps.get_session),
+    current_user: User = Depends(deps.get_current_user)
+) -> AudioUploadResponse:
+    upload = await _get_upload(session, session_id, upload_id, current_user.user_id)
+
+    if upload.completed_at is not None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Audio upload is already finalized"
+        )
+
+    # соединение с БД возвращаем в пул до приёма тела: медленный клиент может слать его минутами
+    await session.commit()
+
+    loop = asyncio.get_running_loop()
+    fd = await _lock_part(upload_id)
+    try:
+        await _ensure_not_completed(session, upload_id)
+
+        offset = (await loop.run_in_executor(None, os.fstat, fd)).st_size
+        if upload_offset != offset:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Upload offset mismatch, expected {offset}",
+                headers={"Upload-Offset": str(offset)},
+            )
+
+        # принятое до обрыва остаётся на диске — клиент продолжит с нового смещения
+        async for chunk in request.stream():
+            if not chunk:
+                continue
+            if offset + len(chunk) > upload.size:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail=f"Upload exceeds declared size of {upload.size} bytes",
+                    headers={"Upload-Offset": str(offset)},
+                )
+            await loop.run_in_executor(None, _write_at, fd, chunk, offset)
+            offset += len(chunk)
+    finally:
+        await loop.run_in_executor(None, os.close, fd)
+
+    response.headers["Upload-Offset"] = str(offset)
+    return _upload_response(upload, offset)
+
+
+@router.post(
+    "/{session_id}/audio-uploads/{upload_id}/finalize",
+    response_model=PracticeSessionResponse,
+    status_code=status.HTTP_200_OK,
+    summary="Завершить загрузку записи",
+    description="Проверить SHA-256 принятого файла и привязать запись к сессии (audio_url)",
+)
+async def finalize_audio_upload(
+    session_id: str,
+    upload_id: str,
+    finalize_request: AudioUploadFinalizeRequest,
+    session: AsyncSession = Depends(deps.get_session),
+    current_user: User = Depends(deps.get_current_user)
+) -> PracticeSessionResponse:
+    upload = await _get_upload(session, session_id, upload_id, current_user.user_id)
+
+    if upload.completed_at is not None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Audio upload is already finalized"
+        )
+
+    # хэш файла в гигабайты считается секундами — без открытой транзакции
+    await session.commit()
+
+    loop = asyncio.get_running_loop()
+    part = audio_upload_part_path(upload_id)
+    fd = await _lock_part(upload_id)
+    try:
+        await _ensure_not_completed(session, upload_id)
+
+        offset = (await loop.run_in_executor(None, os.fstat, fd)).st_size
+        if offset != upload.size:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Audio upload is incomplete: {offset} of {upload.size} bytes",
+                headers={"Upload-Offset": str(offset)},
+            )
+
+        checksum = await loop.run_in_executor(None, _sha256, fd)
+        if checksum != finalize_request.sha256.lower():
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="Checksum mismatch"
+            )
+
+        dst = session_audio_path(session_id, upload.suffix)
+        previous_url = await session.scalar(
+            select(PracticeSession.audio_url).where(PracticeSession.session_id == session_id)
+        )
+        await loop.run_in_executor(None, _publish, part, dst, session_id, previous_url)
+
+        await session.execute(
+            update(SessionAudioUpload)
+            .where(SessionAudioUpload.upload_id == upload_id)
+            .values(completed_at=func.now())
+        )
+        # audio_url меняет сессию, поэтому версия для CAS тоже растёт
+        updated = (await session.execute(
+            update(PracticeSession)
+            .where(PracticeSession.session_id == session_id)
+            .values(audio_url=str(dst), version=PracticeSession.version + 1)
+            .returning(*PracticeSession.__table__.c)
+        )).one()
+        await session.commit()
+    finally:
+        # лок снимаем только после commit: ожидающий PATCH увидит completed_at
+        await loop.run_in_executor(None, os.close, fd)
+
+    return PracticeSessionResponse.model_validate(updated)
@@ -9,11 +9,12 @@ from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.api import api_messages, deps
+from app.api.admission import AUTH_WORKLOAD
 from app.api.api_messages import ACCESS_TOKEN_RESPONSES, REFRESH_TOKEN_RESPONSES
 from app.core.config import get_settings
 from app.core.security.jwt import create_jwt_token
 from app.core.security.password import (
-    DUMMY_PASSWORD,
+    get_dummy_password,
     get_password_hash,
     verify_password,
 )
@@ -38,18 +39,21 @@ async def login_access_token(
         session: AsyncSession = Depends(deps.get_session),
         form_data: OAuth2PasswordRequestForm = Depends(),
 ) -> AccessTokenResponse:
-    user = await session.scalar(select(User).where(User.login == form_data.username))
+    user = await session.scalar(
+        select(User).where(User.login == form_data.username, User.deleted_at.is_(None))
+    )
 
     if user is None:
         # this is naive method to not return early
-        verify_password(form_data.password, DUMMY_PASSWORD)
+        await AUTH_WORKLOAD.run(verify_password, form_data.password, get_dummy_password())
 
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=api_messages.PASSWORD_INVALID,
         )
 
-    if not verify_password(form_data.password, user.hashed_password):
+    # bcrypt — в своём ограниченном пуле, а не в цикле событий
+    if not await AUTH_WORKLOAD.run(verify_password, form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=api_messages.PASSWORD_INVALID,
@@ -146,7 +150,7 @@ async def register_new_user(
 
     user = User(
         login=new_user.login,
-        hashed_password=get_password_hash(new_user.password),
+        hashed_password=await AUTH_WORKLOAD.run(get_password_hash, new_user.password),
         name="Смешарик"
     )
     session.add(user)
@@ -1,16 +1,51 @@
-from fastapi import APIRouter, Depends, status, HTTPException
-from sqlalchemy import delete
+import asyncio
+
+from fastapi import APIRouter, BackgroundTasks, Depends, Query, Request, Response, status, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy import delete, exists, func, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
+from sqlalchemy.orm import undefer
 
+from app.analysis.metric_config import (
+    invalidate_session_metric_config,
+    load_metric_config,
+    resolve_metric_config,
+)
 from app.api import deps
-from app.models.models import PracticeSession, User, SheetMusic, MidiFile
+from app.api.etag import etag_matches, list_etag, not_modified, set_cache_headers, weak_etag
+from app.api.file_response import ZeroCopyFileResponse
+from app.api.sse import SSE_MEDIA_TYPE, event_stream_response
+from app.core import database_session
+from app.core.storage import session_audio_file
+from app.models.enums import SESSION_STATUS_TRANSITIONS, SessionStatus
+from app.models.models import (
+    ArchivedSessionMetric,
+    LiveSessionMetric,
+    MidiFile,
+    PracticeSession,
+    Report,
+    SheetMusic,
+    User,
+)
 from app.schemas.requests import PracticeSessionCreateRequest, PracticeSessionUpdateRequest
-from app.schemas.responses import PracticeSessionResponse
+from app.schemas.responses import LiveSessionMetricResponse, PracticeSessionResponse
 
 router = APIRouter()
 
 
+def _validate_metric_pref(metric_pref: dict) -> None:
+    # проверяем переопределения сессии поверх умолчаний сервера
+    try:
+        resolve_metric_config(None, metric_pref)
+    except ValidationError as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=e.errors(include_url=False, include_context=False),
+        )
+
+
 @router.post(
     "/create",
     response_model=PracticeSessionResponse,
@@ -24,40 +59,50 @@ async def create_practice_session(
     current_user: User = Depends(deps.get_current_user)
 ) -> PracticeSessionResponse:
     # Проверяем, что sheet_music существует и принадлежит пользователю
-    sheet_music = await session.scalar(
-        select(SheetMusic).where(
+    sheet_music_exists = await session.scalar(
+        select(exists().where(
             SheetMusic.sheet_id == session_request.sheet_id,
             SheetMusic.owner_id == current_user.user_id
-        )
+        ))
     )
-    if not sheet_music:
+    if not sheet_music_exists:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Sheet music not found or you don't have access to it"
         )
 
-    # Проверяем, что MIDI файл существует и связан с этой музыкой
-    midi_file = await session.scalar(
-        select(MidiFile).where(
+    # Проверяем, что MIDI файл существует и связан с этой музыкой.
+    # FOR SHARE до commit: смена партии эталона (PUT /references/{id}/part)
+    # не пройдёт, пока создаётся сессия по нему
+    midi_file_exists = await session.scalar(
+        select(MidiFile.midi_file_id)
+        .where(
             MidiFile.midi_file_id == session_request.midi_file_id,
             MidiFile.sheet_id == session_request.sheet_id
         )
+        .with_for_update(read=True)
     )
-    if not midi_file:
+    if not midi_file_exists:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="MIDI file not found or not associated with this sheet music"
         )
 
+    metric_pref = session_request.metric_pref or {}
+    _validate_metric_pref(metric_pref)
+
     practice_session = PracticeSession(
         user_id=current_user.user_id,
         sheet_id=session_request.sheet_id,
         midi_file_id=session_request.midi_file_id,
-        metric_pref=session_request.metric_pref or {}
+        metric_pref=metric_pref,
+        tempo_factor=round(session_request.tempo_factor, 2),
+        transpose=session_request.transpose,
     )
 
     session.add(practice_session)
     await session.commit()
+    # refresh не подгружает deferred-колонки, metric_pref берём из запроса
     await session.refresh(practice_session)
 
     return PracticeSessionResponse(
@@ -66,12 +111,15 @@ async def create_practice_session(
         sheet_id=practice_session.sheet_id,
         midi_file_id=practice_session.midi_file_id,
         status=practice_session.status,
-        metric_pref=practice_session.metric_pref,
+        metric_pref=metric_pref,
         audio_url=practice_session.audio_url,
+        tempo_factor=practice_session.tempo_factor,
+        transpose=practice_session.transpose,
         start_at=practice_session.start_at,
         end_at=practice_session.end_at,
         created_at=practice_session.created_at,
         updated_at=practice_session.updated_at,
+        version=practice_session.version,
     )
 
 
@@ -88,45 +136,80 @@ async def update_practice_session(
     session: AsyncSession = Depends(deps.get_session),
     current_user: User = Depends(deps.get_current_user)
 ) -> PracticeSessionResponse:
-    # Получаем сессию практики
-    practice_session = await session.scalar(
-        select(PracticeSession).where(PracticeSession.session_id == session_id)
-    )
+    # Получаем только то, что нужно для проверок; сама запись обновляется CAS-ом
+    current = (await session.execute(
+        select(PracticeSession.user_id, PracticeSession.status, PracticeSession.version)
+        .where(PracticeSession.session_id == session_id)
+    )).one_or_none()
 
-    if not practice_session:
+    if not current:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Practice session not found"
         )
 
-    if practice_session.user_id != current_user.user_id:
+    if current.user_id != current_user.user_id:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="You do not have permission to update this practice session"
         )
 
+    if current.version != session_request.version:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Practice session was modified concurrently"
+        )
+
     # Обновляем только переданные поля
-    data = session_request.model_dump(exclude_unset=True)
+    data = session_request.model_dump(exclude_unset=True, exclude={"version"})
+
+    if data.get("metric_pref") is not None:
+        _validate_metric_pref(data["metric_pref"])
+    else:
+        data.pop("metric_pref", None)
+
+    new_status = data.get("status")
+    if new_status is not None and new_status != current.status:
+        if new_status not in SESSION_STATUS_TRANSITIONS[current.status]:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Cannot change practice session status from {current.status} to {new_status}"
+            )
+        # время начала и окончания проставляет сервер
+        if new_status == SessionStatus.PLAYING:
+            data["start_at"] = func.now()
+        else:
+            data["end_at"] = func.now()
+    else:
+        data.pop("status", None)
 
-    for key, val in data.items():
-        setattr(practice_session, key, val)
+    # compare-and-swap: строка обновится, только если её никто не изменил после чтения
+    updated = (await session.execute(
+        update(PracticeSession)
+        .where(
+            PracticeSession.session_id == session_id,
+            PracticeSession.version == session_request.version,
+        )
+        .values(**data, version=PracticeSession.version + 1)
+        .returning(*PracticeSession.__table__.c)
+    )).one_or_none()
+
+    if updated is None:
+        await session.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Practice session was modified concurrently"
+        )
 
     await session.commit()
-    await session.refresh(practice_session)
 
-    return PracticeSessionResponse(
-        session_id=practice_session.session_id,
-        user_id=practice_session.user_id,
-        sheet_id=practice_session.sheet_id,
-        midi_file_id=practice_session.midi_file_id,
-        status=practice_session.status,
-        metric_pref=practice_session.metric_pref,
-        audio_url=practice_session.audio_url,
-        start_at=practice_session.start_at,
-        end_at=practice_session.end_at,
-        created_at=practice_session.created_at,
-        updated_at=practice_session.updated_at,
-    )
+    if updated.status == SessionStatus.PLAYING:
+        # конфиг метрик считается один раз на старт сессии, дальше — из кэша
+        await load_metric_config(session, session_id)
+    elif updated.status in (SessionStatus.DONE, SessionStatus.ERROR):
+        invalidate_session_metric_config(session_id)
+
+    return PracticeSessionResponse.model_validate(updated)
 
 
 @router.delete(
@@ -158,6 +241,7 @@ async def delete_practice_session(
 
     await session.execute(delete(PracticeSession).where(PracticeSession.session_id == session_id))
     await session.commit()
+    invalidate_session_metric_config(session_id)
 
 
 @router.get(
@@ -168,11 +252,25 @@ async def delete_practice_session(
     description="Получить все сессии практики пользователя",
 )
 async def get_all_user_practice_sessions(
+    request: Request,
+    response: Response,
     session: AsyncSession = Depends(deps.get_session),
     current_user: User = Depends(deps.get_current_user)
-) -> list[PracticeSessionResponse]:
+) -> list[PracticeSessionResponse] | Response:
+    # дешёвый агрегат вместо выборки строк: хватает, чтобы ответить 304
+    max_updated_at, count = (await session.execute(
+        select(func.max(PracticeSession.updated_at), func.count())
+        .where(PracticeSession.user_id == current_user.user_id)
+    )).one()
+    etag = list_etag(f"practice-sessions:{current_user.user_id}", max_updated_at, count)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    set_cache_headers(response, etag)
+
     practice_sessions = await session.scalars(
-        select(PracticeSession).where(PracticeSession.user_id == current_user.user_id)
+        select(PracticeSession)
+        .options(undefer(PracticeSession.metric_pref))
+        .where(PracticeSession.user_id == current_user.user_id)
     )
     return [PracticeSessionResponse(
         session_id=ps.session_id,
@@ -182,10 +280,13 @@ async def get_all_user_practice_sessions(
         status=ps.status,
         metric_pref=ps.metric_pref,
         audio_url=ps.audio_url,
+        tempo_factor=ps.tempo_factor,
+        transpose=ps.transpose,
         start_at=ps.start_at,
         end_at=ps.end_at,
         created_at=ps.created_at,
         updated_at=ps.updated_at,
+        version=ps.version,
     ) for ps in practice_sessions]
 
 
@@ -198,25 +299,44 @@ async def get_all_user_practice_sessions(
 )
 async def get_practice_session(
     session_id: str,
+    request: Request,
+    response: Response,
     session: AsyncSession = Depends(deps.get_session),
     current_user: User = Depends(deps.get_current_user)
-) -> PracticeSessionResponse:
-    practice_session = await session.scalar(
-        select(PracticeSession).where(PracticeSession.session_id == session_id)
-    )
+) -> PracticeSessionResponse | Response:
+    meta = (await session.execute(
+        select(PracticeSession.user_id, PracticeSession.updated_at)
+        .where(PracticeSession.session_id == session_id)
+    )).one_or_none()
 
-    if not practice_session:
+    if not meta:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Practice session not found"
         )
 
-    if practice_session.user_id != current_user.user_id:
+    if meta.user_id != current_user.user_id:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="You do not have permission to view this practice session"
         )
 
+    etag = weak_etag("practice-session", session_id, meta.updated_at)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    set_cache_headers(response, etag)
+
+    practice_session = await session.scalar(
+        select(PracticeSession)
+        .options(undefer(PracticeSession.metric_pref))
+        .where(PracticeSession.session_id == session_id)
+    )
+    if not practice_session:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Practice session not found"
+        )
+
     return PracticeSessionResponse(
         session_id=practice_session.session_id,
         user_id=practice_session.user_id,
@@ -225,8 +345,244 @@ async def get_practice_session(
         status=practice_session.status,
         metric_pref=practice_session.metric_pref,
         audio_url=practice_session.audio_url,
+        tempo_factor=practice_session.tempo_factor,
+        transpose=practice_session.transpose,
         start_at=practice_session.start_at,
         end_at=practice_session.end_at,
         created_at=practice_session.created_at,
         updated_at=practice_session.updated_at,
+        version=practice_session.version,
     )
+
+
+@router.post(
+    "/{session_id}/analyze",
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="Проанализировать запись сессии",
+    description="Запустить в фоне определение высоты тона по записи сессии и сохранить результат в метриках",
+)
+async def analyze_practice_session(
+    session_id: str,
+    background_tasks: BackgroundTasks,
+    session: AsyncSession = Depends(deps.get_session),
+    current_user: User = Depends(deps.get_current_user)
+) -> dict:
+    practice_session = await session.scalar(
+        select(PracticeSession).where(PracticeSession.session_id == session_id)
+    )
+
+    if not practice_session:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Practice session not found"
+        )
+
+    if practice_session.user_id != current_user.user_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You do not have permission to analyze this practice session"
+        )
+
+    if not practice_session.audio_url:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Practice session has no audio"
+        )
+
+    # метрики завершённой сессии уже могли уйти в архив — не переписываем их
+    archived = await session.scalar(
+        select(exists().where(ArchivedSessionMetric.session_id == session_id))
+    )
+    if practice_session.status == SessionStatus.DONE or archived:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Practice session is finished, its metrics cannot be recomputed"
+        )
+
+    # numpy нужен только анализу, не грузим его при старте воркера
+    from app.jobs.session_audio import analyze_practice_session_audio
+
+    background_tasks.add_task(analyze_practice_session_audio, session_id)
+    return {"session_id": session_id, "status": "accepted"}
+
+
+@router.get(
+    "/{session_id}/audio",
+    summary="Скачать запись сессии",
+    description="Отдать аудиозапись сессии практики. Поддерживает Range и If-Range для перемотки и докачки",
+    response_class=ZeroCopyFileResponse,
+)
+async def download_practice_session_audio(
+    session_id: str,
+    session: AsyncSession = Depends(deps.get_session),
+    current_user: User = Depends(deps.get_current_user)
+) -> ZeroCopyFileResponse:
+    practice_session = (await session.execute(
+        select(PracticeSession.user_id, PracticeSession.audio_url)
+        .where(PracticeSession.session_id == session_id)
+    )).one_or_none()
+
+    if practice_session is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Practice session not found"
+        )
+
+    if practice_session.user_id != current_user.user_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You do not have permission to view this practice session"
+        )
+
+    path = None
+    if practice_session.audio_url:
+        loop = asyncio.get_running_loop()
+        # audio_url проставляет только finalize загрузки; отдаём лишь файл этой сессии
+        path = await loop.run_in_executor(None, session_audio_file, session_id, practice_session.audio_url)
+    if path is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Practice session audio not found"
+        )
+
+    return ZeroCopyFileResponse(path, filename=path.name)
+
+
+async def _session_state(session_id: str) -> dict:
+    async with database_session.get_async_session() as db:
+        state = (await db.execute(
+            select(PracticeSession.status, PracticeSession.version, Report.report_id)
+            .outerjoin(Report, Report.session_id == PracticeSession.session_id)
+            .where(PracticeSession.session_id == session_id)
+            .order_by(Report.created_at.desc())
+            .limit(1)
+        )).one_or_none()
+    if state is None:
+        return {"deleted": True}
+    return {"status": state.status, "version": state.version, "report_id": state.report_id}
+
+
+def _session_events_done(event: dict) -> bool:
+    return bool(event.get("report_id") or event.get("deleted")) or event.get("status") == SessionStatus.ERROR
+
+
+@router.get(
+    "/{session_id}/events",
+    summary="События сессии практики",
+    description=(
+        "Server-sent events: сначала снимок (status, version, report_id), затем события "
+        "`status` при смене статуса и `report`, когда готов отчёт. Поток закрывается после "
+        "отчёта или ошибки; после переподключения к БД приходит новый снимок"
+    ),
+    response_class=StreamingResponse,
+    responses={200: {"content": {SSE_MEDIA_TYPE: {}}}},
+)
+async def stream_practice_session_events(
+    session_id: str,
+    session: AsyncSession = Depends(deps.get_session),
+    current_user: User = Depends(deps.get_current_user)
+) -> StreamingResponse:
+    owner_id = await session.scalar(
+        select(PracticeSession.user_id).where(PracticeSession.session_id == session_id)
+    )
+
+    if owner_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Practice session not found"
+        )
+
+    if owner_id != current_user.user_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You do not have permission to view this practice session"
+        )
+
+    return event_stream_response(
+        f"session:{session_id}",
+        lambda: _session_state(session_id),
+        _session_events_done,
+    )
+
+
+@router.get(
+    "/{session_id}/metrics",
+    response_model=list[LiveSessionMetricResponse],
+    status_code=status.HTTP_200_OK,
+    summary="Получить метрики сессии",
+    description="Получить метрики сессии практики, включая заархивированные, с фильтром по коду и времени",
+)
+async def get_practice_session_metrics(
+    session_id: str,
+    matric_code: str | None = Query(default=None, max_length=32),
+    from_ms: int | None = Query(default=None, ge=0),
+    to_ms: int | None = Query(default=None, ge=0),
+    session: AsyncSession = Depends(deps.get_session),
+    current_user: User = Depends(deps.get_current_user)
+) -> list[LiveSessionMetricResponse]:
+    owner_id = await session.scalar(
+        select(PracticeSession.user_id).where(PracticeSession.session_id == session_id)
+    )
+
+    if owner_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Practice session not found"
+        )
+
+    if owner_id != current_user.user_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You do not have permission to view this practice session"
+        )
+
+    live_query = select(
+        LiveSessionMetric.matric_code,
+        LiveSessionMetric.algo_version,
+        LiveSessionMetric.offset_ms,
+        LiveSessionMetric.window_ms,
+        LiveSessionMetric.value,
+        LiveSessionMetric.score,
+    ).where(LiveSessionMetric.session_id == session_id)
+    archived_query = select(
+        ArchivedSessionMetric.matric_code,
+        ArchivedSessionMetric.algo_version,
+        ArchivedSessionMetric.payload,
+    ).where(ArchivedSessionMetric.session_id == session_id)
+
+    if matric_code is not None:
+        live_query = live_query.where(LiveSessionMetric.matric_code == matric_code)
+        archived_query = archived_query.where(ArchivedSessionMetric.matric_code == matric_code)
+    if from_ms is not None:
+        live_query = live_query.where(LiveSessionMetric.offset_ms >= from_ms)
+        archived_query = archived_query.where(ArchivedSessionMetric.last_offset_ms >= from_ms)
+    if to_ms is not None:
+        live_query = live_query.where(LiveSessionMetric.offset_ms < to_ms)
+        archived_query = archived_query.where(ArchivedSessionMetric.first_offset_ms < to_ms)
+
+    metrics = [
+        LiveSessionMetricResponse.model_validate(row)
+        for row in (await session.execute(live_query)).all()
+    ]
+
+    archived = (await session.execute(archived_query)).all()
+    if archived:
+        # блобы распаковываются прозрачно: клиенту всё равно, где лежат строки
+        from app.jobs.metrics_archive import decode_metrics
+
+        for code, algo_version, payload in archived:
+            offsets, values, scores, windows = decode_metrics(payload)
+            for offset, value, score, window in zip(offsets.tolist(), values.tolist(), scores.tolist(), windows.tolist()):
+                if (from_ms is not None and offset < from_ms) or (to_ms is not None and offset >= to_ms):
+                    continue
+                metrics.append(LiveSessionMetricResponse(
+                    matric_code=code,
+                    algo_version=algo_version,
+                    offset_ms=offset,
+                    window_ms=window,
+                    value=value,
+                    score=score,
+                ))
+
+    metrics.sort(key=lambda m: (m.matric_code, m.algo_version, m.offset_ms))
+    return metrics
@@ -1,37 +1,57 @@
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import Float, Integer, any_, column, exists, func, literal, or_, select, true, update
+from sqlalchemy.dialects.postgresql import ARRAY, insert
 
+from collections.abc import AsyncIterator
 from pathlib import Path
-import asyncio, pretty_midi
+import asyncio, hashlib, json, struct, uuid, zlib
 
 from app.api.deps import get_session
-from app.models.models import MidiFile, SheetMusic, User
+from app.models.models import MidiFile, MidiNgramProfile, NgramFrequency, PracticeSession, SheetMusic, User
+from app.schemas.requests import MidiPartRequest
+from app.schemas.responses import MidiFileResponse, SimilarReferenceResponse
 from app.models.enums import FileStatus
 from app.api import deps
+from app.api.admission import MIDI_WORKLOAD
+from app.core import database_session
+from app.api.file_response import ZeroCopyFileResponse
+from app.api.sse import SSE_MEDIA_TYPE, event_stream_response
+from app.core.storage import REFERENCES_DIR, find_reference_file, reference_path
 
 router = APIRouter()
-UPLOAD_DIR = Path("./uploads/references")
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+# бинарные кадры: по 18 байт на ноту, little-endian (start f64, end f64, pitch i16)
+NOTES_BINARY_MEDIA_TYPE = "application/vnd.violin-teacher.notes"
+NOTE_FRAME = struct.Struct("<ddh")
+NOTES_STREAM_BATCH = 500
+
+UPLOAD_DIR = REFERENCES_DIR
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
-@router.post("/upload", response_model=dict, summary="Загрузить эталонный файл", description="Загрузить и обработать эталонный файл для произведения")
+@router.post("/upload", response_model=dict, summary="Загрузить эталонный файл", description="Загрузить и обработать эталонный файл для произведения. Оценивается одна партия: part или, если не задана, найденная автоматически партия скрипки")
 async def upload_references_inline(
     sheet_id: str,
+    part: int | None = Query(default=None, ge=0),
     file: UploadFile = File(...),
     session: AsyncSession = Depends(get_session),
     current_user: User = Depends(deps.get_current_user),
 ):
-    sweet_music = await session.scalar(select(SheetMusic).where(SheetMusic.sheet_id == sheet_id))
+    sweet_music_exists = await session.scalar(select(exists().where(SheetMusic.sheet_id == sheet_id)))
 
-    if sweet_music is None:
+    if not sweet_music_exists:
         raise HTTPException(
             status_code=404,
             detail="Sheet music not found"
         )
 
-    user_dir = UPLOAD_DIR /f"{current_user.user_id}"
-    user_dir.mkdir(parents=True, exist_ok=True)
-    dst: Path = user_dir / f"{sheet_id}.mid"
+    # файл раскладывается по префиксу id, поэтому id записи нужен до вставки
+    midi_file_id = str(uuid.uuid4())
+    dst: Path = reference_path(midi_file_id)
+    dst.parent.mkdir(parents=True, exist_ok=True)
 
     # 1) читаем и сохраняем без блокировок
     content = await file.read()
@@ -42,28 +62,358 @@ async def upload_references_inline(
 
     # 2) создаём запись
     midi = MidiFile(
+        midi_file_id=midi_file_id,
         sheet_id=sheet_id,
         uploaded_by=current_user.user_id,
         filename=f"{sheet_id}.mid",
-        status=FileStatus.PENDING
+        status=FileStatus.PENDING,
+        content_sha256=hashlib.sha256(content).hexdigest(),
     )
     session.add(midi)
     await session.commit()
 
-    # 3) парсим в том же executor
-    mid = await loop.run_in_executor(None, pretty_midi.PrettyMIDI, str(dst))
-    midi.parsed_json = {
-        "notes": [
-            {"start": n.start, "end": n.end,
-             "note": pretty_midi.note_number_to_name(n.pitch)}
-            for inst in mid.instruments for n in inst.notes
-        ]
-    }
+    # 3) парсим в пуле разбора MIDI
+    from app.analysis.difficulty import DIFFICULTY_FEATURES_VERSION
+    from app.analysis.note_index import cache_note_index
+    from app.analysis.reference import analyze_reference
+
+    try:
+        # отдельный ограниченный пул: всплеск загрузок не занимает пул по умолчанию
+        midi.parsed_json, index, features, (grams, counts) = await MIDI_WORKLOAD.run(
+            analyze_reference, dst, part
+        )
+    except HTTPException:
+        # не приняты по перегрузке: клиент повторит загрузку целиком по Retry-After
+        await session.delete(midi)
+        await session.commit()
+        await loop.run_in_executor(None, dst.unlink)
+        raise
+    except ValueError as e:
+        midi.status = FileStatus.ERROR
+        await session.commit()
+        raise HTTPException(
+            status_code=422,
+            detail=str(e)
+        )
+    for name, value in features.items():
+        setattr(midi, name, value)
+    midi.features_version = DIFFICULTY_FEATURES_VERSION
+    # n-граммы мелодии — в индекс похожих в той же транзакции
+    session.add(MidiNgramProfile(midi_file_id=midi.midi_file_id, grams=grams, counts=counts))
 
-    # 👉 формат "Начало Конец Нота"
     midi.status = FileStatus.READY
     await session.commit()
-    return {"midi_file_id": str(dst), "status": midi.status}
+    cache_note_index(midi.midi_file_id, midi.version, index)
+    return {
+        "midi_file_id": midi.midi_file_id,
+        "status": midi.status,
+        "part": midi.parsed_json["part"],
+        "parts": midi.parsed_json["parts"],
+        "features": features,
+    }
+
+
+@router.get(
+    "/{midi_file_id}/parts",
+    response_model=dict,
+    summary="Партии эталона",
+    description="Список партий MIDI файла (программа, диапазон, число нот) и индекс оцениваемой партии. Ноты не читаются",
+)
+async def get_reference_parts(
+    midi_file_id: str,
+    session: AsyncSession = Depends(get_session),
+    current_user: User = Depends(deps.get_current_user),
+):
+    midi_file = (await session.execute(
+        select(MidiFile.version, MidiFile.parsed_json["part"], MidiFile.parsed_json["parts"])
+        .where(MidiFile.midi_file_id == midi_file_id)
+    )).one_or_none()
+
+    if midi_file is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Midi file not found"
+        )
+
+    version, part, parts = midi_file
+    # у файлов, разобранных до выбора партий, parts нет: в notes все ноты файла
+    return {"version": version, "part": part, "parts": parts}
+
+
+@router.get(
+    "/{midi_file_id}/parts/{part}/notes",
+    response_model=dict,
+    summary="Ноты партии эталона",
+    description="Ноты любой партии файла, в том числе неоцениваемой (аккомпанемент). Читаются из исходного MIDI",
+)
+async def get_reference_part_notes(
+    midi_file_id: str,
+    part: int,
+    session: AsyncSession = Depends(get_session),
+    current_user: User = Depends(deps.get_current_user),
+):
+    midi_file = (await session.execute(
+        select(MidiFile.uploaded_by, MidiFile.filename).where(MidiFile.midi_file_id == midi_file_id)
+    )).one_or_none()
+
+    if midi_file is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Midi file not found"
+        )
+
+    from app.analysis.midi import parse_midi_part
+
+    loop = asyncio.get_running_loop()
+    path = await loop.run_in_executor(None, find_reference_file, midi_file_id, midi_file.uploaded_by, midi_file.filename)
+    if path is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Midi file content not found"
+        )
+
+    try:
+        return await MIDI_WORKLOAD.run(parse_midi_part, path, part)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=404,
+            detail=str(e)
+        )
+
+
+def _part_in_use() -> HTTPException:
+    return HTTPException(
+        status_code=409,
+        detail="Midi file is used by practice sessions, upload it again to score another part"
+    )
+
+
+def _has_sessions(midi_file_id: str):
+    return exists().where(PracticeSession.midi_file_id == midi_file_id)
+
+
+@router.put(
+    "/{midi_file_id}/part",
+    response_model=dict,
+    summary="Выбрать оцениваемую партию",
+    description="Переразобрать эталон с другой оцениваемой партией. Пересчитываются ноты, признаки сложности и индекс похожих; версия эталона увеличивается. Если по эталону уже есть сессии практики — 409",
+)
+async def select_reference_part(
+    midi_file_id: str,
+    part_request: MidiPartRequest,
+    session: AsyncSession = Depends(get_session),
+    current_user: User = Depends(deps.get_current_user),
+):
+    current = (await session.execute(
+        select(MidiFile.uploaded_by, MidiFile.filename, MidiFile.status, MidiFile.version)
+        .where(MidiFile.midi_file_id == midi_file_id)
+    )).one_or_none()
+
+    if current is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Midi file not found"
+        )
+
+    if current.uploaded_by != current_user.user_id:
+        raise HTTPException(
+            status_code=403,
+            detail="You do not have permission to change this file"
+        )
+
+    if current.status != FileStatus.READY or current.version != part_request.version:
+        raise HTTPException(
+            status_code=409,
+            detail="Midi file is not parsed yet or was modified concurrently"
+        )
+
+    # сессии и их метрики посчитаны по текущей партии — менять её под ними нельзя
+    if await session.scalar(select(_has_sessions(midi_file_id))):
+        raise _part_in_use()
+
+    loop = asyncio.get_running_loop()
+    path = await loop.run_in_executor(None, find_reference_file, midi_file_id, current.uploaded_by, current.filename)
+    if path is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Midi file content not found"
+        )
+    # соединение не держим, пока идёт разбор
+    await session.commit()
+
+    from app.analysis.difficulty import DIFFICULTY_FEATURES_VERSION
+    from app.analysis.note_index import cache_note_index
+    from app.analysis.reference import analyze_reference
+
+    try:
+        parsed_json, index, features, (grams, counts) = await MIDI_WORKLOAD.run(
+            analyze_reference, path, part_request.part
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=422,
+            detail=str(e)
+        )
+
+    # compare-and-swap по версии: смена версии сбрасывает кэши индекса нот
+    version = await session.scalar(
+        update(MidiFile)
+        .where(MidiFile.midi_file_id == midi_file_id, MidiFile.version == part_request.version)
+        .values(
+            parsed_json=parsed_json,
+            features_version=DIFFICULTY_FEATURES_VERSION,
+            version=MidiFile.version + 1,
+            **features,
+        )
+        .returning(MidiFile.version)
+    )
+
+    if version is None:
+        await session.rollback()
+        raise HTTPException(
+            status_code=409,
+            detail="Midi file was modified concurrently"
+        )
+
+    # повторно под блокировкой строки: сессия могла появиться, пока шёл разбор
+    # (создание сессии берёт FOR SHARE на эталон, поэтому после UPDATE новых не будет)
+    if await session.scalar(select(_has_sessions(midi_file_id))):
+        await session.rollback()
+        raise _part_in_use()
+
+    await session.execute(
+        insert(MidiNgramProfile)
+        .values(midi_file_id=midi_file_id, grams=grams, counts=counts)
+        .on_conflict_do_update(
+            index_elements=[MidiNgramProfile.midi_file_id],
+            set_={"grams": grams, "counts": counts, "updated_at": func.now()},
+        )
+    )
+    await session.commit()
+    cache_note_index(midi_file_id, version, index)
+    return {"midi_file_id": midi_file_id, "version": version, "part": parsed_json["part"], "features": features}
+
+CATALOG_SORT_COLUMNS = {
+    "difficulty": MidiFile.difficulty,
+    "notes_per_second": MidiFile.notes_per_second,
+    "pitch_range": MidiFile.pitch_range,
+    "max_position": MidiFile.max_position,
+    "polyphony_ratio": MidiFile.polyphony_ratio,
+    "tempo_bpm": MidiFile.tempo_bpm,
+    "created_at": MidiFile.created_at,
+}
+
+
+@router.get(
+    "/catalog",
+    response_model=list[MidiFileResponse],
+    summary="Каталог эталонов по сложности",
+    description="Фильтр и сортировка готовых эталонов по признакам сложности. Ноты при этом не читаются",
+)
+async def get_references_catalog(
+    min_difficulty: float | None = Query(default=None, ge=0, le=100),
+    max_difficulty: float | None = Query(default=None, ge=0, le=100),
+    max_notes_per_second: float | None = Query(default=None, gt=0),
+    max_pitch_range: int | None = Query(default=None, ge=0, le=127),
+    max_position: int | None = Query(default=None, ge=1),
+    max_polyphony_ratio: float | None = Query(default=None, ge=0, le=1),
+    sort_by: str = Query(default="difficulty", pattern="^(" + "|".join(CATALOG_SORT_COLUMNS) + ")$"),
+    descending: bool = False,
+    limit: int = Query(default=50, ge=1, le=200),
+    offset: int = Query(default=0, ge=0),
+    session: AsyncSession = Depends(get_session),
+    current_user: User = Depends(deps.get_current_user),
+):
+    query = select(MidiFile).where(MidiFile.status == FileStatus.READY, MidiFile.features_version.is_not(None))
+    if min_difficulty is not None:
+        query = query.where(MidiFile.difficulty >= min_difficulty)
+    if max_difficulty is not None:
+        query = query.where(MidiFile.difficulty <= max_difficulty)
+    if max_notes_per_second is not None:
+        query = query.where(MidiFile.notes_per_second <= max_notes_per_second)
+    if max_pitch_range is not None:
+        query = query.where(MidiFile.pitch_range <= max_pitch_range)
+    if max_position is not None:
+        query = query.where(MidiFile.max_position <= max_position)
+    if max_polyphony_ratio is not None:
+        query = query.where(MidiFile.polyphony_ratio <= max_polyphony_ratio)
+
+    column = CATALOG_SORT_COLUMNS[sort_by]
+    order = column.desc().nulls_last() if descending else column.asc().nulls_last()
+    # parsed_json отложен (deferred) и в выборку не попадает
+    midi_files = await session.scalars(
+        query.order_by(order, MidiFile.midi_file_id).limit(limit).offset(offset)
+    )
+    return [MidiFileResponse.model_validate(midi_file) for midi_file in midi_files]
+
+@router.get(
+    "/{midi_file_id}/similar",
+    response_model=list[SimilarReferenceResponse],
+    summary="Похожие эталоны",
+    description="Эталоны с общими интервальными и ритмическими n-граммами мелодии, по убыванию сходства. Не зависит от тональности и темпа; duplicate отмечает почти совпадающие файлы",
+)
+async def get_similar_references(
+    midi_file_id: str,
+    limit: int = Query(default=20, ge=1, le=100),
+    session: AsyncSession = Depends(get_session),
+    current_user: User = Depends(deps.get_current_user),
+):
+    from app.analysis.similarity import DOCUMENT_COUNT_GRAMS, idf_weights, rank_similar, seed_grams
+
+    profile = await session.get(MidiNgramProfile, midi_file_id)
+
+    if profile is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Midi file not found or not indexed yet"
+        )
+
+    if not profile.grams:
+        return []
+
+    # частоты только n-грамм запроса и шарды числа эталонов: поиск по первичному ключу
+    frequencies = dict((await session.execute(
+        select(NgramFrequency.gram, NgramFrequency.df)
+        .where(NgramFrequency.gram == any_(literal([*DOCUMENT_COUNT_GRAMS, *profile.grams], ARRAY(Integer))))
+    )).all())
+    total = sum(frequencies.pop(gram, 0) for gram in DOCUMENT_COUNT_GRAMS)
+    seeds = seed_grams(frequencies)
+    if not seeds:
+        return []
+
+    # кандидаты — через GIN-индекс по редким n-граммам, без перебора каталога
+    candidates = (await session.execute(
+        select(MidiNgramProfile.midi_file_id, MidiNgramProfile.grams, MidiNgramProfile.counts)
+        .where(
+            MidiNgramProfile.grams.overlap(literal(seeds, ARRAY(Integer))),
+            MidiNgramProfile.midi_file_id != midi_file_id,
+        )
+    )).all()
+
+    loop = asyncio.get_running_loop()
+    ranked = await loop.run_in_executor(
+        None, rank_similar, profile.grams, profile.counts, idf_weights(frequencies, total), candidates
+    )
+    ranked = ranked[:limit]
+    if not ranked:
+        return []
+
+    files = {
+        row.midi_file_id: row
+        for row in await session.execute(
+            select(MidiFile.midi_file_id, MidiFile.sheet_id, MidiFile.filename)
+            .where(MidiFile.midi_file_id.in_([item["midi_file_id"] for item in ranked]))
+        )
+    }
+    return [
+        SimilarReferenceResponse(
+            sheet_id=files[item["midi_file_id"]].sheet_id,
+            filename=files[item["midi_file_id"]].filename,
+            **item,
+        )
+        for item in ranked
+        if item["midi_file_id"] in files
+    ]
 
 @router.delete("/delete/{reference_file_id}", summary="Удалить эталонный файл", description="Удалить эталонный MIDI файл пользователя")
 async def delete_references_file(
@@ -87,13 +437,299 @@ async def delete_references_file(
         )
 
     # 2) удаляем файл неблокирующе
-    file_path = UPLOAD_DIR / str(current_user.user_id) / midi_file.filename
     loop = asyncio.get_running_loop()
     await loop.run_in_executor(
-        None, lambda: file_path.unlink(missing_ok=True)
+        None, _unlink_reference, midi_file.midi_file_id, midi_file.uploaded_by, midi_file.filename
     )
 
     # 3) удаляем запись из БД
     await session.delete(midi_file)
     await session.commit()
     return {"detail": "Reference file deleted successfully"}
+
+
+def _unlink_reference(midi_file_id: str, user_id: str, filename: str) -> None:
+    file_path = find_reference_file(midi_file_id, user_id, filename)
+    if file_path is not None:
+        file_path.unlink(missing_ok=True)
+
+
+@router.get(
+    "/{midi_file_id}/file",
+    summary="Скачать эталонный файл",
+    description="Отдать исходный MIDI файл эталона. Поддерживает Range и If-Range",
+    response_class=ZeroCopyFileResponse,
+)
+async def download_reference_file(
+    midi_file_id: str,
+    session: AsyncSession = Depends(get_session),
+    current_user: User = Depends(deps.get_current_user),
+) -> ZeroCopyFileResponse:
+    midi_file = (await session.execute(
+        select(MidiFile.uploaded_by, MidiFile.filename, SheetMusic.owner_id)
+        .join(SheetMusic, SheetMusic.sheet_id == MidiFile.sheet_id)
+        .where(MidiFile.midi_file_id == midi_file_id)
+    )).one_or_none()
+
+    if midi_file is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Midi file not found"
+        )
+
+    if current_user.user_id not in (midi_file.uploaded_by, midi_file.owner_id):
+        raise HTTPException(
+            status_code=403,
+            detail="You do not have permission to download this file"
+        )
+
+    loop = asyncio.get_running_loop()
+    path = await loop.run_in_executor(
+        None, find_reference_file, midi_file_id, midi_file.uploaded_by, midi_file.filename
+    )
+    if path is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Midi file content not found"
+        )
+
+    return ZeroCopyFileResponse(path, media_type="audio/midi", filename=midi_file.filename)
+
+
+@router.get(
+    "/{midi_file_id}/upcoming",
+    response_model=dict,
+    summary="Ближайшие ноты эталона",
+    description="Получить ноты, звучащие в момент t, и ноты, начинающиеся в окне [t, t + horizon_ms), для варианта эталона с заданным темпом и транспонированием",
+)
+async def get_upcoming_notes(
+    midi_file_id: str,
+    t_ms: int = Query(ge=0),
+    horizon_ms: int = Query(default=2000, ge=0, le=60000),
+    limit: int = Query(default=32, ge=1, le=512),
+    tempo_factor: float = Query(default=1.0, ge=0.25, le=2.0),
+    transpose: int = Query(default=0, ge=-24, le=24),
+    session: AsyncSession = Depends(get_session),
+    current_user: User = Depends(deps.get_current_user),
+):
+    version = await session.scalar(
+        select(MidiFile.version).where(
+            MidiFile.midi_file_id == midi_file_id,
+            MidiFile.status == FileStatus.READY,
+        )
+    )
+    if version is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Midi file not found"
+        )
+
+    from app.analysis.note_index import get_note_index, get_variant_index, lookup_note_index
+
+    index = lookup_note_index(midi_file_id, version)
+    if index is None:
+        parsed_json = await session.scalar(
+            select(MidiFile.parsed_json).where(MidiFile.midi_file_id == midi_file_id)
+        )
+        loop = asyncio.get_running_loop()
+        index = await loop.run_in_executor(None, get_note_index, midi_file_id, version, parsed_json)
+    index = get_variant_index(midi_file_id, version, index, tempo_factor, transpose)
+
+    t = t_ms / 1000
+    offsets, sounding = index.sounding_at([t])
+    window = index.upcoming(t, horizon_ms / 1000, limit)
+
+    def as_notes(ids) -> list[dict]:
+        return [
+            {"start": float(index.starts[i]), "end": float(index.ends[i]), "pitch": int(index.pitches[i])}
+            for i in ids
+        ]
+
+    return {
+        "sounding": as_notes(sounding.tolist()),
+        "upcoming": as_notes(range(window.start, window.stop)),
+    }
+
+
+async def _midi_file_state(midi_file_id: str) -> dict:
+    async with database_session.get_async_session() as db:
+        state = (await db.execute(
+            select(MidiFile.status, MidiFile.version).where(MidiFile.midi_file_id == midi_file_id)
+        )).one_or_none()
+    if state is None:
+        return {"deleted": True}
+    return {"status": state.status, "version": state.version}
+
+
+def _midi_file_events_done(event: dict) -> bool:
+    return bool(event.get("deleted")) or event.get("status") in (FileStatus.READY, FileStatus.ERROR)
+
+
+@router.get(
+    "/{midi_file_id}/events",
+    summary="События обработки эталона",
+    description=(
+        "Server-sent events: снимок (status, version), затем событие `status` при каждой "
+        "смене статуса разбора. Поток закрывается, когда файл готов или разбор упал"
+    ),
+    response_class=StreamingResponse,
+    responses={200: {"content": {SSE_MEDIA_TYPE: {}}}},
+)
+async def stream_reference_events(
+    midi_file_id: str,
+    session: AsyncSession = Depends(get_session),
+    current_user: User = Depends(deps.get_current_user),
+) -> StreamingResponse:
+    file_exists = await session.scalar(select(exists().where(MidiFile.midi_file_id == midi_file_id)))
+    if not file_exists:
+        raise HTTPException(
+            status_code=404,
+            detail="Midi file not found"
+        )
+
+    return event_stream_response(
+        f"midi:{midi_file_id}",
+        lambda: _midi_file_state(midi_file_id),
+        _midi_file_events_done,
+    )
+
+
+def _accepts(header: str | None, token: str) -> bool:
+    """Есть ли token в Accept/Accept-Encoding с ненулевым q."""
+    for item in (header or "").split(","):
+        value, _, params = item.strip().partition(";")
+        if value.strip().lower() != token:
+            continue
+        q = params.strip().removeprefix("q=")
+        try:
+            return float(q) > 0 if q else True
+        except ValueError:
+            return True
+    return False
+
+
+async def _stream_notes(
+    midi_file_id: str,
+    start_ms: int | None,
+    end_ms: int | None,
+    pitch_min: int | None,
+    pitch_max: int | None,
+    binary: bool,
+    gzip: bool,
+) -> AsyncIterator[bytes]:
+    # Ноты разворачиваются из JSONB на стороне Postgres и читаются
+    # серверным курсором пачками, поэтому parsed_json целиком в память не попадает.
+    # WITH ORDINALITY + ORDER BY — порядок выдачи совпадает с сохранённым (по началу).
+    elements = (
+        func.jsonb_array_elements(MidiFile.parsed_json["notes"])
+        .table_valued(column("n", JSONB), with_ordinality="ord")
+        .render_derived(name="e")
+    )
+    note_start = elements.c.n["start"].astext.cast(Float)
+    note_end = elements.c.n["end"].astext.cast(Float)
+    note_pitch = elements.c.n["pitch"].astext.cast(Integer)
+    query = (
+        select(note_start, note_end, note_pitch, elements.c.n["note"].astext)
+        .select_from(MidiFile)
+        .join(elements, true())
+        .where(MidiFile.midi_file_id == midi_file_id)
+        .order_by(elements.c.ord)
+    )
+    if start_ms is not None:
+        query = query.where(note_end > start_ms / 1000)
+    if end_ms is not None:
+        query = query.where(note_start < end_ms / 1000)
+    # у старых записей нет pitch — такие ноты фильтруются по имени уже здесь
+    if pitch_min is not None:
+        query = query.where(or_(note_pitch.is_(None), note_pitch >= pitch_min))
+    if pitch_max is not None:
+        query = query.where(or_(note_pitch.is_(None), note_pitch <= pitch_max))
+
+    compressor = zlib.compressobj(wbits=31) if gzip else None
+
+    async with database_session.get_async_session() as db:
+        result = await db.stream(query.execution_options(yield_per=NOTES_STREAM_BATCH))
+        async for rows in result.partitions():
+            notes = _with_pitch(rows, pitch_min, pitch_max)
+            if binary:
+                chunk = b"".join(NOTE_FRAME.pack(start, end, pitch) for start, end, pitch, _ in notes)
+            else:
+                chunk = "".join(
+                    json.dumps({"start": start, "end": end, "pitch": pitch, "note": name}) + "\n"
+                    for start, end, pitch, name in notes
+                ).encode()
+            if not chunk:
+                continue
+            if compressor is not None:
+                # SYNC_FLUSH, чтобы клиент мог рисовать начало партитуры сразу
+                chunk = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            yield chunk
+
+    if compressor is not None:
+        yield compressor.flush()
+
+
+def _with_pitch(rows, pitch_min: int | None, pitch_max: int | None) -> list[tuple]:
+    """Высота из имени ноты для старых записей и фильтр по ней (для остальных его сделал SQL)."""
+    notes = []
+    for start, end, pitch, name in rows:
+        if pitch is None:
+            pitch = _pitch_of(name)
+            if (pitch_min is not None and pitch < pitch_min) or (pitch_max is not None and pitch > pitch_max):
+                continue
+        notes.append((start, end, pitch, name))
+    return notes
+
+
+def _pitch_of(note_name: str) -> int:
+    # в записях до появления поля pitch есть только имя ноты
+    from app.analysis.midi import note_name_to_pitch
+
+    return note_name_to_pitch(note_name)
+
+
+@router.get(
+    "/{midi_file_id}/notes",
+    summary="Получить ноты эталона",
+    description=(
+        "Потоковая выдача нот эталона в NDJSON (по умолчанию) или в бинарных кадрах "
+        f"`{NOTES_BINARY_MEDIA_TYPE}` (start f64, end f64, pitch i16, little-endian). "
+        "Поддерживает фильтр по времени и высоте и сжатие gzip."
+    ),
+    response_class=StreamingResponse,
+)
+async def get_reference_notes(
+    midi_file_id: str,
+    request: Request,
+    start_ms: int | None = Query(default=None, ge=0),
+    end_ms: int | None = Query(default=None, ge=0),
+    pitch_min: int | None = Query(default=None, ge=0, le=127),
+    pitch_max: int | None = Query(default=None, ge=0, le=127),
+    session: AsyncSession = Depends(get_session),
+    current_user: User = Depends(deps.get_current_user),
+) -> StreamingResponse:
+    file_status = await session.scalar(
+        select(MidiFile.status).where(MidiFile.midi_file_id == midi_file_id)
+    )
+    if file_status is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Midi file not found"
+        )
+    if file_status != FileStatus.READY:
+        raise HTTPException(
+            status_code=409,
+            detail="Midi file is not parsed yet"
+        )
+
+    binary = _accepts(request.headers.get("accept"), NOTES_BINARY_MEDIA_TYPE)
+    gzip = _accepts(request.headers.get("accept-encoding"), "gzip")
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+
+    return StreamingResponse(
+        _stream_notes(midi_file_id, start_ms, end_ms, pitch_min, pitch_max, binary, gzip),
+        media_type=NOTES_BINARY_MEDIA_TYPE if binary else NDJSON_MEDIA_TYPE,
+        headers=headers,
+    )
@@ -1,16 +1,18 @@
 import sqlalchemy
-from fastapi import APIRouter, Depends, status, HTTPException
-from sqlalchemy import delete
+from fastapi import APIRouter, Depends, Query, Request, Response, status, HTTPException
+from sqlalchemy import delete, exists, func
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 
 from fastapi.security import OAuth2PasswordRequestForm
 
 
+from app.analysis.score_histogram import SCORE_BUCKETS, percentile_rank, quantile, rank_of
 from app.api import deps
-from app.models.models import SheetMusic, User
+from app.api.etag import etag_matches, list_etag, not_modified, set_cache_headers, weak_etag
+from app.models.models import MidiFile, PracticeSession, Report, SheetMusic, SheetScoreHistogram, User
 from app.schemas.requests import SheetMusicRequest
-from app.schemas.responses import SheetMusicResponse
+from app.schemas.responses import MidiFileResponse, SheetMusicResponse, SheetScoreStatsResponse
 
 router = APIRouter()
 
@@ -27,8 +29,8 @@ async def create_sheet_music(
     session: AsyncSession = Depends(deps.get_session),
     current_user: User = Depends(deps.get_current_user)
 ) -> SheetMusicResponse:
-    sheet_music = await session.scalar(select(SheetMusic).where(SheetMusic.title == sheet_music_request.title))
-    if sheet_music:
+    title_taken = await session.scalar(select(exists().where(SheetMusic.title == sheet_music_request.title)))
+    if title_taken:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Sheet music with this title already exists"
@@ -137,9 +139,21 @@ async def delete_sheet_music(
     description="Получить список всех произведений пользователя",
 )
 async def get_all_user_sheet_music(
+    request: Request,
+    response: Response,
     session: AsyncSession = Depends(deps.get_session),
     current_user: User = Depends(deps.get_current_user)
-) -> list[SheetMusicResponse]:
+) -> list[SheetMusicResponse] | Response:
+    # дешёвый агрегат вместо выборки строк: хватает, чтобы ответить 304
+    max_updated_at, count = (await session.execute(
+        select(func.max(SheetMusic.updated_at), func.count())
+        .where(SheetMusic.owner_id == current_user.user_id)
+    )).one()
+    etag = list_etag(f"sheet-music:{current_user.user_id}", max_updated_at, count)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    set_cache_headers(response, etag)
+
     sheet_music_list = await session.scalars(
         select(SheetMusic).where(SheetMusic.owner_id == current_user.user_id)
     )
@@ -160,23 +174,39 @@ async def get_all_user_sheet_music(
 )
 async def get_sheet_music(
     sheet_id: str,
+    request: Request,
+    response: Response,
     session: AsyncSession = Depends(deps.get_session),
     current_user: User = Depends(deps.get_current_user)
-) -> SheetMusicResponse:
-    sheet_music = await session.scalar(select(SheetMusic).where(SheetMusic.sheet_id == sheet_id))
+) -> SheetMusicResponse | Response:
+    meta = (await session.execute(
+        select(SheetMusic.owner_id, SheetMusic.updated_at).where(SheetMusic.sheet_id == sheet_id)
+    )).one_or_none()
 
-    if not sheet_music:
+    if not meta:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Sheet music not found"
         )
 
-    if sheet_music.owner_id != current_user.user_id:
+    if meta.owner_id != current_user.user_id:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="You do not have permission to delete this sheet music"
         )
 
+    etag = weak_etag("sheet-music", sheet_id, meta.updated_at)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    set_cache_headers(response, etag)
+
+    sheet_music = await session.scalar(select(SheetMusic).where(SheetMusic.sheet_id == sheet_id))
+    if not sheet_music:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Sheet music not found"
+        )
+
     return SheetMusicResponse(
         sheet_id=sheet_music.sheet_id,
         title=sheet_music.title,
@@ -186,5 +216,105 @@ async def get_sheet_music(
     )
 
 
+@router.get(
+    "/{sheet_id}/midi-files",
+    response_model=list[MidiFileResponse],
+    status_code=status.HTTP_200_OK,
+    summary="Получить MIDI-файлы произведения",
+    description="Получить метаданные MIDI-файлов произведения без разобранных нот",
+)
+async def get_sheet_music_midi_files(
+    sheet_id: str,
+    session: AsyncSession = Depends(deps.get_session),
+    current_user: User = Depends(deps.get_current_user)
+) -> list[MidiFileResponse]:
+    owner_id = await session.scalar(select(SheetMusic.owner_id).where(SheetMusic.sheet_id == sheet_id))
+
+    if owner_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Sheet music not found"
+        )
+
+    if owner_id != current_user.user_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You do not have permission to view this sheet music"
+        )
+
+    # parsed_json отложен (deferred) и в выборку не попадает
+    midi_files = await session.scalars(
+        select(MidiFile)
+        .where(MidiFile.sheet_id == sheet_id)
+        .order_by(MidiFile.created_at)
+    )
+    return [MidiFileResponse.model_validate(midi_file) for midi_file in midi_files]
+
+
+SCORE_QUANTILES = {"p10": 0.10, "p25": 0.25, "p50": 0.50, "p75": 0.75, "p90": 0.90}
+
+
+@router.get(
+    "/{sheet_id}/scores",
+    response_model=SheetScoreStatsResponse,
+    status_code=status.HTTP_200_OK,
+    summary="Распределение оценок по произведению",
+    description=(
+        "Перцентили оценок отчётов по произведению и место лучшего результата текущего "
+        "пользователя. Считается по заранее собранной гистограмме, а не по всем отчётам"
+    ),
+)
+async def get_sheet_music_scores(
+    sheet_id: str,
+    algo_version: int | None = Query(default=None, ge=0),
+    session: AsyncSession = Depends(deps.get_session),
+    current_user: User = Depends(deps.get_current_user)
+) -> SheetScoreStatsResponse:
+    sheet_exists = await session.scalar(select(exists().where(SheetMusic.sheet_id == sheet_id)))
+    if not sheet_exists:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Sheet music not found"
+        )
+
+    # оценки разных версий алгоритма несравнимы; по умолчанию — самая новая
+    histogram_query = select(SheetScoreHistogram.algo_version, SheetScoreHistogram.counts).where(
+        SheetScoreHistogram.sheet_id == sheet_id
+    )
+    if algo_version is not None:
+        histogram_query = histogram_query.where(SheetScoreHistogram.algo_version == algo_version)
+    histogram = (await session.execute(
+        histogram_query.order_by(SheetScoreHistogram.algo_version.desc()).limit(1)
+    )).one_or_none()
+
+    if histogram is None:
+        return SheetScoreStatsResponse(
+            sheet_id=sheet_id, algo_version=algo_version, total=0, quantiles={}, counts=[0] * SCORE_BUCKETS
+        )
+
+    counts = histogram.counts
+    best_score = await session.scalar(
+        select(func.max(Report.overall_score))
+        .join(PracticeSession, PracticeSession.session_id == Report.session_id)
+        .where(
+            Report.user_id == current_user.user_id,
+            Report.algo_version == histogram.algo_version,
+            PracticeSession.sheet_id == sheet_id,
+        )
+    )
 
+    return SheetScoreStatsResponse(
+        sheet_id=sheet_id,
+        algo_version=histogram.algo_version,
+        total=sum(counts),
+        quantiles={
+            name: round(value, 2)
+            for name, q in SCORE_QUANTILES.items()
+            if (value := quantile(counts, q)) is not None
+        },
+        counts=counts,
+        best_score=best_score,
+        percentile=round(percentile_rank(counts, float(best_score)), 2) if best_score is not None else None,
+        rank=rank_of(counts, float(best_score)) if best_score is not None else None,
+    )
 
@@ -0,0 +1,19 @@
+from fastapi import APIRouter, Depends
+
+from app.api import deps
+from app.api.admission import admission_stats
+from app.models.models import User
+
+router = APIRouter()
+
+
+@router.get(
+    "/admission",
+    response_model=dict,
+    summary="Состояние контроля допуска",
+    description="Для каждой тяжёлой нагрузки (midi, auth): размер пула, очередь, число принятых и отклонённых запросов, ожидание в очереди. Счётчики — по текущему процессу воркера",
+)
+async def get_admission_stats(
+    current_user: User = Depends(deps.get_current_admin),
+):
+    return admission_stats()
@@ -1,12 +1,25 @@
-from fastapi import APIRouter, Depends, status
-from sqlalchemy import delete
+from datetime import date
+
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.analysis.metric_config import (
+    invalidate_user_metric_config,
+    resolve_metric_config,
+    resolve_stored_metric_config,
+)
 from app.api import deps
+from app.api.admission import AUTH_WORKLOAD
+from app.api.history_export import EXPORT_FORMATS, EXPORT_TABLES, stream_archive, stream_table
 from app.core.security.password import get_password_hash
-from app.models.models import User
-from app.schemas.requests import UserUpdatePasswordRequest
-from app.schemas.responses import UserResponse
+from app.jobs.account_purge import purge_user
+from app.models.models import RefreshToken, User, UserMetricPref
+from app.schemas.requests import UserMetricPrefRequest, UserUpdatePasswordRequest
+from app.schemas.responses import UserMetricPrefResponse, UserResponse
 
 router = APIRouter()
 
@@ -29,12 +42,22 @@ async def read_current_user(
     description="Удалить аккаунт текущего авторизованного пользователя",
 )
 async def delete_current_user(
+    background_tasks: BackgroundTasks,
     current_user: User = Depends(deps.get_current_user),
     session: AsyncSession = Depends(deps.get_session),
 ) -> None:
-    await session.execute(delete(User).where(User.user_id == current_user.user_id))
+    # Помечаем аккаунт удалённым и отзываем токены сразу, а зависимые данные
+    # вычищаются порциями в фоне (см. app.jobs.account_purge).
+    await session.execute(
+        update(User).where(User.user_id == current_user.user_id).values(deleted_at=func.now())
+    )
+    await session.execute(
+        update(RefreshToken).where(RefreshToken.user_id == current_user.user_id).values(used=True)
+    )
     await session.commit()
 
+    background_tasks.add_task(purge_user, current_user.user_id)
+
 @router.post(
     "/reset-password",
     status_code=status.HTTP_204_NO_CONTENT,
@@ -46,6 +69,98 @@ async def reset_current_user_password(
     session: AsyncSession = Depends(deps.get_session),
     current_user: User = Depends(deps.get_current_user),
 ) -> None:
-    current_user.hashed_password = get_password_hash(user_update_password.password)
+    current_user.hashed_password = await AUTH_WORKLOAD.run(get_password_hash, user_update_password.password)
     session.add(current_user)
-    await session.commit()
\ No newline at end of file
+    await session.commit()
+
+
+@router.get(
+    "/me/metric-pref",
+    response_model=UserMetricPrefResponse,
+    summary="Получить настройки метрик",
+    description="Получить настройки метрик пользователя по умолчанию и итоговую конфигурацию с учётом умолчаний сервера",
+)
+async def read_current_user_metric_pref(
+    session: AsyncSession = Depends(deps.get_session),
+    current_user: User = Depends(deps.get_current_user),
+) -> UserMetricPrefResponse:
+    metric_pref = await session.scalar(
+        select(UserMetricPref.metric_pref).where(UserMetricPref.user_id == current_user.user_id)
+    ) or {}
+    return UserMetricPrefResponse(
+        metric_pref=metric_pref,
+        effective=resolve_stored_metric_config(metric_pref, None, f"user {current_user.user_id}").model_dump(),
+    )
+
+
+@router.put(
+    "/me/metric-pref",
+    response_model=UserMetricPrefResponse,
+    summary="Изменить настройки метрик",
+    description="Заменить настройки метрик пользователя по умолчанию",
+)
+async def update_current_user_metric_pref(
+    metric_pref_request: UserMetricPrefRequest,
+    session: AsyncSession = Depends(deps.get_session),
+    current_user: User = Depends(deps.get_current_user),
+) -> UserMetricPrefResponse:
+    try:
+        effective = resolve_metric_config(metric_pref_request.metric_pref, None)
+    except ValidationError as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=e.errors(include_url=False, include_context=False),
+        )
+
+    await session.execute(
+        insert(UserMetricPref)
+        .values(user_id=current_user.user_id, metric_pref=metric_pref_request.metric_pref)
+        .on_conflict_do_update(
+            index_elements=[UserMetricPref.user_id],
+            set_={"metric_pref": metric_pref_request.metric_pref, "updated_at": func.now()},
+        )
+    )
+    await session.commit()
+    invalidate_user_metric_config(current_user.user_id)
+
+    return UserMetricPrefResponse(
+        metric_pref=metric_pref_request.metric_pref,
+        effective=effective.model_dump(),
+    )
+
+
+@router.get(
+    "/me/export",
+    summary="Выгрузить историю занятий",
+    description=(
+        "Потоковая выгрузка одной таблицы истории (sessions, reports, metrics) в CSV или NDJSON, "
+        "либо zip-архив со всеми таблицами (archive=true). В архиве метрики можно получить "
+        "по столбцам: по .npz на каждую сессию и метрику (columnar_metrics=true)"
+    ),
+    response_class=StreamingResponse,
+)
+async def export_current_user_history(
+    table: str = Query(default="sessions", pattern="^(" + "|".join(EXPORT_TABLES) + ")$"),
+    format: str = Query(default="ndjson", pattern="^(" + "|".join(EXPORT_FORMATS) + ")$"),
+    archive: bool = False,
+    columnar_metrics: bool = False,
+    current_user: User = Depends(deps.get_current_user),
+) -> StreamingResponse:
+    if columnar_metrics and not archive:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Columnar metrics are only available in an archive"
+        )
+
+    filename = f"history-{date.today().isoformat()}"
+    if archive:
+        return StreamingResponse(
+            stream_archive(current_user.user_id, format, columnar_metrics),
+            media_type="application/zip",
+            headers={"Content-Disposition": f'attachment; filename="{filename}.zip"'},
+        )
+    return StreamingResponse(
+        stream_table(current_user.user_id, table, format),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}-{table}.{format}"'},
+    )
@@ -0,0 +1,44 @@
+import hashlib
+from datetime import datetime
+
+from fastapi import Request, Response, status
+
+# Ответ зависит от пользователя, поэтому только private-кэш и обязательная
+# ревалидация через If-None-Match.
+CACHE_CONTROL = "private, no-cache"
+
+
+def weak_etag(*parts: object) -> str:
+    raw = "|".join(p.isoformat() if isinstance(p, datetime) else str(p) for p in parts)
+    return 'W/"%s"' % hashlib.blake2b(raw.encode(), digest_size=12).hexdigest()
+
+
+def list_etag(scope: str, max_updated_at: datetime | None, count: int) -> str:
+    return weak_etag(scope, max_updated_at, count)
+
+
+def _strip_weak(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Слабое сравнение по RFC 9110: префикс W/ не учитывается."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    current = _strip_weak(etag)
+    return any(_strip_weak(tag) == current for tag in header.split(","))
+
+
+def set_cache_headers(response: Response, etag: str) -> None:
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
+
+
+def not_modified(etag: str) -> Response:
+    response = Response(status_code=status.HTTP_304_NOT_MODIFIED)
+    set_cache_headers(response, etag)
+    return response
@@ -0,0 +1,72 @@
+import os
+import re
+
+from starlette.responses import FileResponse
+from starlette.types import Receive, Scope, Send
+
+_SINGLE_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class ZeroCopyFileResponse(FileResponse):
+    """FileResponse, который отдаёт файл без копирования в память воркера.
+
+    Если ASGI-сервер поддерживает расширение http.response.zerocopysend
+    (sendfile) или http.response.pathsend, тело передаётся ядром/сервером.
+    Иначе, а также для If-Range, multipart-диапазонов и HEAD работает
+    обычный FileResponse: Range/If-Range и чтение кусками по 64 КБ.
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        extensions = scope.get("extensions") or {}
+        headers = dict((k.decode("latin-1"), v.decode("latin-1")) for k, v in scope.get("headers", []))
+        http_range = headers.get("range")
+
+        if (
+            scope.get("method", "GET").upper() != "GET"
+            or "if-range" in headers
+            or not ({"http.response.zerocopysend", "http.response.pathsend"} & extensions.keys())
+        ):
+            return await super().__call__(scope, receive, send)
+
+        stat_result = self.stat_result or os.stat(self.path)
+        self.set_stat_headers(stat_result)
+        size = stat_result.st_size
+
+        if http_range is None:
+            start, end = 0, size
+        else:
+            match = _SINGLE_RANGE.match(http_range.strip())
+            if match is None or "http.response.zerocopysend" not in extensions:
+                return await super().__call__(scope, receive, send)
+            first, last = match.groups()
+            if first:
+                start, end = int(first), min(int(last) + 1, size) if last else size
+            elif last:
+                start, end = max(size - int(last), 0), size
+            else:
+                return await super().__call__(scope, receive, send)
+            if start >= end:
+                return await super().__call__(scope, receive, send)
+
+        if http_range is None and "http.response.pathsend" in extensions:
+            await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+            await send({"type": "http.response.pathsend", "path": os.fspath(self.path)})
+        else:
+            status_code = self.status_code
+            if http_range is not None:
+                status_code = 206
+                self.headers["content-range"] = f"bytes {start}-{end - 1}/{size}"
+            self.headers["content-length"] = str(end - start)
+
+            with open(self.path, "rb") as file:
+                await send({"type": "http.response.start", "status": status_code, "headers": self.raw_headers})
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": file.fileno(),
+                    "offset": start,
+                    "count": end - start,
+                    "more_body": False,
+                })
+
+        if self.background is not None:
+            await self.background()
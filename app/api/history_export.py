@@ -0,0 +1,255 @@
+"""Потоковая выгрузка истории занятий пользователя: сессии, отчёты, метрики.
+
+Каждая таблица читается серверным курсором пачками по EXPORT_BATCH_SIZE строк
+и сразу кодируется в CSV или NDJSON, поэтому память не зависит от объёма
+истории. Архив — zip, который пишется в поток по мере чтения (без seek,
+с data descriptor), по файлу на таблицу. В архиве метрики можно выгрузить и
+по столбцам: по .npz (offset_ms, window_ms, value, score) на каждую
+(сессия, метрика, версия алгоритма) — читается numpy/pandas без разбора CSV.
+"""
+import csv
+import io
+import json
+import zipfile
+from collections.abc import AsyncIterator, Callable
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core import database_session
+from app.models.models import ArchivedSessionMetric, LiveSessionMetric, PracticeSession, Report
+
+EXPORT_TABLES = ("sessions", "reports", "metrics")
+EXPORT_FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+EXPORT_BATCH_SIZE = 2000
+# блобы архива метрик крупные: читаем их по несколько штук
+ARCHIVED_BATCH_SIZE = 20
+
+SESSION_COLUMNS = (
+    PracticeSession.session_id,
+    PracticeSession.sheet_id,
+    PracticeSession.midi_file_id,
+    PracticeSession.status,
+    PracticeSession.start_at,
+    PracticeSession.end_at,
+    PracticeSession.tempo_factor,
+    PracticeSession.transpose,
+    PracticeSession.audio_url,
+    PracticeSession.created_at,
+)
+REPORT_COLUMNS = (
+    Report.report_id,
+    Report.session_id,
+    Report.overall_score,
+    Report.algo_version,
+    Report.summary,
+    Report.created_at,
+)
+METRIC_FIELDS = ("session_id", "matric_code", "algo_version", "offset_ms", "window_ms", "value", "score")
+
+Rows = list[tuple]
+
+
+async def _stream_rows(db: AsyncSession, query, batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[Rows]:
+    result = await db.stream(query.execution_options(yield_per=batch_size))
+    async for rows in result.partitions():
+        yield [tuple(row) for row in rows]
+
+
+def _sessions(db: AsyncSession, user_id: str) -> AsyncIterator[Rows]:
+    return _stream_rows(db, select(*SESSION_COLUMNS).where(PracticeSession.user_id == user_id)
+                        .order_by(PracticeSession.created_at, PracticeSession.session_id))
+
+
+def _reports(db: AsyncSession, user_id: str) -> AsyncIterator[Rows]:
+    return _stream_rows(db, select(*REPORT_COLUMNS).where(Report.user_id == user_id)
+                        .order_by(Report.created_at, Report.report_id))
+
+
+def _live_metrics_query(user_id: str):
+    return (
+        select(
+            LiveSessionMetric.session_id,
+            LiveSessionMetric.matric_code,
+            LiveSessionMetric.algo_version,
+            LiveSessionMetric.offset_ms,
+            LiveSessionMetric.window_ms,
+            LiveSessionMetric.value,
+            LiveSessionMetric.score,
+        )
+        .join(PracticeSession, PracticeSession.session_id == LiveSessionMetric.session_id)
+        .where(PracticeSession.user_id == user_id)
+        .order_by(
+            LiveSessionMetric.session_id,
+            LiveSessionMetric.matric_code,
+            LiveSessionMetric.algo_version,
+            LiveSessionMetric.offset_ms,
+        )
+    )
+
+
+async def _archived_metrics(db: AsyncSession, user_id: str) -> AsyncIterator[tuple[tuple, tuple]]:
+    """((session_id, matric_code, algo_version), (offset_ms, value, score, window_ms)) по блобу."""
+    from app.jobs.metrics_archive import decode_metrics
+
+    query = (
+        select(
+            ArchivedSessionMetric.session_id,
+            ArchivedSessionMetric.matric_code,
+            ArchivedSessionMetric.algo_version,
+            ArchivedSessionMetric.payload,
+        )
+        .join(PracticeSession, PracticeSession.session_id == ArchivedSessionMetric.session_id)
+        .where(PracticeSession.user_id == user_id)
+        .order_by(ArchivedSessionMetric.session_id, ArchivedSessionMetric.matric_code, ArchivedSessionMetric.algo_version)
+    )
+    async for rows in _stream_rows(db, query, ARCHIVED_BATCH_SIZE):
+        for session_id, code, algo_version, payload in rows:
+            yield (session_id, code, algo_version), decode_metrics(payload)
+
+
+async def _metrics(db: AsyncSession, user_id: str) -> AsyncIterator[Rows]:
+    async for rows in _stream_rows(db, _live_metrics_query(user_id)):
+        yield rows
+    async for key, (offsets, values, scores, windows) in _archived_metrics(db, user_id):
+        for start in range(0, offsets.size, EXPORT_BATCH_SIZE):
+            part = slice(start, start + EXPORT_BATCH_SIZE)
+            yield [
+                (*key, offset, window, value, score)
+                for offset, window, value, score in zip(
+                    offsets[part].tolist(), windows[part].tolist(), values[part].tolist(), scores[part].tolist()
+                )
+            ]
+
+
+TABLES: dict[str, tuple[tuple[str, ...], Callable[[AsyncSession, str], AsyncIterator[Rows]]]] = {
+    "sessions": (tuple(column.key for column in SESSION_COLUMNS), _sessions),
+    "reports": (tuple(column.key for column in REPORT_COLUMNS), _reports),
+    "metrics": (METRIC_FIELDS, _metrics),
+}
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _csv_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+async def encode_table(rows: AsyncIterator[Rows], fields: tuple[str, ...], fmt: str) -> AsyncIterator[bytes]:
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(fields)
+        async for batch in rows:
+            writer.writerows([_csv_value(value) for value in row] for row in batch)
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode()
+    else:
+        async for batch in rows:
+            yield "".join(
+                json.dumps(dict(zip(fields, row)), default=_json_default, ensure_ascii=False) + "\n"
+                for row in batch
+            ).encode()
+
+
+async def stream_table(user_id: str, table: str, fmt: str) -> AsyncIterator[bytes]:
+    fields, rows = TABLES[table]
+    async with database_session.get_async_session() as db:
+        async for chunk in encode_table(rows(db, user_id), fields, fmt):
+            yield chunk
+
+
+def _npz(offsets, windows, values, scores) -> bytes:
+    # numpy нужен только колоночному архиву, не грузим его при старте приложения
+    import numpy as np
+
+    buffer = io.BytesIO()
+    np.savez_compressed(
+        buffer,
+        offset_ms=np.asarray(offsets, dtype=np.int64),
+        window_ms=np.asarray(windows, dtype=np.int32),
+        value=np.asarray(values, dtype=np.float64),
+        score=np.asarray(scores, dtype=np.float64),
+    )
+    return buffer.getvalue()
+
+
+async def _columnar_metrics(db: AsyncSession, user_id: str) -> AsyncIterator[tuple[str, bytes]]:
+    """(имя файла, .npz) на каждую (сессия, метрика, версия); в памяти — одна такая группа."""
+    def name(key: tuple) -> str:
+        session_id, code, algo_version = key
+        return f"metrics/{session_id}/{code}-v{algo_version}.npz"
+
+    key, columns = None, ([], [], [], [])
+    async for rows in _stream_rows(db, _live_metrics_query(user_id)):
+        for session_id, code, algo_version, offset, window, value, score in rows:
+            if (session_id, code, algo_version) != key:
+                if key is not None:
+                    yield name(key), _npz(*columns)
+                key, columns = (session_id, code, algo_version), ([], [], [], [])
+            columns[0].append(offset)
+            columns[1].append(window)
+            columns[2].append(float(value))
+            columns[3].append(float(score))
+    if key is not None:
+        yield name(key), _npz(*columns)
+
+    async for key, (offsets, values, scores, windows) in _archived_metrics(db, user_id):
+        # архивные и живые строки одной сессии не пересекаются: архивируются только завершённые
+        yield name(key), _npz(offsets, windows, values, scores)
+
+
+class _ZipSink:
+    """Несмещаемый (unseekable) приёмник для ZipFile: отдаём записанное по мере готовности."""
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+async def stream_archive(user_id: str, fmt: str, columnar_metrics: bool) -> AsyncIterator[bytes]:
+    sink = _ZipSink()
+    async with database_session.get_async_session() as db:
+        with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            for table, (fields, rows) in TABLES.items():
+                if table == "metrics" and columnar_metrics:
+                    async for name, data in _columnar_metrics(db, user_id):
+                        # .npz уже сжат
+                        archive.writestr(name, data, compress_type=zipfile.ZIP_STORED)
+                        if chunk := sink.drain():
+                            yield chunk
+                    continue
+                with archive.open(f"{table}.{fmt}", "w", force_zip64=True) as member:
+                    async for data in encode_table(rows(db, user_id), fields, fmt):
+                        member.write(data)
+                        # deflate буферизует: пустые порции не отправляем
+                        if chunk := sink.drain():
+                            yield chunk
+        # хвост последнего файла и центральный каталог
+        yield sink.drain()
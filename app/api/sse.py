@@ -0,0 +1,66 @@
+import asyncio
+import json
+from collections.abc import AsyncIterator, Awaitable, Callable
+
+from fastapi.responses import StreamingResponse
+
+from app.core.events import get_event_hub
+
+SSE_MEDIA_TYPE = "text/event-stream"
+# комментарий раз в 15 с не даёт прокси закрыть «молчащее» соединение
+SSE_HEARTBEAT_S = 15.0
+# клиент переподключается через 3 с после обрыва
+SSE_RETRY_MS = 3000
+LISTEN_WAIT_S = 5.0
+
+
+def sse_message(event: str, data: dict) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n".encode()
+
+
+async def _event_stream(
+    topic: str,
+    snapshot: Callable[[], Awaitable[dict]],
+    is_final: Callable[[dict], bool],
+) -> AsyncIterator[bytes]:
+    hub = get_event_hub()
+    # подписка до чтения снимка: изменение между ними придёт событием
+    async with hub.subscribe(topic) as queue:
+        await hub.wait_connected(LISTEN_WAIT_S)
+        yield f"retry: {SSE_RETRY_MS}\n\n".encode()
+
+        state = await snapshot()
+        yield sse_message("snapshot", state)
+        if is_final(state):
+            return
+
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), SSE_HEARTBEAT_S)
+            except TimeoutError:
+                yield b": ping\n\n"
+                continue
+            if event.get("event") == "resync":
+                # уведомления могли потеряться — отдаём свежий снимок
+                event = state = await snapshot()
+                yield sse_message("snapshot", state)
+            else:
+                # событие общее для всех подписчиков топика — не мутируем его
+                yield sse_message(
+                    event.get("event", "message"), {k: v for k, v in event.items() if k != "event"}
+                )
+            if is_final(event):
+                return
+
+
+def event_stream_response(
+    topic: str,
+    snapshot: Callable[[], Awaitable[dict]],
+    is_final: Callable[[dict], bool] = lambda _: False,
+) -> StreamingResponse:
+    """SSE-ответ: снимок состояния, затем события топика до финального."""
+    return StreamingResponse(
+        _event_stream(topic, snapshot, is_final),
+        media_type=SSE_MEDIA_TYPE,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -20,9 +20,32 @@ def new_async_engine(uri: URL) -> AsyncEngine:
     )
 
 
-_ASYNC_ENGINE = new_async_engine(get_settings().sqlalchemy_database_uri)
-_ASYNC_SESSIONMAKER = async_sessionmaker(_ASYNC_ENGINE, expire_on_commit=False)
+# Engine создаётся лениво в процессе воркера (lifespan или первый запрос),
+# чтобы при pre-fork пул соединений не разделялся между процессами.
+_ASYNC_ENGINE: AsyncEngine | None = None
+_ASYNC_SESSIONMAKER: async_sessionmaker[AsyncSession] | None = None
+
+
+def init_async_engine() -> AsyncEngine:
+    global _ASYNC_ENGINE, _ASYNC_SESSIONMAKER
+
+    if _ASYNC_ENGINE is None:
+        _ASYNC_ENGINE = new_async_engine(get_settings().sqlalchemy_database_uri)
+        _ASYNC_SESSIONMAKER = async_sessionmaker(_ASYNC_ENGINE, expire_on_commit=False)
+    return _ASYNC_ENGINE
+
+
+async def dispose_async_engine() -> None:
+    global _ASYNC_ENGINE, _ASYNC_SESSIONMAKER
+
+    if _ASYNC_ENGINE is not None:
+        await _ASYNC_ENGINE.dispose()
+    _ASYNC_ENGINE = None
+    _ASYNC_SESSIONMAKER = None
 
 
 def get_async_session() -> AsyncSession:  # pragma: no cover
-    return _ASYNC_SESSIONMAKER()
\ No newline at end of file
+    if _ASYNC_SESSIONMAKER is None:
+        init_async_engine()
+    assert _ASYNC_SESSIONMAKER is not None
+    return _ASYNC_SESSIONMAKER()
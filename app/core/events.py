@@ -0,0 +1,159 @@
+"""Рассылка событий из Postgres LISTEN/NOTIFY подписчикам внутри воркера.
+
+Триггеры БД (миграция add_event_notify_triggers) шлют в канал
+EVENTS_CHANNEL JSON вида {"topic": "session:<id>", "event": ..., ...}.
+Каждый воркер держит одно выделенное соединение с LISTEN и раскладывает
+уведомления по очередям подписчиков своего топика, так что тысяча открытых
+SSE-потоков стоит одного соединения с БД, а не тысячи опросов.
+
+После переподключения подписчики получают событие "resync": уведомления,
+пришедшие во время обрыва, потеряны, и клиент должен перечитать состояние.
+"""
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
+import asyncpg
+
+from app.core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+EVENTS_CHANNEL = "app_events"
+SUBSCRIBER_QUEUE_SIZE = 64
+RECONNECT_DELAY_S = 1.0
+RECONNECT_MAX_DELAY_S = 30.0
+# обрыв без FIN не закрывает сокет — проверяем соединение сами
+KEEPALIVE_INTERVAL_S = 30.0
+
+RESYNC_EVENT = {"event": "resync"}
+
+
+class EventHub:
+    def __init__(self, channel: str = EVENTS_CHANNEL):
+        self.channel = channel
+        self._subscribers: dict[str, set[asyncio.Queue]] = defaultdict(set)
+        self._task: asyncio.Task | None = None
+        self._connected = asyncio.Event()
+
+    def _ensure_started(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="event-hub")
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    @asynccontextmanager
+    async def subscribe(self, topic: str) -> AsyncIterator[asyncio.Queue]:
+        """Очередь событий топика на время контекста; LISTEN поднимается при первой подписке."""
+        self._ensure_started()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers[topic].add(queue)
+        try:
+            yield queue
+        finally:
+            subscribers = self._subscribers.get(topic)
+            if subscribers is not None:
+                subscribers.discard(queue)
+                if not subscribers:
+                    del self._subscribers[topic]
+
+    async def wait_connected(self, timeout: float) -> bool:
+        try:
+            await asyncio.wait_for(self._connected.wait(), timeout)
+        except TimeoutError:
+            return False
+        return True
+
+    def publish(self, topic: str, event: dict) -> None:
+        for queue in self._subscribers.get(topic, ()):
+            if queue.full():
+                # медленный клиент теряет старые события, а не тормозит остальных
+                queue.get_nowait()
+                queue.put_nowait({**event, "lagged": True})
+            else:
+                queue.put_nowait(event)
+
+    def _broadcast(self, event: dict) -> None:
+        for topic in list(self._subscribers):
+            self.publish(topic, event)
+
+    def _on_notify(self, connection, pid, channel, payload: str) -> None:
+        try:
+            event = json.loads(payload)
+            topic = event.pop("topic")
+        except (ValueError, KeyError):
+            logger.warning("malformed notification on %s: %r", channel, payload)
+            return
+        self.publish(topic, event)
+
+    async def _connect(self) -> asyncpg.Connection:
+        db = get_settings().database
+        return await asyncpg.connect(
+            host=db.hostname,
+            port=db.port,
+            user=db.username,
+            password=db.password.get_secret_value(),
+            database=db.db,
+        )
+
+    async def _run(self) -> None:
+        delay = RECONNECT_DELAY_S
+        reconnect = False
+        while True:
+            connection = None
+            try:
+                connection = await self._connect()
+                lost = asyncio.Event()
+                connection.add_termination_listener(lambda _: lost.set())
+                await connection.add_listener(self.channel, self._on_notify)
+                self._connected.set()
+                if reconnect:
+                    self._broadcast(RESYNC_EVENT)
+                delay = RECONNECT_DELAY_S
+                while not lost.is_set():
+                    try:
+                        await asyncio.wait_for(lost.wait(), KEEPALIVE_INTERVAL_S)
+                    except TimeoutError:
+                        await connection.execute("SELECT 1", timeout=KEEPALIVE_INTERVAL_S)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("event listener connection failed, retrying in %.1fs", delay)
+            finally:
+                self._connected.clear()
+                if connection is not None and not connection.is_closed():
+                    await connection.close()
+
+            reconnect = True
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RECONNECT_MAX_DELAY_S)
+
+
+_EVENT_HUB: EventHub | None = None
+
+
+def get_event_hub() -> EventHub:
+    # создаётся в процессе воркера, как и engine
+    global _EVENT_HUB
+
+    if _EVENT_HUB is None:
+        _EVENT_HUB = EventHub()
+    return _EVENT_HUB
+
+
+async def close_event_hub() -> None:
+    global _EVENT_HUB
+
+    if _EVENT_HUB is not None:
+        await _EVENT_HUB.close()
+    _EVENT_HUB = None
@@ -1,3 +1,5 @@
+from functools import lru_cache
+
 import bcrypt
 
 from app.core.config import get_settings
@@ -13,4 +15,7 @@ def get_password_hash(password: str) -> str:
         bcrypt.gensalt(get_settings().security.password_bcrypt_rounds),
     ).decode()
 
-DUMMY_PASSWORD = get_password_hash("")
\ No newline at end of file
+@lru_cache(maxsize=1)
+def get_dummy_password() -> str:
+    # считается один раз на процесс: в lifespan или при первом неудачном входе
+    return get_password_hash("")
@@ -0,0 +1,90 @@
+import fcntl
+import os
+from pathlib import Path
+
+UPLOAD_ROOT = Path("./uploads")
+REFERENCES_DIR = UPLOAD_ROOT / "references"
+SESSION_AUDIO_DIR = UPLOAD_ROOT / "sessions"
+INCOMING_DIR = UPLOAD_ROOT / "incoming"
+# производные артефакты анализа; можно удалить целиком, всё пересчитается
+FEATURE_CACHE_DIR = Path("./cache/features")
+
+
+def sharded_path(base: Path, object_id: str, suffix: str) -> Path:
+    """base/ab/cd/abcd....suffix — два уровня по префиксу id.
+
+    UUID распределены равномерно, поэтому в каждом каталоге остаётся
+    порядка N / 65536 файлов вместо одного каталога на миллионы записей.
+    """
+    key = object_id.replace("-", "")
+    return base / key[:2] / key[2:4] / f"{object_id}{suffix}"
+
+
+def reference_path(midi_file_id: str) -> Path:
+    return sharded_path(REFERENCES_DIR, midi_file_id, ".mid")
+
+
+def legacy_reference_path(user_id: str, filename: str) -> Path:
+    # раскладка до шардирования: references/<user_id>/<sheet_id>.mid
+    return REFERENCES_DIR / user_id / filename
+
+
+def find_reference_file(midi_file_id: str, user_id: str, filename: str) -> Path | None:
+    for path in (reference_path(midi_file_id), legacy_reference_path(user_id, filename)):
+        if path.is_file():
+            return path
+    return None
+
+
+def session_audio_path(session_id: str, suffix: str) -> Path:
+    return sharded_path(SESSION_AUDIO_DIR, session_id, suffix)
+
+
+def audio_upload_part_path(upload_id: str) -> Path:
+    return sharded_path(INCOMING_DIR, upload_id, ".part")
+
+
+def open_locked_part(path: Path) -> int | None:
+    """Открыть .part загрузки с эксклюзивным flock; None — файл занят или уже опубликован.
+
+    Лок держится, пока открыт дескриптор, и не занимает соединение с БД на
+    время передачи. После захвата проверяем, что по пути лежит тот же файл:
+    finalize или очистка могли убрать его, пока мы ждали.
+    """
+    try:
+        fd = os.open(path, os.O_RDWR)
+    except FileNotFoundError:
+        return None
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        if os.fstat(fd).st_ino != os.stat(path).st_ino:
+            raise FileNotFoundError(path)
+    except (BlockingIOError, FileNotFoundError):
+        os.close(fd)
+        return None
+    return fd
+
+
+def resolve_upload(path: str) -> Path | None:
+    """Путь внутри UPLOAD_ROOT или None — чужие пути с сервера не отдаём."""
+    resolved = Path(path.removeprefix("file://")).resolve()
+    if not resolved.is_relative_to(UPLOAD_ROOT.resolve()) or not resolved.is_file():
+        return None
+    return resolved
+
+
+def session_audio_file(session_id: str, audio_url: str) -> Path | None:
+    """Запись сессии, только если audio_url указывает на её собственный файл.
+
+    Старые audio_url задавал клиент: путь к чужой записи или эталону внутри
+    UPLOAD_ROOT не должен ни отдаваться, ни удаляться через эту сессию.
+    """
+    path = resolve_upload(audio_url)
+    if path is None or path != session_audio_path(session_id, path.suffix).resolve():
+        return None
+    return path
+
+
+def user_upload_dirs(user_id: str) -> list[Path]:
+    """Каталоги старой раскладки, принадлежащие пользователю целиком."""
+    return [REFERENCES_DIR / user_id]
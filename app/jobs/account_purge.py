@@ -0,0 +1,255 @@
+"""Фоновое удаление данных аккаунта порциями с контрольными точками.
+
+Пользователь сначала только помечается (users.deleted_at), затем этот
+воркер удаляет зависимые строки батчами по PURGE_BATCH_SIZE, каждый батч —
+отдельная короткая транзакция. После каждого этапа в users.purge_stage
+пишется завершённый этап, так что после падения работа продолжается с
+него, а не с начала. Сами батчи идемпотентны.
+
+Удаляется только история самого пользователя. Если по его произведениям
+или эталонам есть сессии других пользователей, удаление откладывается
+целиком — чужая история не удаляется, как и задумано ON DELETE RESTRICT;
+следующий проход проверит снова.
+
+    python -m app.jobs.account_purge           # один проход по ожидающим
+    python -m app.jobs.account_purge --forever # опрос каждые --interval секунд
+"""
+import argparse
+import asyncio
+import logging
+import shutil
+
+from sqlalchemy import delete, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core import database_session
+from app.core.storage import audio_upload_part_path, find_reference_file, session_audio_file, user_upload_dirs
+from app.models.models import (
+    LiveSessionMetric,
+    Material,
+    MidiFile,
+    PracticeSession,
+    Report,
+    SessionAudioUpload,
+    SheetMusic,
+    User,
+)
+
+logger = logging.getLogger(__name__)
+
+PURGE_BATCH_SIZE = 1000
+# пауза между батчами, чтобы не забивать WAL и реплики одним всплеском
+PURGE_BATCH_PAUSE_S = 0.05
+
+PURGE_STAGES = (
+    "live_session_metrics",
+    "reports",
+    "practice_sessions",
+    "midi_files",
+    "sheet_music",
+    "materials",
+    "files",
+    "user",
+)
+
+
+def _owned_sheets(user_id: str):
+    return select(SheetMusic.sheet_id).where(SheetMusic.owner_id == user_id)
+
+
+def _purged_midi_files(user_id: str):
+    return select(MidiFile.midi_file_id).where(
+        or_(MidiFile.uploaded_by == user_id, MidiFile.sheet_id.in_(_owned_sheets(user_id)))
+    )
+
+
+def _purged_sessions(user_id: str):
+    return select(PracticeSession.session_id).where(PracticeSession.user_id == user_id)
+
+
+def _foreign_sessions(user_id: str):
+    """Сессии других пользователей по произведениям и эталонам удаляемого."""
+    return select(PracticeSession.session_id).where(
+        PracticeSession.user_id != user_id,
+        or_(
+            PracticeSession.sheet_id.in_(_owned_sheets(user_id)),
+            PracticeSession.midi_file_id.in_(_purged_midi_files(user_id)),
+        ),
+    )
+
+
+async def _delete_in_batches(session: AsyncSession, model, pk, where) -> int:
+    total = 0
+    while True:
+        batch = select(pk).where(where).limit(PURGE_BATCH_SIZE).scalar_subquery()
+        result = await session.execute(
+            delete(model).where(pk.in_(batch)).execution_options(synchronize_session=False)
+        )
+        await session.commit()
+        total += result.rowcount
+        if result.rowcount < PURGE_BATCH_SIZE:
+            return total
+        await asyncio.sleep(PURGE_BATCH_PAUSE_S)
+
+
+def _unlink_files(paths: list) -> None:
+    for path in paths:
+        if path is not None:
+            path.unlink(missing_ok=True)
+
+
+async def _purge_session_audio(session: AsyncSession, user_id: str) -> None:
+    # записи лежат в общем шардированном каталоге, удаляем их до строк сессий
+    loop = asyncio.get_running_loop()
+    uploads = await session.stream_scalars(
+        select(SessionAudioUpload.upload_id)
+        .where(SessionAudioUpload.session_id.in_(_purged_sessions(user_id)))
+        .execution_options(yield_per=PURGE_BATCH_SIZE)
+    )
+    async for upload_ids in uploads.partitions():
+        await loop.run_in_executor(
+            None, lambda u=upload_ids: _unlink_files([audio_upload_part_path(upload_id) for upload_id in u])
+        )
+
+    result = await session.stream(
+        select(PracticeSession.session_id, PracticeSession.audio_url)
+        .where(
+            PracticeSession.session_id.in_(_purged_sessions(user_id)),
+            PracticeSession.audio_url.is_not(None),
+        )
+        .execution_options(yield_per=PURGE_BATCH_SIZE)
+    )
+    async for rows in result.partitions():
+        # только собственные файлы сессий: старый audio_url мог указывать на чужую запись
+        await loop.run_in_executor(
+            None, lambda r=rows: _unlink_files([session_audio_file(sid, url) for sid, url in r])
+        )
+    await session.commit()
+
+
+async def _purge_midi_files(session: AsyncSession, user_id: str) -> int:
+    loop = asyncio.get_running_loop()
+    total = 0
+    while True:
+        rows = (await session.execute(
+            select(MidiFile.midi_file_id, MidiFile.uploaded_by, MidiFile.filename)
+            .where(MidiFile.midi_file_id.in_(_purged_midi_files(user_id)))
+            .limit(PURGE_BATCH_SIZE)
+        )).all()
+        if not rows:
+            return total
+
+        await loop.run_in_executor(None, _unlink_files, [
+            find_reference_file(row.midi_file_id, row.uploaded_by, row.filename) for row in rows
+        ])
+
+        await session.execute(
+            delete(MidiFile)
+            .where(MidiFile.midi_file_id.in_([row.midi_file_id for row in rows]))
+            .execution_options(synchronize_session=False)
+        )
+        await session.commit()
+        total += len(rows)
+        await asyncio.sleep(PURGE_BATCH_PAUSE_S)
+
+
+async def _run_stage(session: AsyncSession, stage: str, user_id: str) -> int:
+    if stage == "live_session_metrics":
+        return await _delete_in_batches(
+            session, LiveSessionMetric, LiveSessionMetric.live_metric_id,
+            LiveSessionMetric.session_id.in_(_purged_sessions(user_id)),
+        )
+    if stage == "reports":
+        return await _delete_in_batches(
+            session, Report, Report.report_id,
+            or_(Report.user_id == user_id, Report.session_id.in_(_purged_sessions(user_id))),
+        )
+    if stage == "practice_sessions":
+        await _purge_session_audio(session, user_id)
+        return await _delete_in_batches(
+            session, PracticeSession, PracticeSession.session_id,
+            PracticeSession.session_id.in_(_purged_sessions(user_id)),
+        )
+    if stage == "midi_files":
+        return await _purge_midi_files(session, user_id)
+    if stage == "sheet_music":
+        return await _delete_in_batches(session, SheetMusic, SheetMusic.sheet_id, SheetMusic.owner_id == user_id)
+    if stage == "materials":
+        return await _delete_in_batches(session, Material, Material.material_id, Material.author_id == user_id)
+    if stage == "files":
+        loop = asyncio.get_running_loop()
+        for directory in user_upload_dirs(user_id):
+            await loop.run_in_executor(None, lambda d=directory: shutil.rmtree(d, ignore_errors=True))
+        return 0
+    if stage == "user":
+        # refresh-токены и настройки метрик удаляются каскадом
+        result = await session.execute(delete(User).where(User.user_id == user_id))
+        await session.commit()
+        return result.rowcount
+    raise ValueError(f"Unknown purge stage: {stage}")
+
+
+async def purge_user(user_id: str) -> None:
+    """Удаляет данные помеченного пользователя, продолжая с последней контрольной точки."""
+    async with database_session.get_async_session() as session:
+        pending = (await session.execute(
+            select(User.purge_stage).where(User.user_id == user_id, User.deleted_at.is_not(None))
+        )).one_or_none()
+        if pending is None:
+            return
+
+        done_stage = pending.purge_stage
+        start = PURGE_STAGES.index(done_stage) + 1 if done_stage else 0
+        if start <= PURGE_STAGES.index("midi_files"):
+            foreign = await session.scalar(select(func.count()).select_from(_foreign_sessions(user_id).subquery()))
+            await session.commit()
+            if foreign:
+                logger.warning(
+                    "purge of user %s postponed: %s sessions of other users use their sheets or MIDI files",
+                    user_id, foreign,
+                )
+                return
+        for stage in PURGE_STAGES[start:]:
+            deleted = await _run_stage(session, stage, user_id)
+            logger.info("purge user=%s stage=%s deleted=%s", user_id, stage, deleted)
+            if stage != "user":
+                await session.execute(
+                    update(User).where(User.user_id == user_id).values(purge_stage=stage)
+                )
+                await session.commit()
+
+
+async def run_pending_purges() -> int:
+    async with database_session.get_async_session() as session:
+        user_ids = (await session.scalars(
+            select(User.user_id).where(User.deleted_at.is_not(None)).order_by(User.deleted_at)
+        )).all()
+
+    for user_id in user_ids:
+        try:
+            await purge_user(user_id)
+        except Exception:
+            # следующий проход продолжит с сохранённого этапа
+            logger.exception("purge of user %s failed", user_id)
+    return len(user_ids)
+
+
+async def _main(forever: bool, interval: float) -> None:
+    try:
+        while True:
+            await run_pending_purges()
+            if not forever:
+                break
+            await asyncio.sleep(interval)
+    finally:
+        await database_session.dispose_async_engine()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Purge data of deleted accounts")
+    parser.add_argument("--forever", action="store_true")
+    parser.add_argument("--interval", type=float, default=60.0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(args.forever, args.interval))
@@ -0,0 +1,107 @@
+"""Удаление брошенных загрузок записей сессий.
+
+Загрузка, в которую давно ничего не писали (mtime .part файла старше
+--max-age-hours), удаляется вместе со строкой SessionAudioUpload; клиенту
+придётся начать её заново. Файлы без строки (сессия удалена каскадом)
+тоже удаляются. Загрузка, которую прямо сейчас пишет PATCH или проверяет
+finalize, держит flock на своём .part и пропускается.
+
+    python -m app.jobs.audio_upload_cleanup
+    python -m app.jobs.audio_upload_cleanup --max-age-hours 24
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+import uuid
+from pathlib import Path
+
+from sqlalchemy import delete
+
+from app.core import database_session
+from app.core.storage import INCOMING_DIR, open_locked_part
+from app.models.models import SessionAudioUpload
+
+logger = logging.getLogger(__name__)
+
+ABANDONED_UPLOAD_MAX_AGE_H = 7 * 24
+CLEANUP_BATCH_SIZE = 500
+
+
+def _stale_parts(max_age_s: float) -> list[Path]:
+    deadline = time.time() - max_age_s
+    stale = []
+    for path in INCOMING_DIR.rglob("*.part"):
+        try:
+            if path.stat().st_mtime < deadline:
+                stale.append(path)
+        except FileNotFoundError:
+            pass
+    return stale
+
+
+def _lock_parts(paths: list[Path]) -> list[tuple[Path, int]]:
+    locked = []
+    for path in paths:
+        fd = open_locked_part(path)
+        if fd is not None:
+            locked.append((path, fd))
+    return locked
+
+
+def _remove_parts(locked: list[tuple[Path, int]]) -> None:
+    # удаляем под локом: PATCH, дождавшийся его, увидит, что файла уже нет
+    for path, fd in locked:
+        path.unlink(missing_ok=True)
+        os.close(fd)
+
+
+def _upload_id(path: Path) -> str | None:
+    try:
+        return str(uuid.UUID(path.stem))
+    except ValueError:
+        return None
+
+
+async def cleanup_abandoned_uploads(max_age_h: float = ABANDONED_UPLOAD_MAX_AGE_H) -> int:
+    loop = asyncio.get_running_loop()
+    stale = await loop.run_in_executor(None, _stale_parts, max_age_h * 3600)
+
+    removed = 0
+    async with database_session.get_async_session() as session:
+        for start in range(0, len(stale), CLEANUP_BATCH_SIZE):
+            locked = await loop.run_in_executor(None, _lock_parts, stale[start:start + CLEANUP_BATCH_SIZE])
+            try:
+                upload_ids = [upload_id for path, _ in locked if (upload_id := _upload_id(path))]
+                if upload_ids:
+                    await session.execute(
+                        delete(SessionAudioUpload).where(
+                            SessionAudioUpload.upload_id.in_(upload_ids),
+                            SessionAudioUpload.completed_at.is_(None),
+                        )
+                    )
+                    await session.commit()
+            except BaseException:
+                await loop.run_in_executor(None, lambda l=locked: [os.close(fd) for _, fd in l])
+                raise
+            await loop.run_in_executor(None, _remove_parts, locked)
+            removed += len(locked)
+    return removed
+
+
+async def _main(max_age_h: float) -> None:
+    try:
+        removed = await cleanup_abandoned_uploads(max_age_h)
+        logger.info("removed %s abandoned audio uploads", removed)
+    finally:
+        await database_session.dispose_async_engine()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Remove abandoned session audio uploads")
+    parser.add_argument("--max-age-hours", type=float, default=ABANDONED_UPLOAD_MAX_AGE_H)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(args.max_age_hours))
@@ -0,0 +1,255 @@
+"""Массовый импорт эталонов из каталога или архива (.zip, .tar, .tar.gz).
+
+Каждый MIDI файл становится отдельным произведением (SheetMusic) с одним
+эталоном (MidiFile). Разбор, признаки сложности и n-граммы мелодии считаются
+в пуле процессов; готовые строки пачкой загружаются через COPY в одной
+транзакции, пока пул разбирает следующую пачку.
+
+    python -m app.jobs.bulk_import ./collection --owner admin
+    python -m app.jobs.bulk_import repertoire.tar.gz --owner admin --workers 16 --errors errors.ndjson
+
+Повторный запуск после падения продолжает с места остановки: файлы, чей
+sha256 уже есть у владельца, пропускаются. Идентификаторы строк выводятся из
+sha256, поэтому файл, записанный в хранилище до падения, просто перезапишется.
+Ошибки разбора не останавливают импорт: они пишутся в лог и в --errors
+(NDJSON), а сами файлы будут повторены следующим запуском.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import tarfile
+import time
+import uuid
+import zipfile
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path, PurePosixPath
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.analysis.difficulty import DIFFICULTY_FEATURES
+from app.core import database_session
+from app.core.storage import reference_path
+from app.models.models import MidiFile, SheetMusic, User
+
+logger = logging.getLogger(__name__)
+
+IMPORT_BATCH_SIZE = 500
+MIDI_SUFFIXES = (".mid", ".midi")
+# пространство имён для uuid5: одинаковое содержимое у одного владельца -> те же id
+IMPORT_NAMESPACE = uuid.UUID("6f1c2a4e-9b3d-5e8f-a7c1-0d2b4e6f8a91")
+
+SHEET_COLUMNS = ("sheet_id", "title", "owner_id")
+MIDI_COLUMNS = (
+    "midi_file_id", "sheet_id", "uploaded_by", "filename", "status",
+    "parsed_json", "content_sha256", "features_version",
+)
+PROFILE_COLUMNS = ("midi_file_id", "grams", "counts")
+
+
+def _is_midi(name: str) -> bool:
+    return name.lower().endswith(MIDI_SUFFIXES)
+
+
+def iter_sources(source: Path) -> Iterator[tuple[str, bytes]]:
+    """(относительное имя, содержимое) каждого MIDI файла каталога или архива."""
+    if source.is_dir():
+        for path in sorted(source.rglob("*")):
+            if path.is_file() and _is_midi(path.name):
+                yield path.relative_to(source).as_posix(), path.read_bytes()
+    elif zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and _is_midi(info.filename):
+                    yield info.filename, archive.read(info)
+    elif tarfile.is_tarfile(source):
+        # потоковое чтение: .tar.gz не требует произвольного доступа
+        with tarfile.open(source, mode="r|*") as archive:
+            for member in archive:
+                if member.isfile() and _is_midi(member.name):
+                    yield member.name, archive.extractfile(member).read()
+    else:
+        raise ValueError(f"{source} is neither a directory nor a zip/tar archive")
+
+
+def import_file(name: str, sha256: str, content: bytes, owner_id: str) -> dict:
+    """В процессе пула: сохраняет файл в хранилище и считает всё, что делает upload."""
+    from app.analysis.difficulty import DIFFICULTY_FEATURES_VERSION, difficulty_features
+    from app.analysis.midi import parse_midi
+    from app.analysis.note_index import NoteIndex
+    from app.analysis.similarity import ngram_profile
+
+    midi_file_id = str(uuid.uuid5(IMPORT_NAMESPACE, f"midi:{owner_id}:{sha256}"))
+    dst = reference_path(midi_file_id)
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    dst.write_bytes(content)
+    try:
+        parsed = parse_midi(dst)
+    except Exception:
+        dst.unlink(missing_ok=True)
+        raise
+
+    index = NoteIndex.from_parsed(parsed)
+    grams, counts = ngram_profile(index)
+    return {
+        "midi_file_id": midi_file_id,
+        "sheet_id": str(uuid.uuid5(IMPORT_NAMESPACE, f"sheet:{owner_id}:{sha256}")),
+        "title": PurePosixPath(name).with_suffix("").as_posix()[:256],
+        "filename": PurePosixPath(name).name[:256],
+        "parsed_json": parsed,
+        "features": difficulty_features(index, parsed.get("tempo_bpm")),
+        "features_version": DIFFICULTY_FEATURES_VERSION,
+        "grams": grams,
+        "counts": counts,
+    }
+
+
+class BulkImport:
+    def __init__(self, session: AsyncSession, owner_id: str, errors_path: Path | None):
+        self.session = session
+        self.owner_id = owner_id
+        self.errors_path = errors_path
+        self.seen: set[str] = set()
+        self.imported = self.skipped = self.failed = 0
+        self.started = time.monotonic()
+
+    async def pending(self, chunk: list[tuple[str, bytes]]) -> list[tuple[str, str, bytes]]:
+        """Отбрасывает уже импортированные и повторяющиеся в источнике файлы."""
+        hashed = [(name, hashlib.sha256(content).hexdigest(), content) for name, content in chunk]
+        done = set(await self.session.scalars(
+            select(MidiFile.content_sha256).where(
+                MidiFile.uploaded_by == self.owner_id,
+                MidiFile.content_sha256.in_([sha for _, sha, _ in hashed]),
+            )
+        ))
+        await self.session.commit()
+
+        items = []
+        for name, sha, content in hashed:
+            if sha in done or sha in self.seen:
+                self.skipped += 1
+                continue
+            self.seen.add(sha)
+            items.append((name, sha, content))
+        return items
+
+    def _record_error(self, name: str, error: BaseException) -> None:
+        self.failed += 1
+        logger.error("import of %s failed: %r", name, error)
+        if self.errors_path is not None:
+            with self.errors_path.open("a", encoding="utf-8") as fh:
+                fh.write(json.dumps({"file": name, "error": repr(error)}, ensure_ascii=False) + "\n")
+
+    async def load(self, items: list[tuple[str, str, bytes]], futures: list[asyncio.Future]) -> None:
+        results = await asyncio.gather(*futures, return_exceptions=True)
+
+        rows = []
+        for (name, sha, _), result in zip(items, results):
+            if isinstance(result, Exception):
+                self._record_error(name, result)
+            else:
+                rows.append((sha, result))
+        if rows:
+            await self._copy(rows)
+        self.imported += len(rows)
+
+        elapsed = time.monotonic() - self.started
+        logger.info(
+            "imported %s, skipped %s, failed %s (%.1f files/s)",
+            self.imported, self.skipped, self.failed, self.imported / max(elapsed, 1e-6),
+        )
+
+    async def _copy(self, rows: list[tuple[str, dict]]) -> None:
+        # названия произведений уникальны (см. POST /sheet-music) — при совпадении
+        # добавляем начало sha256
+        titles = {row["title"] for _, row in rows}
+        taken = set(await self.session.scalars(select(SheetMusic.title).where(SheetMusic.title.in_(titles))))
+        sheets, midi_files, profiles = [], [], []
+        for sha, row in rows:
+            title = row["title"] if row["title"] not in taken else f"{row['title'][:245]} [{sha[:8]}]"
+            taken.add(title)
+            features = row["features"]
+            sheets.append((row["sheet_id"], title, self.owner_id))
+            midi_files.append((
+                row["midi_file_id"], row["sheet_id"], self.owner_id, row["filename"], "READY",
+                # jsonb-кодек соединения SQLAlchemy ждёт строку
+                json.dumps(row["parsed_json"]), sha, row["features_version"],
+                *(features[name] for name in DIFFICULTY_FEATURES),
+            ))
+            profiles.append((row["midi_file_id"], row["grams"], row["counts"]))
+
+        connection = await self.session.connection()
+        raw = (await connection.get_raw_connection()).driver_connection
+        await raw.copy_records_to_table("sheet_music", records=sheets, columns=SHEET_COLUMNS)
+        await raw.copy_records_to_table(
+            "midi_files", records=midi_files, columns=MIDI_COLUMNS + DIFFICULTY_FEATURES,
+        )
+        await raw.copy_records_to_table("midi_ngram_profiles", records=profiles, columns=PROFILE_COLUMNS)
+        await self.session.commit()
+
+
+def _chunks(sources: Iterator[tuple[str, bytes]], size: int) -> Iterator[list[tuple[str, bytes]]]:
+    chunk = []
+    for item in sources:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+async def run_import(
+    source: Path,
+    owner_login: str,
+    workers: int,
+    batch_size: int = IMPORT_BATCH_SIZE,
+    errors_path: Path | None = None,
+) -> BulkImport:
+    loop = asyncio.get_running_loop()
+
+    async with database_session.get_async_session() as session:
+        owner_id = await session.scalar(select(User.user_id).where(User.login == owner_login))
+        if owner_id is None:
+            raise ValueError(f"user {owner_login!r} not found")
+        job = BulkImport(session, owner_id, errors_path)
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            in_flight = None
+            for chunk in _chunks(iter_sources(source), batch_size):
+                items = await job.pending(chunk)
+                futures = [
+                    loop.run_in_executor(pool, import_file, name, sha, content, owner_id)
+                    for name, sha, content in items
+                ]
+                # пока пул разбирает эту пачку, загружаем предыдущую
+                if in_flight is not None:
+                    await job.load(*in_flight)
+                in_flight = (items, futures)
+            if in_flight is not None:
+                await job.load(*in_flight)
+    return job
+
+
+async def _main(source: Path, owner: str, workers: int, batch_size: int, errors_path: Path | None) -> None:
+    try:
+        await run_import(source, owner, workers, batch_size, errors_path)
+    finally:
+        await database_session.dispose_async_engine()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import a directory or archive of reference MIDI files")
+    parser.add_argument("source", type=Path)
+    parser.add_argument("--owner", required=True, help="login of the user that will own imported sheets")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    parser.add_argument("--errors", type=Path, default=None, help="append per-file errors here as NDJSON")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(args.source, args.owner, args.workers, args.batch_size, args.errors))
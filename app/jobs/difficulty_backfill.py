@@ -0,0 +1,104 @@
+"""Досчёт признаков сложности для уже загруженных эталонов.
+
+Файлы выбираются пачками по возрастанию midi_file_id (keyset, без OFFSET),
+признаки считаются параллельно в пуле процессов, пачка записывается одним
+bulk UPDATE. Файл, у которого за это время сменилась партия (version), не
+перезаписывается — его признаки уже посчитал PUT part. Обрабатываются только
+файлы без признаков или с устаревшей DIFFICULTY_FEATURES_VERSION, поэтому
+прерванный запуск можно просто повторить.
+
+    python -m app.jobs.difficulty_backfill
+    python -m app.jobs.difficulty_backfill --workers 8 --batch-size 200
+"""
+import argparse
+import asyncio
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from sqlalchemy import bindparam, or_, select, update
+
+from app.analysis.difficulty import DIFFICULTY_FEATURES_VERSION, features_from_parsed
+from app.core import database_session
+from app.models.enums import FileStatus
+from app.models.models import MidiFile
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_BATCH_SIZE = 200
+
+
+async def run_backfill(workers: int, batch_size: int = BACKFILL_BATCH_SIZE) -> int:
+    loop = asyncio.get_running_loop()
+    done = 0
+    last_id: str | None = None
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        async with database_session.get_async_session() as session:
+            while True:
+                query = (
+                    select(MidiFile.midi_file_id, MidiFile.version, MidiFile.parsed_json)
+                    .where(
+                        MidiFile.status == FileStatus.READY,
+                        or_(
+                            MidiFile.features_version.is_(None),
+                            MidiFile.features_version < DIFFICULTY_FEATURES_VERSION,
+                        ),
+                    )
+                    .order_by(MidiFile.midi_file_id)
+                    .limit(batch_size)
+                )
+                if last_id is not None:
+                    query = query.where(MidiFile.midi_file_id > last_id)
+                rows = (await session.execute(query)).all()
+                # соединение не держим открытым, пока считает пул
+                await session.commit()
+                if not rows:
+                    return done
+                last_id = rows[-1].midi_file_id
+
+                results = await asyncio.gather(
+                    *(loop.run_in_executor(pool, features_from_parsed, row.parsed_json) for row in rows),
+                    return_exceptions=True,
+                )
+
+                values = []
+                for row, features in zip(rows, results):
+                    if isinstance(features, Exception):
+                        # битый parsed_json не должен останавливать весь backfill
+                        logger.error("difficulty features of %s failed: %r", row.midi_file_id, features)
+                        continue
+                    values.append({
+                        "midi_file_id": row.midi_file_id,
+                        "read_version": row.version,
+                        "features_version": DIFFICULTY_FEATURES_VERSION,
+                        **features,
+                    })
+                if values:
+                    # по первичному ключу и только если parsed_json не заменили после чтения
+                    await session.execute(
+                        update(MidiFile)
+                        .where(MidiFile.version == bindparam("read_version"))
+                        .execution_options(synchronize_session=None),
+                        values,
+                    )
+                    await session.commit()
+                done += len(values)
+                logger.info("difficulty features: %s files done", done)
+
+
+async def _main(workers: int, batch_size: int) -> None:
+    try:
+        await run_backfill(workers, batch_size)
+    finally:
+        await database_session.dispose_async_engine()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compute difficulty features for existing reference MIDI files")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--batch-size", type=int, default=BACKFILL_BATCH_SIZE)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(args.workers, args.batch_size))
@@ -0,0 +1,199 @@
+"""Архивация метрик завершённых сессий в сжатые колоночные блобы.
+
+Для каждой (session_id, matric_code, algo_version) строки LiveSessionMetric
+упаковываются в один ArchivedSessionMetric: столбцы offset_ms, value,
+score и window_ms переводятся в целые (value * 10^4, score * 10^2),
+дельта-кодируются, байты перемешиваются по разрядам (byte shuffle) и
+сжимаются zlib. Исходные строки удаляются в той же транзакции.
+
+    python -m app.jobs.metrics_archive          # один проход
+    python -m app.jobs.metrics_archive --limit 100
+"""
+import argparse
+import asyncio
+import logging
+import struct
+import zlib
+from decimal import Decimal
+
+import numpy as np
+from sqlalchemy import delete, exists, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core import database_session
+from app.models.enums import SessionStatus
+from app.models.models import ArchivedSessionMetric, LiveSessionMetric, PracticeSession, Report
+
+logger = logging.getLogger(__name__)
+
+ENCODING_DELTA_SHUFFLE_ZLIB = 1
+_HEADER = struct.Struct("<BI")
+# масштабы соответствуют Numeric(8, 4) и Numeric(5, 2) в LiveSessionMetric
+VALUE_SCALE = 10_000
+SCORE_SCALE = 100
+
+ARCHIVE_SESSIONS_PER_RUN = 500
+# id удаляемых строк передаются параметрами — держимся ниже лимита протокола (32767)
+DELETE_BATCH_SIZE = 5000
+
+
+def encode_metrics(offset_ms: np.ndarray, value: np.ndarray, score: np.ndarray, window_ms: np.ndarray) -> bytes:
+    order = np.argsort(offset_ms, kind="stable")
+    columns = np.stack((
+        offset_ms[order].astype(np.int64),
+        np.rint(value[order] * VALUE_SCALE).astype(np.int64),
+        np.rint(score[order] * SCORE_SCALE).astype(np.int64),
+        window_ms[order].astype(np.int64),
+    ))
+    deltas = np.diff(columns, axis=1, prepend=0).astype("<i4")
+    shuffled = np.ascontiguousarray(deltas.view(np.uint8).reshape(4, -1, 4).transpose(0, 2, 1))
+    return _HEADER.pack(ENCODING_DELTA_SHUFFLE_ZLIB, columns.shape[1]) + zlib.compress(shuffled.tobytes(), 9)
+
+
+def decode_metrics(payload: bytes) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Обратное к encode_metrics: (offset_ms, value, score, window_ms)."""
+    encoding, n = _HEADER.unpack_from(payload)
+    if encoding != ENCODING_DELTA_SHUFFLE_ZLIB:
+        raise ValueError(f"Unknown metrics archive encoding: {encoding}")
+    raw = np.frombuffer(zlib.decompress(payload[_HEADER.size:]), dtype=np.uint8)
+    deltas = np.ascontiguousarray(raw.reshape(4, 4, n).transpose(0, 2, 1)).view("<i4").reshape(4, n)
+    columns = np.cumsum(deltas.astype(np.int64), axis=1)
+    return (
+        columns[0],
+        columns[1] / VALUE_SCALE,
+        columns[2] / SCORE_SCALE,
+        columns[3],
+    )
+
+
+def _to_float(values: list[Decimal | float]) -> np.ndarray:
+    return np.fromiter((float(v) for v in values), dtype=np.float64, count=len(values))
+
+
+def _encode_group(rows: list, archived_payload: bytes | None) -> tuple[bytes, int, int, int]:
+    columns = (
+        np.fromiter((r.offset_ms for r in rows), dtype=np.int64, count=len(rows)),
+        _to_float([r.value for r in rows]),
+        _to_float([r.score for r in rows]),
+        np.fromiter((r.window_ms for r in rows), dtype=np.int64, count=len(rows)),
+    )
+    if archived_payload is not None:
+        # метрики дописали после архивации — сливаем с уже упакованными
+        columns = tuple(
+            np.concatenate((old, new)) for old, new in zip(decode_metrics(archived_payload), columns)
+        )
+    offsets = columns[0]
+    return encode_metrics(*columns), int(offsets.size), int(offsets.min()), int(offsets.max())
+
+
+async def archive_session_metrics(session: AsyncSession, session_id: str) -> int:
+    """Упаковывает живые метрики одной сессии; возвращает число заархивированных строк."""
+    rows = (await session.execute(
+        select(
+            LiveSessionMetric.live_metric_id,
+            LiveSessionMetric.matric_code,
+            LiveSessionMetric.algo_version,
+            LiveSessionMetric.offset_ms,
+            LiveSessionMetric.value,
+            LiveSessionMetric.score,
+            LiveSessionMetric.window_ms,
+        )
+        .where(LiveSessionMetric.session_id == session_id)
+        .order_by(LiveSessionMetric.matric_code, LiveSessionMetric.algo_version, LiveSessionMetric.offset_ms)
+    )).all()
+    if not rows:
+        return 0
+
+    groups: dict[tuple[str, int], list] = {}
+    for row in rows:
+        groups.setdefault((row.matric_code, row.algo_version), []).append(row)
+
+    existing = {
+        (a.matric_code, a.algo_version): a.payload
+        for a in (await session.execute(
+            select(ArchivedSessionMetric.matric_code, ArchivedSessionMetric.algo_version, ArchivedSessionMetric.payload)
+            .where(ArchivedSessionMetric.session_id == session_id)
+        )).all()
+    }
+
+    loop = asyncio.get_running_loop()
+    for (code, algo_version), group in groups.items():
+        payload, count, first, last = await loop.run_in_executor(
+            None, _encode_group, group, existing.get((code, algo_version))
+        )
+        values = {
+            "row_count": count,
+            "first_offset_ms": first,
+            "last_offset_ms": last,
+            "encoding": ENCODING_DELTA_SHUFFLE_ZLIB,
+            "payload": payload,
+        }
+        await session.execute(
+            insert(ArchivedSessionMetric)
+            .values(session_id=session_id, matric_code=code, algo_version=algo_version, **values)
+            .on_conflict_do_update(
+                index_elements=[
+                    ArchivedSessionMetric.session_id,
+                    ArchivedSessionMetric.matric_code,
+                    ArchivedSessionMetric.algo_version,
+                ],
+                set_=values,
+            )
+        )
+
+    # удаляем ровно упакованные строки: вставленные анализом после SELECT
+    # останутся живыми и попадут в архив следующим проходом
+    ids = [row.live_metric_id for row in rows]
+    for start in range(0, len(ids), DELETE_BATCH_SIZE):
+        await session.execute(
+            delete(LiveSessionMetric)
+            .where(LiveSessionMetric.live_metric_id.in_(ids[start:start + DELETE_BATCH_SIZE]))
+            .execution_options(synchronize_session=False)
+        )
+    return len(rows)
+
+
+def _archivable_sessions(limit: int):
+    # только завершённые сессии с готовым отчётом и ещё не упакованными строками
+    return (
+        select(PracticeSession.session_id)
+        .where(
+            PracticeSession.status == SessionStatus.DONE,
+            exists().where(Report.session_id == PracticeSession.session_id),
+            exists().where(LiveSessionMetric.session_id == PracticeSession.session_id),
+        )
+        .limit(limit)
+    )
+
+
+async def run_archive(limit: int = ARCHIVE_SESSIONS_PER_RUN) -> int:
+    archived = 0
+    async with database_session.get_async_session() as session:
+        session_ids = (await session.scalars(_archivable_sessions(limit))).all()
+        for session_id in session_ids:
+            # одна короткая транзакция на сессию
+            try:
+                archived += await archive_session_metrics(session, session_id)
+                await session.commit()
+            except Exception:
+                await session.rollback()
+                logger.exception("archiving metrics of session %s failed", session_id)
+    return archived
+
+
+async def _main(limit: int) -> None:
+    try:
+        rows = await run_archive(limit)
+        logger.info("archived %s metric rows", rows)
+    finally:
+        await database_session.dispose_async_engine()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive live metrics of finished sessions")
+    parser.add_argument("--limit", type=int, default=ARCHIVE_SESSIONS_PER_RUN)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(args.limit))
@@ -0,0 +1,98 @@
+"""Построение индекса похожих эталонов для уже загруженных файлов.
+
+Берутся готовые эталоны без записи в midi_ngram_profiles, пачками по
+возрастанию midi_file_id; n-граммы считаются в пуле процессов, пачка
+вставляется одним INSERT (частоты обновит триггер). Повторный запуск
+продолжает с того места, где прервался предыдущий.
+
+    python -m app.jobs.ngram_backfill
+    python -m app.jobs.ngram_backfill --workers 8 --batch-size 200
+
+--rebuild удаляет все профили перед построением — после изменения формата
+n-грамм в app/analysis/similarity.py.
+"""
+import argparse
+import asyncio
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from sqlalchemy import delete, exists, select
+from sqlalchemy.dialects.postgresql import insert
+
+from app.analysis.similarity import profile_from_parsed
+from app.core import database_session
+from app.models.enums import FileStatus
+from app.models.models import MidiFile, MidiNgramProfile
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_BATCH_SIZE = 200
+
+
+async def run_backfill(workers: int, batch_size: int = BACKFILL_BATCH_SIZE, rebuild: bool = False) -> int:
+    loop = asyncio.get_running_loop()
+    done = 0
+    last_id: str | None = None
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        async with database_session.get_async_session() as session:
+            if rebuild:
+                await session.execute(delete(MidiNgramProfile))
+                await session.commit()
+
+            while True:
+                query = (
+                    select(MidiFile.midi_file_id, MidiFile.parsed_json)
+                    .where(
+                        MidiFile.status == FileStatus.READY,
+                        ~exists().where(MidiNgramProfile.midi_file_id == MidiFile.midi_file_id),
+                    )
+                    .order_by(MidiFile.midi_file_id)
+                    .limit(batch_size)
+                )
+                if last_id is not None:
+                    query = query.where(MidiFile.midi_file_id > last_id)
+                rows = (await session.execute(query)).all()
+                # соединение не держим открытым, пока считает пул
+                await session.commit()
+                if not rows:
+                    return done
+                last_id = rows[-1].midi_file_id
+
+                results = await asyncio.gather(
+                    *(loop.run_in_executor(pool, profile_from_parsed, row.parsed_json) for row in rows),
+                    return_exceptions=True,
+                )
+
+                values = []
+                for row, profile in zip(rows, results):
+                    if isinstance(profile, Exception):
+                        logger.error("ngram profile of %s failed: %r", row.midi_file_id, profile)
+                        continue
+                    grams, counts = profile
+                    values.append({"midi_file_id": row.midi_file_id, "grams": grams, "counts": counts})
+                if values:
+                    # файл мог проиндексировать upload, пока считал пул
+                    await session.execute(insert(MidiNgramProfile).on_conflict_do_nothing(), values)
+                    await session.commit()
+                done += len(values)
+                logger.info("ngram profiles: %s files done", done)
+
+
+async def _main(workers: int, batch_size: int, rebuild: bool) -> None:
+    try:
+        await run_backfill(workers, batch_size, rebuild)
+    finally:
+        await database_session.dispose_async_engine()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build melodic similarity index for existing reference MIDI files")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--batch-size", type=int, default=BACKFILL_BATCH_SIZE)
+    parser.add_argument("--rebuild", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(args.workers, args.batch_size, args.rebuild))
@@ -0,0 +1,101 @@
+"""Пересборка гистограмм оценок по произведениям из истории отчётов.
+
+В штатном режиме гистограммы ведут триггеры БД; эта команда нужна после
+миграции, ручной правки отчётов или смены границ корзин.
+
+    python -m app.jobs.score_histograms                 # все произведения
+    python -m app.jobs.score_histograms --sheet-id <id>
+"""
+import argparse
+import asyncio
+import logging
+
+from sqlalchemy import delete, func, select, union
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.analysis.score_histogram import SCORE_BUCKETS
+from app.core import database_session
+from app.models.models import PracticeSession, Report, SheetScoreHistogram
+
+logger = logging.getLogger(__name__)
+
+
+async def rebuild_sheet_histograms(session: AsyncSession, sheet_id: str) -> int:
+    """Пересчитывает гистограммы одного произведения; возвращает число учтённых отчётов."""
+    # Блокируем существующие строки: триггер параллельной вставки отчёта
+    # дождётся коммита и прибавит свой отчёт уже к пересчитанным счётчикам.
+    await session.execute(
+        select(SheetScoreHistogram.sheet_id)
+        .where(SheetScoreHistogram.sheet_id == sheet_id)
+        .with_for_update()
+    )
+
+    bucket = func.least(func.greatest(func.floor(Report.overall_score), 0), SCORE_BUCKETS - 1).label("bucket")
+    rows = (await session.execute(
+        select(Report.algo_version, bucket, func.count())
+        .join(PracticeSession, PracticeSession.session_id == Report.session_id)
+        .where(PracticeSession.sheet_id == sheet_id)
+        .group_by(Report.algo_version, bucket)
+    )).all()
+
+    histograms: dict[int, list[int]] = {}
+    for algo_version, b, count in rows:
+        histograms.setdefault(algo_version, [0] * SCORE_BUCKETS)[int(b)] = count
+
+    await session.execute(
+        delete(SheetScoreHistogram).where(
+            SheetScoreHistogram.sheet_id == sheet_id,
+            SheetScoreHistogram.algo_version.not_in(list(histograms)),
+        )
+    )
+    for algo_version, counts in histograms.items():
+        values = {"counts": counts, "total": sum(counts), "updated_at": func.now()}
+        await session.execute(
+            insert(SheetScoreHistogram)
+            .values(sheet_id=sheet_id, algo_version=algo_version, counts=counts, total=sum(counts))
+            .on_conflict_do_update(
+                index_elements=[SheetScoreHistogram.sheet_id, SheetScoreHistogram.algo_version],
+                set_=values,
+            )
+        )
+    return sum(sum(counts) for counts in histograms.values())
+
+
+async def run_rebuild(sheet_id: str | None = None) -> int:
+    async with database_session.get_async_session() as session:
+        if sheet_id is not None:
+            sheet_ids = [sheet_id]
+        else:
+            sheet_ids = (await session.scalars(union(
+                select(PracticeSession.sheet_id).join(Report, Report.session_id == PracticeSession.session_id),
+                select(SheetScoreHistogram.sheet_id),
+            ))).all()
+
+        total = 0
+        for sid in sheet_ids:
+            # одна короткая транзакция на произведение
+            try:
+                total += await rebuild_sheet_histograms(session, sid)
+                await session.commit()
+            except Exception:
+                await session.rollback()
+                logger.exception("rebuilding score histograms of sheet %s failed", sid)
+    return total
+
+
+async def _main(sheet_id: str | None) -> None:
+    try:
+        reports = await run_rebuild(sheet_id)
+        logger.info("rebuilt score histograms from %s reports", reports)
+    finally:
+        await database_session.dispose_async_engine()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild per-sheet score histograms from reports")
+    parser.add_argument("--sheet-id", default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(args.sheet_id))
@@ -0,0 +1,258 @@
+"""Анализ записи сессии: трек высоты тона и оценка по эталону -> LiveSessionMetric."""
+import asyncio
+import logging
+from collections.abc import Iterator
+from pathlib import Path
+
+import numpy as np
+from sqlalchemy import delete, insert, select
+
+from app.analysis.feature_cache import FeatureWriter, audio_checksum, load_features
+from app.analysis.live_scoring import SCORING_ALGO_VERSION, SCORING_METRICS, StreamingScorer
+from app.analysis.metric_config import load_metric_config
+from app.analysis.note_index import get_note_index, get_variant_index, lookup_note_index
+from app.analysis.pitch import FRAMES_PER_BATCH, PitchFrames, count_wav_pitch_frames, iter_wav_pitch
+from app.core import database_session
+from app.core.storage import session_audio_file
+from app.models.models import ArchivedSessionMetric, LiveSessionMetric, MidiFile, PracticeSession
+
+logger = logging.getLogger(__name__)
+
+PITCH_ALGO_VERSION = 1
+PITCH_WINDOW_MS = 100
+
+METRIC_PITCH = "pitch_hz"
+METRIC_VOICING = "voicing"
+METRIC_ONSETS = "onsets"
+
+PITCH_FEATURES = "pitch"
+_PITCH_FIELDS = ("time_s", "f0_hz", "confidence", "onset")
+
+
+class _WindowAggregator:
+    """Сворачивает покадровый трек в окна фиксированной длины."""
+
+    def __init__(self, session_id: str, window_ms: int = PITCH_WINDOW_MS):
+        self.session_id = session_id
+        self.window_ms = window_ms
+        self._pending: PitchFrames | None = None
+
+    def push(self, frames: PitchFrames) -> list[dict]:
+        if self._pending is not None:
+            frames = PitchFrames(
+                *(np.concatenate((a, b)) for a, b in zip(
+                    (self._pending.time_s, self._pending.f0_hz, self._pending.confidence, self._pending.onset),
+                    (frames.time_s, frames.f0_hz, frames.confidence, frames.onset),
+                ))
+            )
+
+        window_s = self.window_ms / 1000.0
+        window_idx = np.floor(frames.time_s / window_s).astype(np.int64)
+        # последнее окно может быть неполным — оставляем его до следующей пачки
+        complete = window_idx < window_idx[-1]
+        tail = ~complete
+        self._pending = PitchFrames(
+            frames.time_s[tail], frames.f0_hz[tail], frames.confidence[tail], frames.onset[tail]
+        )
+        return self._rows(window_idx[complete], frames.f0_hz[complete],
+                          frames.confidence[complete], frames.onset[complete])
+
+    def flush(self) -> list[dict]:
+        if self._pending is None or self._pending.time_s.size == 0:
+            return []
+        window_s = self.window_ms / 1000.0
+        pending, self._pending = self._pending, None
+        window_idx = np.floor(pending.time_s / window_s).astype(np.int64)
+        return self._rows(window_idx, pending.f0_hz, pending.confidence, pending.onset)
+
+    def _rows(self, window_idx: np.ndarray, f0: np.ndarray, conf: np.ndarray, onset: np.ndarray) -> list[dict]:
+        if window_idx.size == 0:
+            return []
+        windows, starts, counts = np.unique(window_idx, return_index=True, return_counts=True)
+        voiced = f0 > 0
+
+        voiced_count = np.add.reduceat(voiced.astype(np.int64), starts)
+        onset_count = np.add.reduceat(onset.astype(np.int64), starts)
+        conf_sum = np.add.reduceat(np.where(voiced, conf, 0.0), starts)
+        # среднее в логарифмической шкале устойчивее к октавным выбросам, чем арифметическое
+        log_sum = np.add.reduceat(np.where(voiced, np.log2(np.where(voiced, f0, 1.0)), 0.0), starts)
+
+        safe = np.maximum(voiced_count, 1)
+        pitch = np.where(voiced_count > 0, np.exp2(log_sum / safe), 0.0)
+        mean_conf = conf_sum / safe
+        voicing = voiced_count / counts
+
+        rows: list[dict] = []
+        for w, hz, c, v, n in zip(windows.tolist(), pitch.tolist(), mean_conf.tolist(),
+                                  voicing.tolist(), onset_count.tolist()):
+            offset_ms = w * self.window_ms
+            common = {
+                "session_id": self.session_id,
+                "offset_ms": offset_ms,
+                "window_ms": self.window_ms,
+                "algo_version": PITCH_ALGO_VERSION,
+            }
+            rows.append({**common, "matric_code": METRIC_PITCH, "value": round(hz, 4), "score": round(c * 100, 2)})
+            rows.append({**common, "matric_code": METRIC_VOICING, "value": round(v, 4), "score": round(v * 100, 2)})
+            rows.append({**common, "matric_code": METRIC_ONSETS, "value": n, "score": 100 if n else 0})
+        return rows
+
+
+def resolve_audio_path(session_id: str, audio_url: str) -> Path:
+    # читаем только собственный файл сессии, а не любой путь из каталога загрузок
+    path = session_audio_file(session_id, audio_url)
+    if path is None:
+        raise FileNotFoundError(f"Session audio not found: {audio_url}")
+    return path
+
+
+def _cached_batches(arrays: dict[str, np.ndarray]) -> Iterator[PitchFrames]:
+    # массивы открыты через mmap — в память попадает только текущая пачка
+    total = arrays["time_s"].shape[0]
+    for start in range(0, total, FRAMES_PER_BATCH):
+        yield PitchFrames(*(np.asarray(arrays[f][start:start + FRAMES_PER_BATCH]) for f in _PITCH_FIELDS))
+
+
+def _pitch_track_writer(session_id: str, checksum: str, path: Path) -> FeatureWriter:
+    dtypes = {"time_s": np.float64, "f0_hz": np.float64, "confidence": np.float64, "onset": np.bool_}
+    return FeatureWriter(
+        session_id, checksum, PITCH_FEATURES, PITCH_ALGO_VERSION, dtypes, count_wav_pitch_frames(path)
+    )
+
+
+def _recording_batches(batches: Iterator[PitchFrames], writer: FeatureWriter) -> Iterator[PitchFrames]:
+    # трек сразу пишется в файлы кэша: память не растёт с длиной записи
+    for frames in batches:
+        writer.append({field: getattr(frames, field) for field in _PITCH_FIELDS})
+        yield frames
+
+
+async def _session_scorer(session, session_id: str) -> StreamingScorer | None:
+    """Оценщик по эталону сессии с учётом её темпа и транспонирования.
+
+    None — оценивать не по чему: нет сессии, настроек метрик или нот в эталоне
+    (такие файлы больше не принимаются, но могли остаться от прежних загрузок).
+    """
+    row = (await session.execute(
+        select(PracticeSession.midi_file_id, PracticeSession.tempo_factor, PracticeSession.transpose, MidiFile.version)
+        .join(MidiFile, MidiFile.midi_file_id == PracticeSession.midi_file_id)
+        .where(PracticeSession.session_id == session_id)
+    )).one_or_none()
+    config = await load_metric_config(session, session_id)
+    if row is None or config is None:
+        return None
+
+    loop = asyncio.get_running_loop()
+    index = lookup_note_index(row.midi_file_id, row.version)
+    if index is None:
+        parsed_json = await session.scalar(
+            select(MidiFile.parsed_json).where(MidiFile.midi_file_id == row.midi_file_id)
+        )
+        index = await loop.run_in_executor(None, get_note_index, row.midi_file_id, row.version, parsed_json)
+    if not len(index):
+        logger.warning("reference %s of session %s has no notes, scoring skipped", row.midi_file_id, session_id)
+        return None
+    index = get_variant_index(row.midi_file_id, row.version, index, float(row.tempo_factor), row.transpose)
+    return StreamingScorer(session_id, index, config)
+
+
+async def _delete_metrics(session, session_id: str, algo_version: int, codes: tuple[str, ...]) -> None:
+    await session.execute(
+        delete(LiveSessionMetric).where(
+            LiveSessionMetric.session_id == session_id,
+            LiveSessionMetric.algo_version == algo_version,
+            LiveSessionMetric.matric_code.in_(codes),
+        )
+    )
+    await session.execute(
+        delete(ArchivedSessionMetric).where(
+            ArchivedSessionMetric.session_id == session_id,
+            ArchivedSessionMetric.algo_version == algo_version,
+            ArchivedSessionMetric.matric_code.in_(codes),
+        )
+    )
+
+
+async def _push_scores(
+    session, scorer: StreamingScorer, session_id: str, frames: PitchFrames | None
+) -> StreamingScorer | None:
+    """Пачка кадров в оценщик (None — дослать хвост), его строки — под точкой сохранения.
+
+    Оценка вторична к треку высоты: её ошибка, в расчёте или при вставке,
+    откатывает только строки оценки этой сессии, а трек дописывается.
+    Возвращает None, если оценка отключена до конца анализа.
+    """
+    try:
+        rows = scorer.push(frames) if frames is not None else scorer.flush()
+        if rows:
+            async with session.begin_nested():
+                await session.execute(insert(LiveSessionMetric), rows)
+        return scorer
+    except Exception:
+        logger.exception("scoring of session %s failed, only the pitch track is stored", session_id)
+        # без неполной оценки: строки прошлых пачек уже в транзакции
+        await _delete_metrics(session, session_id, SCORING_ALGO_VERSION, SCORING_METRICS)
+        return None
+
+
+async def analyze_practice_session_audio(session_id: str) -> None:
+    """Считает трек высоты для записи сессии и пишет его метриками.
+
+    Запись читается пачками в executor, каждая пачка окон сразу
+    вставляется в БД. Те же пачки идут в StreamingScorer — скользящие
+    метрики интонации, ритма и точности нот относительно эталона; сбой
+    оценки не мешает сохранить трек (_push_scores).
+    Покадровый трек сохраняется в кэше признаков, так что повторный анализ
+    той же записи не пересчитывает YIN.
+    """
+    async with database_session.get_async_session() as session:
+        audio_url = await session.scalar(
+            select(PracticeSession.audio_url).where(PracticeSession.session_id == session_id)
+        )
+        if audio_url is None:
+            return
+
+        loop = asyncio.get_running_loop()
+        path = await loop.run_in_executor(None, resolve_audio_path, session_id, audio_url)
+        checksum = await loop.run_in_executor(None, audio_checksum, path)
+        cached = await loop.run_in_executor(
+            None, load_features, session_id, checksum, PITCH_FEATURES, PITCH_ALGO_VERSION, _PITCH_FIELDS
+        )
+        scorer = await _session_scorer(session, session_id)
+
+        await _delete_metrics(session, session_id, PITCH_ALGO_VERSION, (METRIC_PITCH, METRIC_VOICING, METRIC_ONSETS))
+        if scorer is not None:
+            await _delete_metrics(session, session_id, SCORING_ALGO_VERSION, SCORING_METRICS)
+
+        # трек той же записи той же версией алгоритма уже посчитан — берём из кэша
+        writer: FeatureWriter | None = None
+        if cached is not None:
+            batches = _cached_batches(cached)
+        else:
+            writer = await loop.run_in_executor(None, _pitch_track_writer, session_id, checksum, path)
+            batches = _recording_batches(iter_wav_pitch(path), writer)
+        aggregator = _WindowAggregator(session_id)
+        try:
+            while True:
+                frames = await loop.run_in_executor(None, next, batches, None)
+                if frames is None:
+                    break
+                rows = aggregator.push(frames)
+                if rows:
+                    await session.execute(insert(LiveSessionMetric), rows)
+                if scorer is not None:
+                    scorer = await _push_scores(session, scorer, session_id, frames)
+
+            rows = aggregator.flush()
+            if rows:
+                await session.execute(insert(LiveSessionMetric), rows)
+            if scorer is not None:
+                await _push_scores(session, scorer, session_id, None)
+            await session.commit()
+        except BaseException:
+            if writer is not None:
+                await loop.run_in_executor(None, writer.abort)
+            raise
+
+        if writer is not None:
+            await loop.run_in_executor(None, writer.publish)
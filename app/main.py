@@ -1,6 +1,44 @@
+import asyncio
+from collections.abc import AsyncIterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 
-from app.api.api_router import auth_router, users_router, references_router, sheet_music_router, practice_session_router
+from app.api.admission import shutdown_workloads
+from app.api.api_router import (
+    auth_router,
+    users_router,
+    references_router,
+    sheet_music_router,
+    practice_session_router,
+    system_router,
+)
+from app.core import database_session
+from app.core.events import close_event_hub
+from app.core.security.password import get_dummy_password
+
+DEFAULT_EXECUTOR_WORKERS = 8
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    # всё тяжёлое создаётся уже в процессе воркера, после fork
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=DEFAULT_EXECUTOR_WORKERS, thread_name_prefix="app-default")
+    loop.set_default_executor(executor)
+
+    database_session.init_async_engine()
+    await loop.run_in_executor(None, get_dummy_password)
+
+    try:
+        yield
+    finally:
+        await close_event_hub()
+        await database_session.dispose_async_engine()
+        shutdown_workloads()
+        executor.shutdown(wait=True, cancel_futures=True)
+
 
 app = FastAPI(
     title="violin-teacher",
@@ -8,10 +46,12 @@ app = FastAPI(
     description="Чудесный сервис для оценки и обучения игре на скрипке",
     openapi_url="/openapi.json",
     docs_url="/",
+    lifespan=lifespan,
 )
 
 app.include_router(auth_router)
 app.include_router(users_router)
 app.include_router(references_router)
 app.include_router(sheet_music_router)
-app.include_router(practice_session_router)
\ No newline at end of file
+app.include_router(practice_session_router)
+app.include_router(system_router)
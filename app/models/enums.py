@@ -10,6 +10,14 @@ class SessionStatus(enum.StrEnum):
     DONE = "done"
     ERROR = "error"
 
+# Допустимые переходы: DRAFT -> PLAYING -> DONE | ERROR
+SESSION_STATUS_TRANSITIONS: dict[SessionStatus, frozenset[SessionStatus]] = {
+    SessionStatus.DRAFT: frozenset({SessionStatus.PLAYING}),
+    SessionStatus.PLAYING: frozenset({SessionStatus.DONE, SessionStatus.ERROR}),
+    SessionStatus.DONE: frozenset(),
+    SessionStatus.ERROR: frozenset(),
+}
+
 class FileStatus(enum.StrEnum):
     UPLOADED = "uploaded"
     PARSED = "parsed"
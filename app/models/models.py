@@ -7,6 +7,7 @@ from sqlalchemy import (
     Enum,
     ForeignKey,
     Index,
+    Integer,
     JSON,
     Numeric,
     String,
@@ -14,10 +15,12 @@ from sqlalchemy import (
     text,
     BigInteger,
     DateTime,
+    Float,
     Boolean,
     SmallInteger,
+    LargeBinary,
 )
-from sqlalchemy.dialects.postgresql import JSONB, UUID
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB, UUID
 from sqlalchemy.orm import (
     DeclarativeBase,
     Mapped,
@@ -64,6 +67,9 @@ class User(Base):
         DateTime(timezone=True),
         server_default=func.now(),
     )
+    # удаление аккаунта: сначала помечаем, данные вычищает фоновый purge
+    deleted_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True))
+    purge_stage: Mapped[str | None] = mapped_column(String(32))
 
     refresh_tokens: Mapped[list["RefreshToken"]] = relationship(back_populates="user")
     materials: Mapped[List["Material"]] = relationship(back_populates="user")
@@ -77,6 +83,14 @@ class User(Base):
         cascade="all, delete-orphan"
     )
 
+    __table_args__ = (
+        Index(
+            "idx_users_pending_purge",
+            "deleted_at",
+            postgresql_where=text("deleted_at IS NOT NULL"),
+        ),
+    )
+
 
 class RefreshToken(Base):
     __tablename__ = "refresh_token"
@@ -89,6 +103,7 @@ class RefreshToken(Base):
     exp: Mapped[int] = mapped_column(BigInteger, nullable=False)
     user_id: Mapped[str] = mapped_column(
         ForeignKey("users.user_id", ondelete="CASCADE"),
+        index=True
     )
     user: Mapped["User"] = relationship(back_populates="refresh_tokens")
 
@@ -119,7 +134,8 @@ class Material(Base):
     title: Mapped[str] = mapped_column(String(256), nullable=False)
     author_id: Mapped[str] = mapped_column(
         ForeignKey("users.user_id", ondelete="RESTRICT"),
-        nullable=False
+        nullable=False,
+        index=True
     )
     content_md: Mapped[str | None] = mapped_column(String, nullable=True)
 
@@ -141,6 +157,7 @@ class SheetMusic(Base):
     owner_id: Mapped[str] = mapped_column(
         ForeignKey("users.user_id", ondelete="RESTRICT"),
         nullable=False,
+        index=True
     )
     owner: Mapped["User"] = relationship(back_populates="sheets")
 
@@ -162,11 +179,13 @@ class MidiFile(Base):
     )
     sheet_id: Mapped[str] = mapped_column(
         ForeignKey("sheet_music.sheet_id", ondelete="CASCADE"),
-        nullable=False
+        nullable=False,
+        index=True
     )
+    # индекс — ведущий столбец ix_midi_files_uploaded_by_content_sha256
     uploaded_by: Mapped[str] = mapped_column(
         ForeignKey("users.user_id", ondelete="RESTRICT"),
-        nullable=False
+        nullable=False,
     )
 
     filename: Mapped[str] = mapped_column(String(256), nullable=False)
@@ -183,14 +202,76 @@ class MidiFile(Base):
     parsed_json: Mapped[dict] = mapped_column(
         JSONB,
         nullable=False,
-        server_default=text("'{}'::jsonb")
-    )
+        server_default=text("'{}'::jsonb"),
+        deferred=True,
+    )
+    # sha256 исходного файла: повторный bulk-импорт пропускает уже загруженные
+    content_sha256: Mapped[str | None] = mapped_column(String(64))
+
+    # признаки сложности (app/analysis/difficulty.py); NULL — ещё не посчитаны
+    features_version: Mapped[int | None] = mapped_column(SmallInteger)
+    note_count: Mapped[int | None] = mapped_column(Integer)
+    duration_s: Mapped[float | None] = mapped_column(Float)
+    notes_per_second: Mapped[float | None] = mapped_column(Float, index=True)
+    pitch_min: Mapped[int | None] = mapped_column(SmallInteger)
+    pitch_max: Mapped[int | None] = mapped_column(SmallInteger)
+    pitch_range: Mapped[int | None] = mapped_column(SmallInteger, index=True)
+    position_shifts: Mapped[int | None] = mapped_column(Integer)
+    max_position: Mapped[int | None] = mapped_column(SmallInteger, index=True)
+    mean_abs_interval: Mapped[float | None] = mapped_column(Float)
+    large_leap_ratio: Mapped[float | None] = mapped_column(Float)
+    min_note_s: Mapped[float | None] = mapped_column(Float)
+    short_note_ratio: Mapped[float | None] = mapped_column(Float)
+    polyphony_ratio: Mapped[float | None] = mapped_column(Float, index=True)
+    tempo_bpm: Mapped[float | None] = mapped_column(Float, index=True)
+    difficulty: Mapped[float | None] = mapped_column(Float, index=True)
 
     sheet: Mapped["SheetMusic"] = relationship(back_populates="midi_files")
     uploader: Mapped["User"] = relationship(back_populates="midi_files")
     sessions: Mapped[list["PracticeSession"]] = relationship(
         back_populates="midi_file"
     )
+    ngram_profile: Mapped["MidiNgramProfile"] = relationship(
+        back_populates="midi_file", passive_deletes=True
+    )
+
+    __table_args__ = (
+        Index("ix_midi_files_uploaded_by_content_sha256", "uploaded_by", "content_sha256"),
+    )
+
+
+class MidiNgramProfile(Base):
+    """N-граммы мелодии эталона (app/analysis/similarity.py) для поиска похожих.
+
+    grams — различные n-граммы по возрастанию, counts — их повторы. GIN-индекс
+    по grams служит инвертированным индексом; частоты n-грамм по всем
+    эталонам ведёт триггер в ngram_frequencies, см. миграцию add_midi_ngram_index.
+    """
+    __tablename__ = "midi_ngram_profiles"
+
+    midi_file_id: Mapped[str] = mapped_column(
+        ForeignKey("midi_files.midi_file_id", ondelete="CASCADE"),
+        primary_key=True
+    )
+    grams: Mapped[list[int]] = mapped_column(ARRAY(Integer), nullable=False)
+    counts: Mapped[list[int]] = mapped_column(ARRAY(Integer), nullable=False)
+
+    midi_file: Mapped["MidiFile"] = relationship(back_populates="ngram_profile")
+
+    __table_args__ = (
+        Index("ix_midi_ngram_profiles_grams", "grams", postgresql_using="gin"),
+    )
+
+
+class NgramFrequency(Base):
+    """В скольких эталонах встречается n-грамма (document frequency).
+
+    Строки gram = DOCUMENT_COUNT_GRAMS (0..15) — число эталонов с профилем по шардам.
+    """
+    __tablename__ = "ngram_frequencies"
+
+    gram: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    df: Mapped[int] = mapped_column(Integer, nullable=False, server_default=text("0"))
 
 
 class PracticeSession(Base):
@@ -208,11 +289,13 @@ class PracticeSession(Base):
     )
     sheet_id: Mapped[str] = mapped_column(
         ForeignKey("sheet_music.sheet_id", ondelete="RESTRICT"),
-        nullable=False
+        nullable=False,
+        index=True
     )
     midi_file_id: Mapped[str] = mapped_column(
         ForeignKey("midi_files.midi_file_id", ondelete="RESTRICT"),
-        nullable=False
+        nullable=False,
+        index=True
     )
 
     status: Mapped[SessionStatus] = mapped_column(
@@ -224,7 +307,8 @@ class PracticeSession(Base):
     metric_pref: Mapped[dict] = mapped_column(
         JSONB,
         nullable=False,
-        server_default=text("'{}'::jsonb")
+        server_default=text("'{}'::jsonb"),
+        deferred=True,
     )
     audio_url: Mapped[str | None] = mapped_column(
         String(512),
@@ -233,6 +317,23 @@ class PracticeSession(Base):
 
     start_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True))
     end_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True))
+    # вариант эталона: темп относительно оригинала и транспонирование в полутонах
+    tempo_factor: Mapped[float] = mapped_column(
+        Numeric(3, 2),
+        nullable=False,
+        server_default=text("1.00")
+    )
+    transpose: Mapped[int] = mapped_column(
+        SmallInteger,
+        nullable=False,
+        server_default=text("0")
+    )
+    # версия для оптимистичной блокировки (compare-and-swap в update)
+    version: Mapped[int] = mapped_column(
+        Integer,
+        nullable=False,
+        server_default=text("0")
+    )
 
     user: Mapped["User"] = relationship(back_populates="sessions")
     sheet: Mapped["SheetMusic"] = relationship(back_populates="sessions")
@@ -240,14 +341,40 @@ class PracticeSession(Base):
     live_metrics: Mapped[list["LiveSessionMetric"]] = relationship(
         back_populates="session", cascade="all, delete-orphan"
     )
+    archived_metrics: Mapped[list["ArchivedSessionMetric"]] = relationship(
+        back_populates="session", cascade="all, delete-orphan"
+    )
     report: Mapped["Report"] = relationship(
         back_populates="session", uselist=False, cascade="all, delete-orphan"
     )
+    audio_uploads: Mapped[list["SessionAudioUpload"]] = relationship(
+        back_populates="session", cascade="all, delete-orphan"
+    )
 
     __table_args__ = (
         Index("idx_session_user_status", "user_id", "status"),
     )
 
+class SessionAudioUpload(Base):
+    """Докачиваемая загрузка записи сессии; принятые байты лежат в .part файле."""
+    __tablename__ = "session_audio_uploads"
+
+    upload_id: Mapped[str] = mapped_column(
+        UUID(as_uuid=False),
+        primary_key=True,
+        default=lambda _: str(uuid.uuid4())
+    )
+    session_id: Mapped[str] = mapped_column(
+        ForeignKey("practice_sessions.session_id", ondelete="CASCADE"),
+        nullable=False,
+        index=True
+    )
+    size: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    suffix: Mapped[str] = mapped_column(String(8), nullable=False)
+    completed_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True))
+
+    session: Mapped["PracticeSession"] = relationship(back_populates="audio_uploads")
+
 class LiveSessionMetric(Base):
     """Метрики, получаемые в реальном времени."""
     __tablename__ = "live_session_metrics"
@@ -283,6 +410,30 @@ class LiveSessionMetric(Base):
 
     session: Mapped["PracticeSession"] = relationship(back_populates="live_metrics")
 
+    __table_args__ = (
+        # покрывает FK (каскад, архивация) и выборку метрик сессии по коду и времени
+        Index("idx_live_metric_session_code_offset", "session_id", "matric_code", "offset_ms"),
+    )
+
+class ArchivedSessionMetric(Base):
+    """Метрики завершённой сессии, упакованные в сжатый колоночный блоб."""
+    __tablename__ = "archived_session_metrics"
+
+    session_id: Mapped[str] = mapped_column(
+        ForeignKey("practice_sessions.session_id", ondelete="CASCADE"),
+        primary_key=True
+    )
+    matric_code: Mapped[str] = mapped_column(String(32), primary_key=True)
+    algo_version: Mapped[int] = mapped_column(SmallInteger, primary_key=True)
+
+    row_count: Mapped[int] = mapped_column(Integer, nullable=False)
+    first_offset_ms: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    last_offset_ms: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    encoding: Mapped[int] = mapped_column(SmallInteger, nullable=False)
+    payload: Mapped[bytes] = mapped_column(LargeBinary, nullable=False, deferred=True)
+
+    session: Mapped["PracticeSession"] = relationship(back_populates="archived_metrics")
+
 class Report(Base):
     """Финальный отчёт после завершения сессии."""
     __tablename__ = "reports"
@@ -294,7 +445,8 @@ class Report(Base):
     )
     session_id: Mapped[str] = mapped_column(
         ForeignKey("practice_sessions.session_id", ondelete="CASCADE"),
-        nullable=False
+        nullable=False,
+        index=True
     )
     user_id: Mapped[str] = mapped_column(
         ForeignKey("users.user_id", ondelete="RESTRICT"),
@@ -307,7 +459,8 @@ class Report(Base):
     summary: Mapped[dict] = mapped_column(
         JSONB,
         nullable=False,
-        server_default=text("'{}'::jsonb")
+        server_default=text("'{}'::jsonb"),
+        deferred=True,
     )
     algo_version: Mapped[int] = mapped_column(
         SmallInteger,
@@ -320,4 +473,20 @@ class Report(Base):
 
     __table_args__ = (
         Index("idx_report_user_session", "user_id", "session_id", "created_at"),
-    )
\ No newline at end of file
+    )
+
+class SheetScoreHistogram(Base):
+    """Гистограмма оценок отчётов по произведению (корзины по 1 баллу).
+
+    Поддерживается триггерами на reports и practice_sessions, см. миграцию
+    add_sheet_score_histograms; пересобрать: python -m app.jobs.score_histograms.
+    """
+    __tablename__ = "sheet_score_histograms"
+
+    sheet_id: Mapped[str] = mapped_column(
+        ForeignKey("sheet_music.sheet_id", ondelete="CASCADE"),
+        primary_key=True
+    )
+    algo_version: Mapped[int] = mapped_column(SmallInteger, primary_key=True)
+    counts: Mapped[list[int]] = mapped_column(ARRAY(Integer), nullable=False)
+    total: Mapped[int] = mapped_column(Integer, nullable=False, server_default=text("0"))
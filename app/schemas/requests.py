@@ -1,6 +1,5 @@
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field
 from app.models.enums import UserRole, SessionStatus
-from datetime import datetime
 
 class BaseRequest(BaseModel):
     # may define additional fields or config shared across requests
@@ -27,14 +26,33 @@ class PracticeSessionCreateRequest(BaseRequest):
     sheet_id: str
     midi_file_id: str
     metric_pref: dict | None = None
+    # вариант эталона: 0.5 — половина исходного темпа, transpose — в полутонах
+    tempo_factor: float = Field(default=1.0, ge=0.25, le=2.0)
+    transpose: int = Field(default=0, ge=-24, le=24)
 
     model_config = ConfigDict(from_attributes=True)
 
 class PracticeSessionUpdateRequest(BaseRequest):
+    # версия, которую видел клиент; при расхождении — 409
+    version: int
     status: SessionStatus | None = None
     metric_pref: dict | None = None
-    audio_url: str | None = None
-    start_at: datetime | None = None
-    end_at: datetime | None = None
 
-    model_config = ConfigDict(from_attributes=True)
+    # audio_url проставляет сервер при завершении загрузки; попытка задать его — 422
+    model_config = ConfigDict(from_attributes=True, extra="forbid")
+
+class MidiPartRequest(BaseRequest):
+    # индекс партии из parsed_json["parts"] и версия эталона, которую видел клиент
+    part: int = Field(ge=0)
+    version: int
+
+class UserMetricPrefRequest(BaseRequest):
+    metric_pref: dict
+
+class AudioUploadCreateRequest(BaseRequest):
+    # полный размер записи в байтах и имя файла (нужно только расширение)
+    size: int = Field(gt=0)
+    filename: str = Field(max_length=256)
+
+class AudioUploadFinalizeRequest(BaseRequest):
+    sha256: str = Field(pattern=r"^[0-9a-fA-F]{64}$")
@@ -1,7 +1,7 @@
 from datetime import datetime
 
 from pydantic import BaseModel, ConfigDict
-from app.models.enums import SessionStatus
+from app.models.enums import FileStatus, SessionStatus
 
 
 class BaseResponse(BaseModel):
@@ -25,6 +25,44 @@ class SheetMusicResponse(BaseResponse):
     uploaded_by: str
     uploaded_at: datetime
 
+class MidiFileResponse(BaseResponse):
+    midi_file_id: str
+    sheet_id: str
+    uploaded_by: str
+    filename: str
+    status: FileStatus
+    version: int
+    created_at: datetime
+    updated_at: datetime
+    # признаки сложности; None, пока файл не разобран или не прошёл backfill
+    difficulty: float | None = None
+    note_count: int | None = None
+    duration_s: float | None = None
+    notes_per_second: float | None = None
+    pitch_min: int | None = None
+    pitch_max: int | None = None
+    pitch_range: int | None = None
+    position_shifts: int | None = None
+    max_position: int | None = None
+    mean_abs_interval: float | None = None
+    large_leap_ratio: float | None = None
+    min_note_s: float | None = None
+    short_note_ratio: float | None = None
+    polyphony_ratio: float | None = None
+    tempo_bpm: float | None = None
+
+class SimilarReferenceResponse(BaseResponse):
+    midi_file_id: str
+    sheet_id: str
+    filename: str
+    # доля (с весами idf) n-грамм запроса, найденная у эталона
+    containment: float
+    # сходство множеств n-грамм; duplicate — почти совпадающие эталоны
+    jaccard: float
+    shared_interval_ngrams: int
+    shared_rhythm_ngrams: int
+    duplicate: bool
+
 class PracticeSessionResponse(BaseResponse):
     session_id: str
     user_id: str
@@ -33,7 +71,41 @@ class PracticeSessionResponse(BaseResponse):
     status: SessionStatus
     metric_pref: dict
     audio_url: str | None = None
+    tempo_factor: float
+    transpose: int
     start_at: datetime | None = None
     end_at: datetime | None = None
     created_at: datetime
-    updated_at: datetime
\ No newline at end of file
+    updated_at: datetime
+    version: int
+
+class LiveSessionMetricResponse(BaseResponse):
+    matric_code: str
+    algo_version: int
+    offset_ms: int
+    window_ms: int
+    value: float
+    score: float
+
+class UserMetricPrefResponse(BaseResponse):
+    metric_pref: dict
+    effective: dict
+
+class AudioUploadResponse(BaseResponse):
+    upload_id: str
+    session_id: str
+    size: int
+    offset: int
+    completed_at: datetime | None = None
+
+class SheetScoreStatsResponse(BaseResponse):
+    sheet_id: str
+    algo_version: int | None = None
+    total: int
+    # p10, p25, p50, p75, p90
+    quantiles: dict[str, float]
+    # гистограмма по корзинам в 1 балл: counts[b] — оценки из [b, b + 1)
+    counts: list[int]
+    best_score: float | None = None
+    percentile: float | None = None
+    rank: int | None = None
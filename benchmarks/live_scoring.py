@@ -0,0 +1,110 @@
+"""Пропускная способность StreamingScorer: сколько сессий тянет одно ядро.
+
+Синтетические эталоны и треки высоты (кадр 10 мс), БД и аудио не нужны.
+Все сессии обслуживаются в одном потоке по очереди, как в воркере: за каждый
+такт каждая сессия получает пачку кадров длиной --chunk-ms.
+
+    python benchmarks/live_scoring.py --sessions 200 --seconds 60
+    python benchmarks/live_scoring.py --sessions 500 --min-realtime 2.0
+
+realtime — отношение сыгранного времени всех сессий к затраченному: при
+realtime >= 1 одно ядро успевает за всеми сессиями одновременно. Код
+возврата 1, если realtime меньше --min-realtime.
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import numpy as np  # noqa: E402
+
+from app.analysis.live_scoring import FRAME_PERIOD_MS, StreamingScorer  # noqa: E402
+from app.analysis.metric_config import MetricConfig  # noqa: E402
+from app.analysis.note_index import NoteIndex  # noqa: E402
+from app.analysis.pitch import PitchFrames  # noqa: E402
+
+
+def synthetic_reference(rng: np.random.Generator, seconds: float) -> NoteIndex:
+    """Мелодия в диапазоне скрипки с нотами 0.15-0.6 с и редкими паузами."""
+    notes, t = [], 0.0
+    while t < seconds:
+        length = rng.uniform(0.15, 0.6)
+        if rng.random() > 0.1:
+            notes.append({"start": t, "end": t + length, "pitch": int(rng.integers(55, 88))})
+        t += length
+    return NoteIndex.from_parsed({"notes": notes})
+
+
+def synthetic_take(rng: np.random.Generator, index: NoteIndex, seconds: float) -> PitchFrames:
+    """Исполнение по эталону: сдвиг интонации, вибрато, запаздывание и шум."""
+    times = np.arange(0.0, seconds, FRAME_PERIOD_MS / 1000.0)
+    played = index.expected_pitch(times - rng.uniform(0.0, 0.05))
+    cents = rng.normal(0.0, 15.0) + 20.0 * np.sin(2 * np.pi * 5.5 * times) + rng.normal(0.0, 5.0, times.size)
+    f0 = np.where(played >= 0, 440.0 * np.exp2((played - 69.0) / 12.0 + cents / 1200.0), 0.0)
+    onset = np.zeros(times.size, dtype=bool)
+    onset[1:] = (played[1:] != played[:-1]) & (played[1:] >= 0)
+    return PitchFrames(time_s=times, f0_hz=f0, confidence=np.ones(times.size), onset=onset)
+
+
+def _slice(frames: PitchFrames, part: slice) -> PitchFrames:
+    return PitchFrames(
+        time_s=frames.time_s[part], f0_hz=frames.f0_hz[part],
+        confidence=frames.confidence[part], onset=frames.onset[part],
+    )
+
+
+def run(sessions: int, seconds: float, chunk_ms: int, seed: int) -> tuple[float, int, int]:
+    """(затраченное время, число кадров, число строк метрик)."""
+    rng = np.random.default_rng(seed)
+    config = MetricConfig()
+    scorers, takes = [], []
+    for n in range(sessions):
+        index = synthetic_reference(rng, seconds)
+        scorers.append(StreamingScorer(f"session-{n}", index, config))
+        takes.append(synthetic_take(rng, index, seconds))
+    step = max(chunk_ms // FRAME_PERIOD_MS, 1)
+    total_frames = takes[0].time_s.size
+    # пачки нарезаются заранее: замеряется только оценка
+    ticks = [
+        [_slice(take, slice(start, start + step)) for take in takes]
+        for start in range(0, total_frames, step)
+    ]
+
+    rows = 0
+    started = time.perf_counter()
+    for tick in ticks:
+        for scorer, frames in zip(scorers, tick):
+            rows += len(scorer.push(frames))
+    for scorer in scorers:
+        rows += len(scorer.flush())
+    elapsed = time.perf_counter() - started
+    return elapsed, total_frames * sessions, rows
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Single-core throughput of the streaming scorer")
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--seconds", type=float, default=60.0, help="length of every synthetic take")
+    parser.add_argument("--chunk-ms", type=int, default=100, help="audio per push, as sent by a client")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--min-realtime", type=float, default=None, help="fail if slower than this")
+    args = parser.parse_args()
+
+    elapsed, frames, rows = run(args.sessions, args.seconds, args.chunk_ms, args.seed)
+    realtime = args.sessions * args.seconds / elapsed
+    print(f"sessions:      {args.sessions} x {args.seconds:.0f} s, {args.chunk_ms} ms per push")
+    print(f"elapsed:       {elapsed:.2f} s")
+    print(f"frames/s:      {frames / elapsed:,.0f}")
+    print(f"metric rows:   {rows}")
+    print(f"realtime:      {realtime:.1f}x ({realtime:.0f} concurrent sessions per core)")
+
+    if args.min_realtime is not None and realtime < args.min_realtime:
+        print(f"FAIL: realtime {realtime:.1f}x is below {args.min_realtime}x", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
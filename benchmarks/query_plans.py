@@ -0,0 +1,234 @@
+"""Проверка планов запросов эндпоинтов и фоновых задач: нет Seq Scan по большим таблицам.
+
+Нужна локальная БД с применёнными миграциями (alembic upgrade head) и те же
+переменные окружения / .env, что и для приложения. Не запускайте против
+рабочей базы: --seed вставляет синтетические данные, а сценарий вызывает
+эндпоинты от имени засеянного пользователя (в конце — DELETE /users/me).
+
+    python benchmarks/query_plans.py --seed 20000   # засеять и проверить
+    python benchmarks/query_plans.py                # проверить на имеющихся данных
+
+SQL эндпоинтов не переписывается вручную: сценарий ENDPOINT_SCRIPT
+выполняется через ASGI-транспорт, а хук before_cursor_execute собирает
+каждый выполненный запрос с его параметрами. Запросы фоновых задач берутся
+из тех же функций-построителей, что использует сама задача. Для каждого
+запроса выполняется EXPLAIN (FORMAT JSON); код возврата 1, если в плане
+есть последовательное чтение таблицы из LARGE_TABLES, в которой по
+статистике больше --min-rows строк.
+"""
+import argparse
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import httpx  # noqa: E402
+from sqlalchemy import event, select, text  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncConnection  # noqa: E402
+
+from app.api.history_export import _live_metrics_query  # noqa: E402
+from app.core import database_session  # noqa: E402
+from app.core.security.jwt import create_jwt_token  # noqa: E402
+from app.jobs.account_purge import _foreign_sessions, _purged_midi_files, _purged_sessions  # noqa: E402
+from app.jobs.metrics_archive import ARCHIVE_SESSIONS_PER_RUN, _archivable_sessions  # noqa: E402
+from app.main import app  # noqa: E402
+from app.models.models import PracticeSession, User  # noqa: E402
+
+LARGE_TABLES = (
+    "sheet_music",
+    "midi_files",
+    "practice_sessions",
+    "live_session_metrics",
+    "reports",
+    "refresh_token",
+    "midi_ngram_profiles",
+)
+
+SEED_SQL = """
+WITH u AS (
+    INSERT INTO users (user_id, name, login, hashed_password, role)
+    SELECT gen_random_uuid(), 'seed', 'plan-seed-' || gen_random_uuid(), 'x', 'USER'
+    FROM generate_series(1, CAST(:n AS integer) / 10)
+    RETURNING user_id
+), s AS (
+    INSERT INTO sheet_music (sheet_id, title, owner_id)
+    SELECT gen_random_uuid(), 'seed', user_id FROM u, generate_series(1, 2)
+    RETURNING sheet_id, owner_id
+), m AS (
+    INSERT INTO midi_files (midi_file_id, sheet_id, uploaded_by, filename, status)
+    SELECT gen_random_uuid(), sheet_id, owner_id, 'seed.mid', 'READY' FROM s
+    RETURNING midi_file_id, sheet_id, uploaded_by
+), p AS (
+    INSERT INTO practice_sessions (session_id, user_id, sheet_id, midi_file_id, status)
+    SELECT gen_random_uuid(), uploaded_by, sheet_id, midi_file_id, 'DONE' FROM m, generate_series(1, 5)
+    RETURNING session_id, user_id
+), r AS (
+    INSERT INTO reports (report_id, session_id, user_id, overall_score)
+    SELECT gen_random_uuid(), session_id, user_id, round((random() * 100)::numeric, 2) FROM p
+), n AS (
+    INSERT INTO midi_ngram_profiles (midi_file_id, grams, counts)
+    SELECT midi_file_id, g.grams, array_fill(1, ARRAY[cardinality(g.grams)])
+    FROM m, LATERAL (
+        SELECT ARRAY(
+            SELECT DISTINCT (1 << 28) + (random() * 5000)::int
+            FROM generate_series(1, 40) WHERE m.midi_file_id IS NOT NULL ORDER BY 1
+        ) AS grams
+    ) AS g
+), t AS (
+    INSERT INTO refresh_token (refresh_token, used, exp, user_id)
+    SELECT 'plan-seed-' || gen_random_uuid(), false, 0, user_id FROM u, generate_series(1, 5)
+)
+INSERT INTO live_session_metrics (live_metric_id, session_id, offset_ms, matric_code, value, score, window_ms)
+SELECT gen_random_uuid(), session_id, k * 100, 'pitch_hz', 440, 90, 100 FROM p, generate_series(1, 20) AS k
+"""
+
+
+async def _sample(conn: AsyncConnection) -> dict:
+    row = (await conn.execute(
+        select(
+            PracticeSession.session_id,
+            PracticeSession.user_id,
+            PracticeSession.sheet_id,
+            PracticeSession.midi_file_id,
+        )
+        # пользователь мог быть удалён прошлым прогоном сценария
+        .join(User, User.user_id == PracticeSession.user_id)
+        .where(User.deleted_at.is_(None))
+        .limit(1)
+    )).one()
+    return row._asdict()
+
+
+# (метод, путь) — подставляются id засеянной сессии; только чтение, кроме последнего шага
+ENDPOINT_SCRIPT = (
+    ("GET", "/users/me"),
+    ("GET", "/users/me/metric-pref"),
+    ("GET", "/users/me/export?table=metrics&format=ndjson"),
+    ("GET", "/sheet-music/mylist"),
+    ("GET", "/sheet-music/{sheet_id}"),
+    ("GET", "/sheet-music/{sheet_id}/midi-files"),
+    ("GET", "/sheet-music/{sheet_id}/scores"),
+    ("GET", "/practice-sessions/mylist"),
+    ("GET", "/practice-sessions/{session_id}"),
+    ("GET", "/practice-sessions/{session_id}/metrics?matric_code=pitch_hz&from_ms=0"),
+    ("GET", "/practice-sessions/{session_id}/audio"),
+    ("GET", "/references/catalog"),
+    ("GET", "/references/{midi_file_id}/similar"),
+    ("GET", "/references/{midi_file_id}/parts"),
+    ("GET", "/references/{midi_file_id}/notes"),
+    ("GET", "/references/{midi_file_id}/upcoming?t_ms=0"),
+    ("GET", "/references/{midi_file_id}/file"),
+    ("DELETE", "/users/me"),
+)
+
+# начала SQL, план которых имеет смысл проверять
+EXPLAINED_PREFIXES = ("SELECT", "WITH", "UPDATE", "DELETE")
+
+
+def _job_queries(ids: dict) -> dict:
+    """Запросы фоновых задач — из их собственных построителей."""
+    return {
+        "purge sessions": _purged_sessions(ids["user_id"]),
+        "purge foreign sessions": _foreign_sessions(ids["user_id"]),
+        "purge midi files": _purged_midi_files(ids["user_id"]),
+        "archive candidates": _archivable_sessions(ARCHIVE_SESSIONS_PER_RUN),
+        "export live metrics": _live_metrics_query(ids["user_id"]),
+    }
+
+
+async def capture_endpoint_queries(ids: dict) -> dict[str, tuple[str, tuple]]:
+    """Прогоняет ENDPOINT_SCRIPT и возвращает {имя: (SQL, параметры)} без повторов."""
+    captured: dict[str, tuple[str, tuple]] = {}
+    seen: set[str] = set()
+    current, step_count = "", 0
+
+    def hook(conn, cursor, statement, parameters, context, executemany):
+        nonlocal step_count
+        if executemany or not statement.lstrip().upper().startswith(EXPLAINED_PREFIXES) or statement in seen:
+            return
+        seen.add(statement)
+        step_count += 1
+        captured[f"{current} #{step_count}"] = (statement, tuple(parameters or ()))
+
+    engine = database_session.init_async_engine()
+    headers = {"Authorization": f"Bearer {create_jwt_token(ids['user_id']).access_token}"}
+    # ошибки приложения (например, у засеянных эталонов нет parsed_json) не прерывают сценарий:
+    # запросы до ошибки уже собраны
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    event.listen(engine.sync_engine, "before_cursor_execute", hook)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://plans", headers=headers) as client:
+            for method, path in ENDPOINT_SCRIPT:
+                current, step_count = f"{method} {path.split('?')[0]}", 0
+                response = await client.request(method, path.format(**ids))
+                await response.aread()
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", hook)
+    return captured
+
+
+def _seq_scans(plan: dict) -> list[str]:
+    found = [plan["Relation Name"]] if plan.get("Node Type") == "Seq Scan" else []
+    for child in plan.get("Plans", ()):
+        found += _seq_scans(child)
+    return found
+
+
+async def _explain(conn: AsyncConnection, sql: str, parameters: tuple = ()) -> dict:
+    # EXPLAIN без ANALYZE: запросы на изменение не выполняются
+    plan = (await conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {sql}", parameters)).scalar_one()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Plan"]
+
+
+def _compile(conn: AsyncConnection, stmt) -> str:
+    # литералы вместо параметров: так в SQL попадают и значения Enum
+    return stmt.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True}).string
+
+
+async def run(seed: int, min_rows: int) -> int:
+    engine = database_session.init_async_engine()
+    try:
+        async with engine.connect() as conn:
+            if seed:
+                await conn.execute(text(SEED_SQL), {"n": seed})
+                await conn.commit()
+            await conn.execute(text("ANALYZE"))
+
+            sizes = dict((await conn.execute(
+                text("SELECT relname, reltuples::bigint FROM pg_class WHERE relname = ANY(:names)"),
+                {"names": list(LARGE_TABLES)},
+            )).all())
+            large = {name for name, rows in sizes.items() if rows >= min_rows}
+            ids = await _sample(conn)
+            await conn.commit()
+
+        queries = await capture_endpoint_queries(ids)
+        failed = False
+        async with engine.connect() as conn:
+            for name, stmt in _job_queries(ids).items():
+                queries[f"job {name}"] = (_compile(conn, stmt), ())
+            for name, (sql, params) in queries.items():
+                plan = await _explain(conn, sql, params)
+                bad = sorted(set(_seq_scans(plan)) & large)
+                print(f"{'FAIL' if bad else 'ok':4}  {name}" + (f"  (Seq Scan on {', '.join(bad)})" if bad else ""))
+                failed |= bool(bad)
+            await conn.rollback()
+    finally:
+        await database_session.dispose_async_engine()
+    return 1 if failed else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed", type=int, default=0, help="сколько сессий практики досеять перед проверкой")
+    parser.add_argument("--min-rows", type=int, default=1000, help="таблица считается большой от стольких строк")
+    args = parser.parse_args()
+    return asyncio.run(run(args.seed, args.min_rows))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+"""Бюджет времени старта: холодный импорт app.main и время до первого ответа.
+
+Запуск из корня проекта (нужны те же переменные окружения / .env, что и
+для приложения; БД для замера не нужна):
+
+    python benchmarks/startup.py --import-budget 1.5 --first-request-budget 4.0
+
+Код возврата 1, если медиана превысила бюджет или при импорте
+подтянулись тяжёлые зависимости, которые должны грузиться лениво.
+"""
+import argparse
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+PROJECT_DIR = Path(__file__).parent.parent
+
+# модули, которые не должны попадать в процесс при импорте приложения
+LAZY_MODULES = ("numpy", "pretty_midi", "mido")
+
+IMPORT_PROBE = """
+import sys, time
+t = time.perf_counter()
+import app.main
+elapsed = time.perf_counter() - t
+print(elapsed)
+print(",".join(m for m in {lazy!r} if m in sys.modules))
+"""
+
+
+def measure_import() -> tuple[float, list[str]]:
+    out = subprocess.run(
+        [sys.executable, "-c", IMPORT_PROBE.format(lazy=LAZY_MODULES)],
+        cwd=PROJECT_DIR,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout.splitlines()
+    return float(out[0]), [m for m in out[1].split(",") if m]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_first_request(timeout: float = 30.0) -> float:
+    port = _free_port()
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=PROJECT_DIR,
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/openapi.json", timeout=1) as resp:
+                    if resp.status == 200:
+                        return time.perf_counter() - started
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.01)
+            if proc.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with code {proc.returncode}")
+        raise TimeoutError("server did not answer in time")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--import-budget", type=float, default=1.5, help="секунды, медиана")
+    parser.add_argument("--first-request-budget", type=float, default=4.0, help="секунды, медиана")
+    args = parser.parse_args()
+
+    import_times: list[float] = []
+    leaked: set[str] = set()
+    for _ in range(args.repeat):
+        elapsed, modules = measure_import()
+        import_times.append(elapsed)
+        leaked.update(modules)
+
+    first_request = [measure_first_request() for _ in range(args.repeat)]
+
+    import_median = statistics.median(import_times)
+    first_median = statistics.median(first_request)
+    print(f"import app.main:   median {import_median:.3f}s  (budget {args.import_budget:.3f}s)")
+    print(f"first request:     median {first_median:.3f}s  (budget {args.first_request_budget:.3f}s)")
+
+    failed = False
+    if leaked:
+        print(f"FAIL: eagerly imported heavy modules: {', '.join(sorted(leaked))}")
+        failed = True
+    if import_median > args.import_budget:
+        print("FAIL: import budget exceeded")
+        failed = True
+    if first_median > args.first_request_budget:
+        print("FAIL: first request budget exceeded")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
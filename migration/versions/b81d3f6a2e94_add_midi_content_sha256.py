@@ -0,0 +1,39 @@
+"""add midi content sha256
+
+Revision ID: b81d3f6a2e94
+Revises: a4c9e27b5d86
+Create Date: 2026-10-19 16:47:05.918274
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b81d3f6a2e94'
+down_revision: Union[str, None] = 'a4c9e27b5d86'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('midi_files', sa.Column('content_sha256', sa.String(length=64), nullable=True))
+    # индекс — без блокировки записи в midi_files, как в add_foreign_key_indexes
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_midi_files_uploaded_by_content_sha256', 'midi_files', ['uploaded_by', 'content_sha256'],
+            unique=False, postgresql_concurrently=True, if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_midi_files_uploaded_by_content_sha256', table_name='midi_files',
+            postgresql_concurrently=True, if_exists=True,
+        )
+    op.drop_column('midi_files', 'content_sha256')
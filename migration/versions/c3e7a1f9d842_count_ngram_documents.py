@@ -0,0 +1,88 @@
+"""count ngram documents
+
+Revision ID: c3e7a1f9d842
+Revises: b81d3f6a2e94
+Create Date: 2026-10-19 19:05:41.207316
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3e7a1f9d842'
+down_revision: Union[str, None] = 'b81d3f6a2e94'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Строка gram = 0 (ни одна n-грамма так не кодируется, см. similarity) хранит в
+# df число проиндексированных эталонов — /similar не считает их COUNT(*).
+# Она меньше любой n-граммы, поэтому берётся первой и порядок блокировок
+# по возрастанию gram сохраняется.
+NGRAM_FUNCTIONS = """
+CREATE OR REPLACE FUNCTION midi_ngram_frequencies() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        UPDATE ngram_frequencies
+        SET df = GREATEST(df - 1, 0), updated_at = now()
+        WHERE gram = 0;
+    ELSIF TG_OP = 'INSERT' THEN
+        INSERT INTO ngram_frequencies AS f (gram, df) VALUES (0, 1)
+        ON CONFLICT (gram) DO UPDATE SET df = f.df + 1, updated_at = now();
+    END IF;
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        PERFORM 1 FROM ngram_frequencies WHERE gram = ANY(OLD.grams) ORDER BY gram FOR UPDATE;
+        UPDATE ngram_frequencies
+        SET df = GREATEST(df - 1, 0), updated_at = now()
+        WHERE gram = ANY(OLD.grams);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO ngram_frequencies AS f (gram, df)
+        SELECT g, 1 FROM unnest(NEW.grams) AS g ORDER BY g
+        ON CONFLICT (gram) DO UPDATE SET df = f.df + 1, updated_at = now();
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+PREVIOUS_NGRAM_FUNCTIONS = """
+CREATE OR REPLACE FUNCTION midi_ngram_frequencies() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        PERFORM 1 FROM ngram_frequencies WHERE gram = ANY(OLD.grams) ORDER BY gram FOR UPDATE;
+        UPDATE ngram_frequencies
+        SET df = GREATEST(df - 1, 0), updated_at = now()
+        WHERE gram = ANY(OLD.grams);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO ngram_frequencies AS f (gram, df)
+        SELECT g, 1 FROM unnest(NEW.grams) AS g ORDER BY g
+        ON CONFLICT (gram) DO UPDATE SET df = f.df + 1, updated_at = now();
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # профили, вставленные между заполнением счётчика и заменой функции, не потеряются:
+    # блокировка таблицы держится до конца транзакции миграции
+    op.execute("LOCK TABLE midi_ngram_profiles IN SHARE ROW EXCLUSIVE MODE")
+    op.execute(NGRAM_FUNCTIONS)
+    op.execute(
+        "INSERT INTO ngram_frequencies (gram, df) "
+        "SELECT 0, count(*) FROM midi_ngram_profiles "
+        "ON CONFLICT (gram) DO UPDATE SET df = EXCLUDED.df, updated_at = now()"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute(PREVIOUS_NGRAM_FUNCTIONS)
+    op.execute(sa.text("DELETE FROM ngram_frequencies WHERE gram = 0"))
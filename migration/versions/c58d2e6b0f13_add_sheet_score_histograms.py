@@ -0,0 +1,107 @@
+"""add sheet score histograms
+
+Revision ID: c58d2e6b0f13
+Revises: 9b3e5f1d7c20
+Create Date: 2026-10-19 13:41:27.106552
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c58d2e6b0f13'
+down_revision: Union[str, None] = '9b3e5f1d7c20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Гистограммы обновляются триггерами, чтобы их не обходил ни один писатель
+# отчётов. Отчёты, удаляемые каскадом вместе с сессией, вычитаются в BEFORE
+# DELETE на practice_sessions: к моменту каскада строки сессии уже не видно.
+HISTOGRAM_FUNCTIONS = """
+CREATE FUNCTION sheet_score_histogram_add(p_sheet_id uuid, p_algo_version smallint, p_score numeric, p_delta integer)
+RETURNS void AS $$
+DECLARE
+    b integer := LEAST(GREATEST(floor(p_score)::integer, 0), 100) + 1;
+BEGIN
+    INSERT INTO sheet_score_histograms AS h (sheet_id, algo_version, counts, total)
+    VALUES (p_sheet_id, p_algo_version, array_fill(0, ARRAY[101]), 0)
+    ON CONFLICT (sheet_id, algo_version) DO NOTHING;
+
+    UPDATE sheet_score_histograms
+    SET counts[b] = GREATEST(counts[b] + p_delta, 0),
+        total = GREATEST(total + p_delta, 0),
+        updated_at = now()
+    WHERE sheet_id = p_sheet_id AND algo_version = p_algo_version;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION reports_score_histogram() RETURNS trigger AS $$
+DECLARE
+    v_sheet_id uuid;
+BEGIN
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        SELECT sheet_id INTO v_sheet_id FROM practice_sessions WHERE session_id = OLD.session_id;
+        IF v_sheet_id IS NOT NULL THEN
+            PERFORM sheet_score_histogram_add(v_sheet_id, OLD.algo_version, OLD.overall_score, -1);
+        END IF;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        SELECT sheet_id INTO v_sheet_id FROM practice_sessions WHERE session_id = NEW.session_id;
+        PERFORM sheet_score_histogram_add(v_sheet_id, NEW.algo_version, NEW.overall_score, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION practice_sessions_score_histogram() RETURNS trigger AS $$
+BEGIN
+    PERFORM sheet_score_histogram_add(OLD.sheet_id, r.algo_version, r.overall_score, -1)
+    FROM reports r WHERE r.session_id = OLD.session_id;
+    RETURN OLD;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.create_table('sheet_score_histograms',
+    sa.Column('sheet_id', sa.UUID(as_uuid=False), nullable=False),
+    sa.Column('algo_version', sa.SmallInteger(), nullable=False),
+    sa.Column('counts', postgresql.ARRAY(sa.Integer()), nullable=False),
+    sa.Column('total', sa.Integer(), server_default=sa.text('0'), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['sheet_id'], ['sheet_music.sheet_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('sheet_id', 'algo_version')
+    )
+    # ### end Alembic commands ###
+    op.execute(HISTOGRAM_FUNCTIONS)
+    op.execute(
+        "CREATE TRIGGER reports_score_histogram "
+        "AFTER INSERT OR DELETE OR UPDATE OF overall_score, algo_version, session_id ON reports "
+        "FOR EACH ROW EXECUTE FUNCTION reports_score_histogram()"
+    )
+    op.execute(
+        "CREATE TRIGGER practice_sessions_score_histogram "
+        "BEFORE DELETE ON practice_sessions "
+        "FOR EACH ROW EXECUTE FUNCTION practice_sessions_score_histogram()"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TRIGGER practice_sessions_score_histogram ON practice_sessions")
+    op.execute("DROP TRIGGER reports_score_histogram ON reports")
+    op.execute("DROP FUNCTION practice_sessions_score_histogram()")
+    op.execute("DROP FUNCTION reports_score_histogram()")
+    op.execute("DROP FUNCTION sheet_score_histogram_add(uuid, smallint, numeric, integer)")
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.drop_table('sheet_score_histograms')
+    # ### end Alembic commands ###
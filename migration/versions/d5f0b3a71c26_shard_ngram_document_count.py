@@ -0,0 +1,123 @@
+"""shard ngram document count
+
+Revision ID: d5f0b3a71c26
+Revises: c3e7a1f9d842
+Create Date: 2026-10-19 21:12:37.540918
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd5f0b3a71c26'
+down_revision: Union[str, None] = 'c3e7a1f9d842'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Число эталонов хранится не в одной строке gram = 0, а в 16 строках
+# gram = 0..15 (similarity.DOCUMENT_COUNT_SHARDS): эталон считается в строке
+# hashtext(midi_file_id) & 15, /similar складывает их. Одна строка-счётчик
+# сериализовала все загрузки, удаления и COPY массового импорта; теперь
+# одновременно ждут друг друга только эталоны одного шарда (и общих n-грамм,
+# как и раньше).
+#
+# Все изменения df строки вносятся одним INSERT ... ON CONFLICT по возрастанию
+# gram: при UPDATE grams раньше блокировались сначала старые n-граммы, потом
+# новые, и два одновременных PUT part могли взаимоблокироваться. Теперь
+# n-граммы, оставшиеся в профиле, не трогаются вовсе, а остальные
+# блокируются (или вставляются) одним упорядоченным проходом; шарды меньше
+# любой n-граммы и идут первыми.
+NGRAM_FUNCTIONS = """
+CREATE OR REPLACE FUNCTION midi_ngram_frequencies() RETURNS trigger AS $$
+DECLARE
+    old_grams integer[] := '{}';
+    new_grams integer[] := '{}';
+    shard integer;
+    documents integer := 0;
+BEGIN
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        old_grams := OLD.grams;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        new_grams := NEW.grams;
+    END IF;
+    IF TG_OP = 'INSERT' THEN
+        shard := hashtext(NEW.midi_file_id::text) & 15;
+        documents := 1;
+    ELSIF TG_OP = 'DELETE' THEN
+        shard := hashtext(OLD.midi_file_id::text) & 15;
+        documents := -1;
+    END IF;
+
+    INSERT INTO ngram_frequencies AS f (gram, df)
+    SELECT gram, sum(delta)
+    FROM (
+        SELECT shard AS gram, documents AS delta WHERE documents <> 0
+        UNION ALL
+        SELECT g, 1 FROM unnest(new_grams) AS g
+        UNION ALL
+        SELECT g, -1 FROM unnest(old_grams) AS g
+    ) AS changes
+    GROUP BY gram
+    HAVING sum(delta) <> 0
+    ORDER BY gram
+    ON CONFLICT (gram) DO UPDATE SET df = GREATEST(f.df + EXCLUDED.df, 0), updated_at = now();
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+PREVIOUS_NGRAM_FUNCTIONS = """
+CREATE OR REPLACE FUNCTION midi_ngram_frequencies() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        UPDATE ngram_frequencies
+        SET df = GREATEST(df - 1, 0), updated_at = now()
+        WHERE gram = 0;
+    ELSIF TG_OP = 'INSERT' THEN
+        INSERT INTO ngram_frequencies AS f (gram, df) VALUES (0, 1)
+        ON CONFLICT (gram) DO UPDATE SET df = f.df + 1, updated_at = now();
+    END IF;
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        PERFORM 1 FROM ngram_frequencies WHERE gram = ANY(OLD.grams) ORDER BY gram FOR UPDATE;
+        UPDATE ngram_frequencies
+        SET df = GREATEST(df - 1, 0), updated_at = now()
+        WHERE gram = ANY(OLD.grams);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO ngram_frequencies AS f (gram, df)
+        SELECT g, 1 FROM unnest(NEW.grams) AS g ORDER BY g
+        ON CONFLICT (gram) DO UPDATE SET df = f.df + 1, updated_at = now();
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # как и в c3e7a1f9d842: вставки ждут конца миграции и не теряются между
+    # заменой функции и пересчётом шардов
+    op.execute("LOCK TABLE midi_ngram_profiles IN SHARE ROW EXCLUSIVE MODE")
+    op.execute(NGRAM_FUNCTIONS)
+    op.execute(sa.text("DELETE FROM ngram_frequencies WHERE gram BETWEEN 0 AND 15"))
+    op.execute(
+        "INSERT INTO ngram_frequencies (gram, df) "
+        "SELECT hashtext(midi_file_id::text) & 15, count(*) FROM midi_ngram_profiles GROUP BY 1"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("LOCK TABLE midi_ngram_profiles IN SHARE ROW EXCLUSIVE MODE")
+    op.execute(PREVIOUS_NGRAM_FUNCTIONS)
+    op.execute(sa.text("DELETE FROM ngram_frequencies WHERE gram BETWEEN 0 AND 15"))
+    op.execute(
+        "INSERT INTO ngram_frequencies (gram, df) "
+        "SELECT 0, count(*) FROM midi_ngram_profiles"
+    )
@@ -0,0 +1,91 @@
+"""add event notify triggers
+
+Revision ID: d7a41c9e3b58
+Revises: c58d2e6b0f13
+Create Date: 2026-10-19 14:22:51.630174
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd7a41c9e3b58'
+down_revision: Union[str, None] = 'c58d2e6b0f13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Канал и формат сообщений — см. app/core/events.py. NOTIFY доставляется
+# только после коммита, поэтому клиенты не увидят откаченных изменений.
+NOTIFY_FUNCTIONS = """
+CREATE FUNCTION practice_sessions_notify() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('app_events', json_build_object(
+            'topic', 'session:' || OLD.session_id, 'event', 'deleted', 'deleted', true
+        )::text);
+    ELSIF NEW.status IS DISTINCT FROM OLD.status THEN
+        PERFORM pg_notify('app_events', json_build_object(
+            'topic', 'session:' || NEW.session_id, 'event', 'status',
+            'status', lower(NEW.status::text), 'version', NEW.version
+        )::text);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION reports_notify() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('app_events', json_build_object(
+        'topic', 'session:' || NEW.session_id, 'event', 'report',
+        'report_id', NEW.report_id, 'overall_score', NEW.overall_score
+    )::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION midi_files_notify() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('app_events', json_build_object(
+            'topic', 'midi:' || OLD.midi_file_id, 'event', 'deleted', 'deleted', true
+        )::text);
+    ELSIF TG_OP = 'INSERT' OR NEW.status IS DISTINCT FROM OLD.status THEN
+        PERFORM pg_notify('app_events', json_build_object(
+            'topic', 'midi:' || NEW.midi_file_id, 'event', 'status',
+            'status', lower(NEW.status::text), 'version', NEW.version
+        )::text);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(NOTIFY_FUNCTIONS)
+    op.execute(
+        "CREATE TRIGGER practice_sessions_notify AFTER UPDATE OF status OR DELETE ON practice_sessions "
+        "FOR EACH ROW EXECUTE FUNCTION practice_sessions_notify()"
+    )
+    op.execute(
+        "CREATE TRIGGER reports_notify AFTER INSERT ON reports "
+        "FOR EACH ROW EXECUTE FUNCTION reports_notify()"
+    )
+    op.execute(
+        "CREATE TRIGGER midi_files_notify AFTER INSERT OR UPDATE OF status OR DELETE ON midi_files "
+        "FOR EACH ROW EXECUTE FUNCTION midi_files_notify()"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TRIGGER midi_files_notify ON midi_files")
+    op.execute("DROP TRIGGER reports_notify ON reports")
+    op.execute("DROP TRIGGER practice_sessions_notify ON practice_sessions")
+    op.execute("DROP FUNCTION midi_files_notify()")
+    op.execute("DROP FUNCTION reports_notify()")
+    op.execute("DROP FUNCTION practice_sessions_notify()")
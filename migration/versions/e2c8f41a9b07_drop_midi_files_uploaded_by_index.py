@@ -0,0 +1,39 @@
+"""drop midi files uploaded_by index
+
+Revision ID: e2c8f41a9b07
+Revises: d5f0b3a71c26
+Create Date: 2026-10-19 21:40:18.305627
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2c8f41a9b07'
+down_revision: Union[str, None] = 'd5f0b3a71c26'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# ix_midi_files_uploaded_by_content_sha256 (add_midi_content_sha256) начинается
+# с uploaded_by и обслуживает те же запросы и проверку RESTRICT при удалении
+# пользователя; одностолбцовый индекс из add_foreign_key_indexes только
+# замедляет вставки в midi_files.
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_midi_files_uploaded_by', table_name='midi_files',
+            postgresql_concurrently=True, if_exists=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_midi_files_uploaded_by', 'midi_files', ['uploaded_by'],
+            unique=False, postgresql_concurrently=True, if_not_exists=True,
+        )
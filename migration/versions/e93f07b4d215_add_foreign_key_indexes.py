@@ -0,0 +1,51 @@
+"""add foreign key indexes
+
+Revision ID: e93f07b4d215
+Revises: d7a41c9e3b58
+Create Date: 2026-10-19 14:58:09.283716
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e93f07b4d215'
+down_revision: Union[str, None] = 'd7a41c9e3b58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# (имя, таблица, столбцы). Индексы строятся CONCURRENTLY, без блокировки записи,
+# поэтому вне транзакции миграции; IF NOT EXISTS — чтобы повтор после
+# прерванной сборки не падал. Недостроенный индекс остаётся INVALID —
+# его нужно удалить вручную и перезапустить миграцию.
+INDEXES = (
+    ("ix_sheet_music_owner_id", "sheet_music", ["owner_id"]),
+    ("ix_midi_files_sheet_id", "midi_files", ["sheet_id"]),
+    ("ix_midi_files_uploaded_by", "midi_files", ["uploaded_by"]),
+    ("idx_live_metric_session_code_offset", "live_session_metrics", ["session_id", "matric_code", "offset_ms"]),
+    ("ix_refresh_token_user_id", "refresh_token", ["user_id"]),
+    ("ix_practice_sessions_sheet_id", "practice_sessions", ["sheet_id"]),
+    ("ix_practice_sessions_midi_file_id", "practice_sessions", ["midi_file_id"]),
+    ("ix_reports_session_id", "reports", ["session_id"]),
+    ("ix_materials_author_id", "materials", ["author_id"]),
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(
+                name, table, columns, unique=False,
+                postgresql_concurrently=True, if_not_exists=True,
+            )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)